@@ -0,0 +1,194 @@
+# Memoisation and streaming for AI helper calls
+# Responses are cached under a hash of the function, its arguments and the
+# family's data version, so repeated questions are free until the family's
+# data changes. The version is persisted and bumped in the transaction that
+# changes the data, so every worker stops serving old answers at once. A streaming mode sends tokens as the model produces them; the
+# model backend is pluggable so tests can use a local fake.
+
+import functools
+import hashlib
+import json
+import os
+import time
+import logging
+
+from flask import has_request_context
+from flask_login import current_user
+from sqlalchemy import event
+
+from app import db
+from models import User, Post, RemembranceMember
+from cache_helper import get_cache, family_version, bump_cache_versions
+
+logger = logging.getLogger(__name__)
+
+AI_CACHE_TTL = int(os.environ.get('AI_CACHE_TTL', '86400'))
+AI_MODEL = os.environ.get('AI_MODEL', 'gpt-5')
+STREAM_CHUNK_CHARS = 24
+
+
+def _current_family_id():
+    if has_request_context() and current_user.is_authenticated:
+        return current_user.family_id
+    return None
+
+
+def cache_key(name, family_id, *parts):
+    """Stable key for a call: function name, family data version and inputs"""
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    digest = hashlib.sha256(f'{name}\0{payload}'.encode()).hexdigest()
+    return f'ai:{family_id}:v{family_version(family_id)}:{digest}'
+
+
+def memoize_ai(func=None, ttl=AI_CACHE_TTL):
+    """
+    Cache an AI helper's results per family data version
+
+    The family is taken from the logged-in user; outside a request the
+    arguments alone form the key.
+    """
+    if func is None:
+        return functools.partial(memoize_ai, ttl=ttl)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        family_id = _current_family_id()
+        key = cache_key(func.__qualname__, family_id, args, kwargs)
+        cache = get_cache()
+        result = cache.get(key)
+        if result is None:
+            result = func(*args, **kwargs)
+            if result is not None:
+                cache.set(key, result, ttl=ttl)
+        return result
+
+    return wrapper
+
+
+class OpenAIBackend:
+    """Chat completions through the OpenAI SDK (optional dependency)"""
+
+    def __init__(self, model=AI_MODEL):
+        from openai import OpenAI
+        self.client = OpenAI(api_key=os.environ.get('OPENAI_API_KEY'))
+        self.model = model
+
+    def complete(self, messages):
+        response = self.client.chat.completions.create(model=self.model, messages=messages)
+        return response.choices[0].message.content or ''
+
+    def stream(self, messages):
+        for chunk in self.client.chat.completions.create(model=self.model, messages=messages, stream=True):
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                yield delta
+
+
+class FakeModelBackend:
+    """Deterministic offline model for tests and benchmarks"""
+
+    def __init__(self, reply=None, token_delay=0.0, first_token_delay=0.0):
+        self.reply = reply
+        self.token_delay = token_delay
+        self.first_token_delay = first_token_delay
+        self.calls = 0
+
+    def _answer(self, messages):
+        if self.reply is not None:
+            return self.reply
+        return f"Here is a thoughtful answer to: {messages[-1]['content']}"
+
+    def complete(self, messages):
+        self.calls += 1
+        time.sleep(self.first_token_delay + self.token_delay * len(self._answer(messages).split()))
+        return self._answer(messages)
+
+    def stream(self, messages):
+        self.calls += 1
+        time.sleep(self.first_token_delay)
+        for word in self._answer(messages).split(' '):
+            time.sleep(self.token_delay)
+            yield word + ' '
+
+
+_backend = None
+
+
+def get_model_backend():
+    global _backend
+    if _backend is None:
+        _backend = OpenAIBackend()
+    return _backend
+
+
+def set_model_backend(backend):
+    """Swap the model backend (e.g. FakeModelBackend in tests)"""
+    global _backend
+    _backend = backend
+
+
+def stream_answer(family_id, messages, ttl=AI_CACHE_TTL):
+    """
+    Yield the answer to a chat prompt piece by piece
+
+    Cached answers are replayed immediately; otherwise tokens are forwarded
+    as the model produces them and the full text is cached at the end.
+    """
+    key = cache_key('stream_answer', family_id, messages)
+    cache = get_cache()
+    cached = cache.get(key)
+    if cached is not None:
+        for i in range(0, len(cached), STREAM_CHUNK_CHARS):
+            yield cached[i:i + STREAM_CHUNK_CHARS]
+        return
+
+    parts = []
+    for delta in get_model_backend().stream(messages):
+        parts.append(delta)
+        yield delta
+    cache.set(key, ''.join(parts), ttl=ttl)
+
+
+# Family-owned rows without their own family_id column: the column that links
+# each to a parent row, and the parent model that has the family_id
+FAMILY_CHILD_MODELS = {
+    'Memory': ('remembrance_member_id', RemembranceMember),
+    'Message': ('sender_id', User),
+    'PostLike': ('post_id', Post),
+    'PostComment': ('post_id', Post),
+}
+
+
+# Any change to family data moves that family to a new data version, which
+# retires its cached AI answers. Families are collected before the flush and
+# bumped on the flush's connection, so the new version commits with the data.
+@event.listens_for(db.session, 'before_flush')
+def _collect_changed_families(session, flush_context, instances):
+    families = session.info.setdefault('changed_families', set())
+    parent_ids = {}
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        family_id = getattr(obj, 'family_id', None)
+        link = FAMILY_CHILD_MODELS.get(type(obj).__name__)
+        if family_id is None and link:
+            column, parent = link
+            parent_ids.setdefault(parent, set()).add(getattr(obj, column, None))
+        elif family_id:
+            families.add(family_id)
+    with session.no_autoflush:
+        for parent, ids in parent_ids.items():
+            ids.discard(None)
+            if ids:
+                families.update(row[0] for row in session.query(parent.family_id).filter(parent.id.in_(ids)))
+    families.discard(None)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _bump_changed_families(session, flush_context):
+    families = session.info.pop('changed_families', None)
+    if families:
+        bump_cache_versions([f'family:{family_id}' for family_id in families], session.connection())
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_changed_families(session):
+    session.info.pop('changed_families', None)
@@ -0,0 +1,87 @@
+# Benchmark bulk invite delivery against the local stub mail server
+# Measures the shipped path: the recipients are queued in one transaction, as
+# the bulk invite route does, and the outbox worker pool drains them.
+# Usage: DATABASE_URL=sqlite:///invite_bench.db python benchmarks/bench_bulk_invite.py --recipients 500 --latency 0.05
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite:///invite_bench.db')
+os.environ.setdefault('SESSION_SECRET', 'benchmark')
+os.environ.setdefault('REPL_IDENTITY', 'benchmark')
+
+from stub_mail_server import StubMailServer
+
+
+def queue_invites(recipients, message):
+    from app import db
+    from email_helper import personalize_email
+    from email_outbox import enqueue_email
+
+    for email in recipients:
+        personalized = personalize_email(message, email)
+        enqueue_email(email, personalized['subject'], personalized['html'], personalized['text'], commit=False)
+    db.session.commit()
+
+
+def wait_for_drain(poll=0.05):
+    """Block until nothing is being sent or due; returns the undelivered count"""
+    from datetime import datetime
+    from app import db
+    from email_outbox import OutboxEmail, STATUS_PENDING, STATUS_SENDING, STATUS_SENT
+
+    while True:
+        busy = OutboxEmail.query.filter(
+            (OutboxEmail.status == STATUS_SENDING) |
+            ((OutboxEmail.status == STATUS_PENDING) & (OutboxEmail.next_attempt_at <= datetime.now()))
+        ).count()
+        db.session.remove()
+        if not busy:
+            break
+        time.sleep(poll)
+    return OutboxEmail.query.filter(OutboxEmail.status != STATUS_SENT).count()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure bulk invite throughput through the outbox')
+    parser.add_argument('--recipients', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0.05, help='simulated mail API latency in seconds')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    with StubMailServer(latency=args.latency) as stub:
+        # Configure the mail helper before it is imported
+        os.environ['MAIL_API_URL'] = stub.url
+        from app import app, db
+        import email_helper
+        from email_outbox import OutboxEmail, start_outbox_workers, stop_outbox_workers
+        email_helper.MAIL_API_URL = stub.url
+
+        message = email_helper.render_family_invite_email('Benchmark', 'ABCD1234', 'Bench', 'http://localhost')
+        recipients = [f'relative{i}@example.com' for i in range(args.recipients)]
+
+        print(f'{args.recipients} recipients, {args.latency * 1000:.0f} ms simulated latency')
+        print(f'{"workers":>8} {"queue s":>8} {"drain s":>8} {"msgs/sec":>10} {"failed":>7}')
+        with app.app_context():
+            db.create_all()
+            for workers in args.workers:
+                OutboxEmail.query.delete()
+                db.session.commit()
+
+                started = time.perf_counter()
+                queue_invites(recipients, message)
+                queued = time.perf_counter()
+                start_outbox_workers(workers)
+                failed = wait_for_drain()
+                drained = time.perf_counter()
+                stop_outbox_workers()
+
+                print(f'{workers:>8} {queued - started:>8.2f} {drained - queued:>8.2f} '
+                      f'{len(recipients) / (drained - queued):>10.1f} {failed:>7}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+# Benchmark the batch earnings job on a synthetic wallet population
+# Usage: DATABASE_URL=sqlite:///earnings_bench.db python benchmarks/bench_earnings.py --wallets 200000
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite:///earnings_bench.db')
+os.environ.setdefault('SESSION_SECRET', 'benchmark')
+
+from app import app, db
+from models import UserWallet, DataConsent
+import earnings_batch
+from earnings_batch import compute_earnings, EarningsFormula, ACTIVITY_SOURCES, EARNINGS_REASON, WRITE_BATCH_SIZE, activity_time
+from token_ledger import bulk_award
+from synthetic import _row, _insert
+
+
+def benchmark_formula():
+    """Unit rates for every Boolean consent column and windowable activity source; timing only"""
+    flags = [c.name for c in DataConsent.__table__.columns
+             if isinstance(c.type, db.Boolean) and not c.primary_key]
+    return EarningsFormula({flag: 1.0 for flag in flags}, {name: 1.0 for name in ACTIVITY_SOURCES if activity_time(name) is not None})
+
+
+def synthetic_population(wallets, formula):
+    rng = random.Random(42)
+    consent = [[rng.random() < 0.4 for _ in formula.flags] for _ in range(wallets)]
+    activity = [[rng.randint(0, 50) if rng.random() < 0.6 else 0 for _ in formula.sources] for _ in range(wallets)]
+    return consent, activity
+
+
+def timed(label, func):
+    started = time.perf_counter()
+    result = func()
+    print(f'{label:<28} {time.perf_counter() - started:8.3f}s')
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the earnings job at scale')
+    parser.add_argument('--wallets', type=int, default=100_000)
+    parser.add_argument('--skip-write', action='store_true', help='only measure the computation')
+    args = parser.parse_args()
+
+    formula = benchmark_formula()
+    consent, activity = synthetic_population(args.wallets, formula)
+    np = earnings_batch._numpy()
+
+    # Plain lists take the pure-Python path
+    python_result = timed('compute (pure Python)', lambda: compute_earnings(consent, activity, formula))
+    if np is not None:
+        consent_array = np.asarray(consent, dtype=bool)
+        activity_array = np.asarray(activity, dtype=np.float64)
+        numpy_result = timed('compute (NumPy)', lambda: compute_earnings(consent_array, activity_array, formula))
+        assert np.allclose(numpy_result, python_result), 'vectorised and Python results differ'
+    else:
+        print('NumPy is not installed; skipping the vectorised run')
+
+    if args.skip_write:
+        return
+
+    with app.app_context():
+        db.create_all()
+        if not UserWallet.query.filter(UserWallet.user_id.like('bench-%')).first():
+            _insert(UserWallet, [_row(UserWallet, user_id=f'bench-{i}') for i in range(args.wallets)])
+        awards = [
+            {'user_id': f'bench-{i}', 'amount': amount, 'idempotency_key': f'earnings:bench:{i}'}
+            for i, amount in enumerate(python_result) if amount > 0
+        ]
+
+        def write():
+            for i in range(0, len(awards), WRITE_BATCH_SIZE):
+                bulk_award(awards[i:i + WRITE_BATCH_SIZE], reason=EARNINGS_REASON)
+
+        timed(f'credit {len(awards)} wallets', write)
+        timed('rerun (all keys skipped)', write)
+
+
+if __name__ == '__main__':
+    main()
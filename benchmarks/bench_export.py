@@ -0,0 +1,67 @@
+# Benchmark memory use of the streaming family export
+# Seeds one family per size, writes placeholder photo files, then consumes
+# the export generator and reports tracemalloc peak memory and throughput.
+# Peak memory should stay flat as the family grows.
+# Usage: DATABASE_URL=sqlite:///export_bench.db python benchmarks/bench_export.py --sizes 1 4 16
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite:///export_bench.db')
+os.environ.setdefault('SESSION_SECRET', 'benchmark')
+
+from app import app, db
+from models import Photo
+from export_helper import export_chunks, _local_path
+from image_pipeline import UPLOAD_ROOT, UPLOAD_URL_PREFIX
+from synthetic import seed
+
+
+def write_photo_files(family_id, photo_bytes):
+    """Create a file under the upload root for every seeded photo URL"""
+    for (url,) in db.session.query(Photo.photo_url).filter(Photo.family_id == family_id):
+        if url and url.startswith(UPLOAD_URL_PREFIX + '/') and _local_path(url) is None:
+            path = os.path.join(UPLOAD_ROOT, url[len(UPLOAD_URL_PREFIX) + 1:])
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(os.urandom(photo_bytes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure export memory at increasing family sizes')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 4, 16], help='multipliers of the base family')
+    parser.add_argument('--events', type=int, default=5000)
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--photos', type=int, default=200)
+    parser.add_argument('--photo-kb', type=int, default=512)
+    args = parser.parse_args()
+
+    print(f'{"size":>5} {"rows":>9} {"MB out":>9} {"seconds":>8} {"peak MB":>8}')
+    with app.app_context():
+        db.create_all()
+        for size in args.sizes:
+            family = seed(families=1, members=8, events=args.events * size, chores=args.events * size // 4,
+                          photos=args.photos * size, messages=args.messages * size, remembrance=10,
+                          tributes=100 * size, seed_value=size)[0]
+            write_photo_files(family['family_id'], args.photo_kb * 1024)
+            db.session.expunge_all()
+
+            tracemalloc.start()
+            started = time.perf_counter()
+            total = 0
+            for chunk in export_chunks(family['family_id'], family['user_ids'][0]):
+                total += len(chunk)
+            elapsed = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            rows = args.events * size + args.messages * size
+            print(f'{size:>5} {rows:>9} {total / 1e6:>9.1f} {elapsed:>8.2f} {peak / 1e6:>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+# Benchmark image derivative generation throughput
+# Usage: python benchmarks/bench_image_pipeline.py --images 64 --size 4032x3024
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_pipeline import generate_derivatives
+
+
+def make_images(directory, count, width, height):
+    from PIL import Image
+    paths = []
+    for i in range(count):
+        # Gradient noise so the encoder does real work
+        image = Image.effect_noise((width, height), 64).convert('RGB')
+        path = os.path.join(directory, f'{i:04d}.jpg')
+        image.save(path, 'JPEG', quality=92)
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure images processed per second per core')
+    parser.add_argument('--images', type=int, default=64)
+    parser.add_argument('--size', default='4032x3024', help='source image size, WIDTHxHEIGHT')
+    parser.add_argument('--workers', type=int, nargs='+', default=None)
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.size.split('x'))
+    cores = os.cpu_count() or 1
+    worker_counts = args.workers or sorted({1, max(1, cores // 2), cores})
+
+    workdir = tempfile.mkdtemp(prefix='image-bench-')
+    try:
+        print(f'Generating {args.images} source images of {width}x{height}...')
+        sources = make_images(workdir, args.images, width, height)
+        print(f'{"workers":>8} {"seconds":>9} {"img/sec":>9} {"img/sec/core":>13}')
+        for workers in worker_counts:
+            for name in os.listdir(workdir):
+                if '_' in name:
+                    os.remove(os.path.join(workdir, name))
+            started = time.perf_counter()
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(generate_derivatives, sources))
+            elapsed = time.perf_counter() - started
+            rate = len(sources) / elapsed
+            print(f'{workers:>8} {elapsed:>9.2f} {rate:>9.1f} {rate / workers:>13.2f}')
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+# Benchmark every route against a seeded synthetic database
+# Drives the app through the Flask test client as a logged-in family member,
+# with mail and AI stubbed out, and reports latency percentiles and SQL query
+# counts per route. Results can be saved as a baseline and later runs compared
+# against it; the exit status is 1 when a route regresses.
+# Every run rebuilds the benchmark database from the same seed, and the write
+# routes are measured after all reads, so rows they add never leak into the
+# read measurements or into the next run.
+#
+# Usage:
+#   DATABASE_URL=sqlite:///routes_bench.db python benchmarks/bench_routes.py --families 20
+#   python benchmarks/bench_routes.py --save-baseline benchmarks/baseline.json
+#   python benchmarks/bench_routes.py --baseline benchmarks/baseline.json
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite:///routes_bench.db')
+os.environ.setdefault('SESSION_SECRET', 'benchmark')
+os.environ.setdefault('METRICS_TOKEN', 'benchmark')
+
+from flask_login import FlaskLoginClient
+from sqlalchemy import text
+
+from app import app, db
+import routes
+import email_helper
+from ai_cache import memoize_ai, set_model_backend, FakeModelBackend
+from cache_helper import get_cache
+from models import User
+from schema_helper import ensure_schema
+from synthetic import seed
+
+# Routes that never finish or wait for events (streams, long-polls) and ones
+# that only make sense in the browser flow
+SKIP_ENDPOINTS = {'static', 'family_event_stream', 'family_event_poll'}
+SKIP_PREFIXES = ('/auth',)
+
+# Query strings for routes that do nothing useful without one
+ENDPOINT_QUERY = {'search_api': {'q': 'grandma picnic'}}
+
+SERVER_TIMING_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+def stub_external_services():
+    """Replace mail delivery and model calls with local fakes"""
+    def send_email(recipient_email, subject, html_content, text_content):
+        return {}
+
+    def send_family_invite_email(*args, **kwargs):
+        return True
+
+    email_helper.send_email = send_email
+    email_helper.send_family_invite_email = send_family_invite_email
+    routes.send_family_invite_email = send_family_invite_email
+
+    backend = FakeModelBackend()
+    set_model_backend(backend)
+    routes.get_family_ai_response = memoize_ai(lambda *args, **kwargs: backend.complete(
+        [{'role': 'user', 'content': str(args[:1])}]))
+    routes.generate_family_tree_insights = memoize_ai(lambda *args, **kwargs: 'Synthetic family tree insights')
+    routes.suggest_family_activities = memoize_ai(lambda *args, **kwargs: 'Synthetic activity suggestions')
+
+
+def reset_database():
+    """Drop and recreate every table; refuses to touch a database with real users"""
+    if db.inspect(db.engine).has_table(User.__tablename__) and \
+            User.query.filter(~User.id.like('bench-%')).first() is not None:
+        sys.exit('DATABASE_URL has non-benchmark users; point it at a scratch database')
+    db.session.remove()
+    db.drop_all()
+    with db.engine.begin() as conn:
+        # Raw-SQL search tables are not part of the metadata
+        for table in ('search_fts', 'search_fts_docs', 'search_documents'):
+            conn.execute(text(f'DROP TABLE IF EXISTS {table}'))
+    ensure_schema()
+
+
+def route_targets(family, user_id):
+    """Concrete (label, method, url, data) for every route that can be filled from the seed"""
+    values = {
+        'user_id': user_id,
+        'member_id': family['remembrance_ids'][0] if family['remembrance_ids'] else None,
+        'chore_id': family['chore_ids'][0] if family['chore_ids'] else None,
+        'direction': 'descendants',
+    }
+    with app.app_context():
+        from family_graph import PersonNode
+        node = PersonNode.query.filter_by(family_id=family['family_id']).first()
+        values['node_id'] = node.id if node else None
+
+    targets = []
+    for rule in sorted(app.url_map.iter_rules(), key=lambda r: r.rule):
+        if rule.endpoint in SKIP_ENDPOINTS or rule.rule.startswith(SKIP_PREFIXES) or 'GET' not in rule.methods:
+            continue
+        args = {}
+        for name in rule.arguments:
+            if values.get(name) is None:
+                break
+            args[name] = values[name]
+        else:
+            with app.test_request_context():
+                from flask import url_for
+                url = url_for(rule.endpoint, **args, **ENDPOINT_QUERY.get(rule.endpoint, {}))
+                targets.append((rule.rule, 'GET', url, None))
+
+    # Representative writes
+    targets.append(('POST /event/create', 'POST', '/event/create', {
+        'title': 'Benchmark event', 'event_date': '2030-01-01T12:00', 'event_type': 'other'}))
+    if values['member_id']:
+        targets.append(('POST /remembrance/<member_id>/tribute', 'POST',
+                        f"/remembrance/{values['member_id']}/tribute", {'tribute_content': 'A benchmark tribute'}))
+    if values['chore_id']:
+        targets.append(('POST /chore/<chore_id>/update', 'POST',
+                        f"/chore/{values['chore_id']}/update", {'status': 'completed'}))
+    return targets
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+def measure(client, method, url, data, iterations, warmup, cold):
+    latencies = []
+    queries = []
+    status = None
+    for i in range(warmup + iterations):
+        if cold:
+            get_cache().clear()
+        started = time.perf_counter()
+        response = client.open(url, method=method, data=data)
+        elapsed = time.perf_counter() - started
+        status = response.status_code
+        response.close()
+        if i < warmup:
+            continue
+        latencies.append(elapsed * 1000)
+        match = SERVER_TIMING_QUERIES.search(response.headers.get('Server-Timing', ''))
+        queries.append(int(match.group(1)) if match else 0)
+    return {
+        'status': status,
+        'p50_ms': round(percentile(latencies, 0.50), 2),
+        'p95_ms': round(percentile(latencies, 0.95), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+        'queries': max(queries),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Routes whose p95 grew beyond the tolerance or that issue more queries"""
+    regressions = []
+    for label, result in results.items():
+        before = baseline.get(label)
+        if not before:
+            continue
+        if result['p95_ms'] > before['p95_ms'] * (1 + tolerance) and result['p95_ms'] - before['p95_ms'] > 1:
+            regressions.append(f"{label}: p95 {before['p95_ms']} -> {result['p95_ms']} ms")
+        if result['queries'] > before['queries']:
+            regressions.append(f"{label}: queries {before['queries']} -> {result['queries']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark all routes on freshly seeded synthetic data')
+    parser.add_argument('--families', type=int, default=5)
+    parser.add_argument('--members', type=int, default=6)
+    parser.add_argument('--events', type=int, default=200)
+    parser.add_argument('--chores', type=int, default=100)
+    parser.add_argument('--photos', type=int, default=300)
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--remembrance', type=int, default=5)
+    parser.add_argument('--tributes', type=int, default=40)
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--cold', action='store_true', help='clear the application cache before every request')
+    parser.add_argument('--only', help='regular expression selecting route labels')
+    parser.add_argument('--baseline', help='compare against this baseline JSON')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed p95 growth over the baseline')
+    parser.add_argument('--save-baseline', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    stub_external_services()
+    app.test_client_class = FlaskLoginClient
+
+    with app.app_context():
+        started = time.perf_counter()
+        reset_database()
+        families = seed(args.families, args.members, args.events, args.chores, args.photos,
+                        args.messages, args.remembrance, args.tributes)
+        print(f'Seeded {len(families)} families in {time.perf_counter() - started:.1f}s')
+        family = families[0]
+        user = db.session.get(User, family['user_ids'][0])
+        db.session.expunge(user)
+
+    results = {}
+    print(f'{"route":<58} {"status":>6} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"queries":>8}')
+    with app.test_client(user=user) as client:
+        client.environ_base['HTTP_AUTHORIZATION'] = f"Bearer {os.environ['METRICS_TOKEN']}"
+        for label, method, url, data in route_targets(family, user.id):
+            if args.only and not re.search(args.only, label):
+                continue
+            result = measure(client, method, url, data, args.iterations, args.warmup, args.cold)
+            results[label] = result
+            print(f"{label:<58} {result['status']:>6} {result['p50_ms']:>8} {result['p95_ms']:>8} "
+                  f"{result['p99_ms']:>8} {result['queries']:>8}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f'Baseline written to {args.save_baseline}')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f'REGRESSION {line}')
+        if regressions:
+            sys.exit(1)
+        print('No regressions against the baseline')
+
+
+if __name__ == '__main__':
+    main()
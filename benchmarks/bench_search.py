@@ -0,0 +1,77 @@
+# Benchmark full-text search latency on a large synthetic index
+# Usage: DATABASE_URL=sqlite:///search_bench.db python benchmarks/bench_search.py --documents 1000000
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite:///search_bench.db')
+os.environ.setdefault('SESSION_SECRET', 'benchmark')
+
+from app import app, db
+from search_helper import ensure_search_schema, index_documents, search
+
+WORDS = (
+    'grandmother grandfather farm bakery church wedding harvest river ohio texas navy '
+    'teacher nurse carpenter garden recipe holiday christmas reunion fishing quilt '
+    'piano letters immigrant village mountain railroad factory school army story'
+).split()
+
+
+def synthetic_documents(count, families):
+    rng = random.Random(42)
+    for i in range(count):
+        body = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(30, 200)))
+        yield ('memory', i, rng.randint(1, families), ' '.join(rng.sample(WORDS, 3)), body, '')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure search latency at scale')
+    parser.add_argument('--documents', type=int, default=1_000_000)
+    parser.add_argument('--families', type=int, default=2000)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--skip-load', action='store_true', help='reuse an index built by a previous run')
+    args = parser.parse_args()
+
+    with app.app_context():
+        ensure_search_schema()
+        if not args.skip_load:
+            started = time.perf_counter()
+            batch = []
+            for document in synthetic_documents(args.documents, args.families):
+                batch.append(document)
+                if len(batch) == 5000:
+                    index_documents(batch)
+                    db.session.commit()
+                    batch = []
+            index_documents(batch)
+            db.session.commit()
+            print(f'Indexed {args.documents} documents in {time.perf_counter() - started:.1f}s')
+
+        rng = random.Random(7)
+        latencies = []
+        for _ in range(args.queries):
+            query = ' '.join(rng.sample(WORDS, rng.randint(1, 3)))
+            family_id = rng.randint(1, args.families)
+            cursor = None
+            # Up to three pages, following the cursor as scrolling clients do
+            for _ in range(rng.randint(1, 3)):
+                started = time.perf_counter()
+                cursor = search(family_id, 'bench-user', query, cursor=cursor)['next_cursor']
+                latencies.append((time.perf_counter() - started) * 1000)
+                if not cursor:
+                    break
+
+        latencies.sort()
+        print(f'{len(latencies)} page requests over {args.documents} documents')
+        print(f'p50 {statistics.median(latencies):.2f} ms  '
+              f'p95 {latencies[int(len(latencies) * 0.95)]:.2f} ms  '
+              f'p99 {latencies[int(len(latencies) * 0.99)]:.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
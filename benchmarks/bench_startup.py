@@ -0,0 +1,101 @@
+# Benchmark worker boot: import cost and time to first request
+# Each run starts a fresh interpreter, so nothing is cached between samples.
+# The -X importtime report is summarised by cumulative cost per top-level
+# module; --eager sets LAZY_IMPORTS=0 for comparison with the lazy default.
+# Usage: python benchmarks/bench_startup.py --runs 5 --top 25
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$')
+
+# Runs in the child interpreter; prints import and first-request seconds
+FIRST_REQUEST_SCRIPT = """
+import time
+started = time.perf_counter()
+import routes
+from app import app
+imported = time.perf_counter()
+with app.test_client() as client:
+    status = client.get('/').status_code
+served = time.perf_counter()
+print(f'{imported - started} {served - started} {status}')
+"""
+
+
+def child_env(eager):
+    env = dict(os.environ)
+    env.setdefault('DATABASE_URL', 'sqlite:///startup_bench.db')
+    env.setdefault('SESSION_SECRET', 'benchmark')
+    env['LAZY_IMPORTS'] = '0' if eager else '1'
+    # Measure the request itself, not the background warm-up
+    env['LAZY_WARMUP'] = '0'
+    return env
+
+
+def importtime_report(eager, top):
+    """Cumulative import cost per top-level module under `import routes`"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import routes'],
+        cwd=ROOT, env=child_env(eager), capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        sys.exit(f'import routes failed:\n{result.stderr[-2000:]}')
+
+    modules = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match and len(match.group(3)) == 1:
+            modules.append((int(match.group(2)), int(match.group(1)), match.group(4)))
+    modules.sort(reverse=True)
+    total = sum(cumulative for cumulative, _, _ in modules)
+
+    print(f'-X importtime: {total / 1000:.0f} ms across {len(modules)} top-level imports')
+    print(f'{"cumulative ms":>14} {"self ms":>8}  module')
+    for cumulative, self_us, name in modules[:top]:
+        print(f'{cumulative / 1000:>14.1f} {self_us / 1000:>8.1f}  {name}')
+    return total
+
+
+def first_request_samples(eager, runs):
+    imports, firsts = [], []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, '-c', FIRST_REQUEST_SCRIPT],
+            cwd=ROOT, env=child_env(eager), capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            sys.exit(f'first request failed:\n{result.stderr[-2000:]}')
+        imported, served, _ = result.stdout.split()[-3:]
+        imports.append(float(imported))
+        firsts.append(float(served))
+    return imports, firsts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure import time and time to first request')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=25, help='modules to list in the import report')
+    parser.add_argument('--eager', action='store_true', help='also measure with LAZY_IMPORTS=0')
+    args = parser.parse_args()
+
+    modes = [('lazy', False)] + ([('eager', True)] if args.eager else [])
+    for label, eager in modes:
+        print(f'== {label} imports ==')
+        importtime_report(eager, args.top)
+        imports, firsts = first_request_samples(eager, args.runs)
+        print(f'import routes:     median {statistics.median(imports) * 1000:.0f} ms, '
+              f'min {min(imports) * 1000:.0f} ms')
+        print(f'time to first request: median {statistics.median(firsts) * 1000:.0f} ms, '
+              f'min {min(firsts) * 1000:.0f} ms')
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+# Synthetic family data for benchmarks
+# Seeds families with members, events, chores, photos, messages, remembrance
+# members and tributes through the ORM session, so the flush hooks that keep
+# the change feed, unread counters, post stats and export versions current
+# run just as they do for the routes. Values are only supplied for columns
+# the models actually have; other required columns get a placeholder of the
+# right type, so seeding keeps working as the models evolve.
+
+import random
+import uuid
+from datetime import datetime, date, timedelta
+
+from app import db
+from models import User, Family, FamilyProfile, Event, Chore, Photo, Message, RemembranceMember, Memory, Post
+from image_pipeline import UPLOAD_URL_PREFIX
+from family_graph import rebuild_family_graph
+from search_helper import reindex_all
+
+INSERT_BATCH_SIZE = 2000
+
+WORDS = (
+    'grandma grandpa picnic birthday soccer piano recital dentist groceries lake cabin '
+    'reunion recipe garden church school homework vacation wedding anniversary story'
+).split()
+ALBUMS = ('General', 'Holidays', 'Birthdays', 'Vacation', 'School', 'Reunion')
+
+
+def _placeholder(column):
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return None
+    if python_type is bool:
+        return False
+    if python_type in (int, float):
+        return 0
+    if python_type is datetime:
+        return datetime.now()
+    if python_type is date:
+        return date.today()
+    if python_type is str:
+        return 'benchmark'
+    return None
+
+
+def _row(model, **values):
+    """Keep values the model has columns for and fill other required columns"""
+    columns = {column.key: column for column in model.__table__.columns}
+    row = {key: value for key, value in values.items() if key in columns}
+    for key, column in columns.items():
+        if key in row or column.nullable or column.primary_key or column.default is not None or column.server_default is not None:
+            continue
+        row[key] = _placeholder(column)
+    return row
+
+
+def _insert(model, rows):
+    """Add rows as ORM objects, flushing in batches so session and mapper events fire"""
+    for i in range(0, len(rows), INSERT_BATCH_SIZE):
+        db.session.add_all([model(**row) for row in rows[i:i + INSERT_BATCH_SIZE]])
+        db.session.flush()
+    db.session.commit()
+
+
+def _words(rng, low, high):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+
+def seed(families=5, members=6, events=200, chores=100, photos=300, messages=500,
+         remembrance=5, tributes=40, posts=100, seed_value=42):
+    """
+    Seed synthetic families; counts other than families and members are per family
+
+    Rows go through the ORM session, so flush-time hooks run as in production;
+    the search index and relationship graph are built by the routes rather
+    than by hooks, so they are rebuilt for each family afterwards.
+
+    Returns:
+        list: One dict per family with 'family_id', 'user_ids', 'remembrance_ids'
+            and 'chore_ids'
+    """
+    rng = random.Random(seed_value)
+    now = datetime.now()
+    seeded = []
+
+    for f in range(families):
+        family_row = _row(Family, surname=f'Bench{f}', invite_code=uuid.uuid4().hex[:8].upper(),
+                          description='Synthetic benchmark family')
+        family = Family(**family_row)
+        db.session.add(family)
+        db.session.flush()
+
+        user_ids = [f'bench-{family.id}-{m}' for m in range(members)]
+        _insert(User, [
+            _row(User, id=user_id, email=f'{user_id}@example.com', first_name=f'Member{m}',
+                 last_name=f'Bench{f}', family_id=family.id, is_family_admin=(m == 0))
+            for m, user_id in enumerate(user_ids)
+        ])
+        family.created_by = user_ids[0]
+        _insert(FamilyProfile, [
+            _row(FamilyProfile, user_id=user_id, role=rng.choice(('Parent', 'Child', 'Grandparent')),
+                 bio=_words(rng, 10, 30), interests=_words(rng, 3, 8))
+            for user_id in user_ids
+        ])
+
+        _insert(Event, [
+            _row(Event, family_id=family.id, creator_id=rng.choice(user_ids), title=_words(rng, 2, 4).title(),
+                 description=_words(rng, 5, 20), event_type=rng.choice(('birthday', 'appointment', 'holiday', 'other')),
+                 event_date=now + timedelta(days=rng.randint(-180, 180), hours=rng.randint(8, 20)),
+                 location=rng.choice(WORDS).title(), is_recurring=False)
+            for _ in range(events)
+        ])
+        _insert(Chore, [
+            _row(Chore, family_id=family.id, title=_words(rng, 2, 4).title(), description=_words(rng, 5, 15),
+                 assigned_to=rng.choice(user_ids), due_date=now + timedelta(days=rng.randint(-30, 60)),
+                 priority=rng.choice(('low', 'medium', 'high')),
+                 status=rng.choice(('pending', 'in_progress', 'completed')))
+            for _ in range(chores)
+        ])
+        _insert(Photo, [
+            _row(Photo, family_id=family.id, album_name=rng.choice(ALBUMS), title=_words(rng, 1, 3).title(),
+                 caption=_words(rng, 3, 10), photo_url=f'{UPLOAD_URL_PREFIX}/bench/{family.id}-{p}.jpg',
+                 created_at=now - timedelta(minutes=rng.randint(0, 500000)))
+            for p in range(photos)
+        ])
+        _insert(Message, [
+            _row(Message, sender_id=sender, receiver_id=rng.choice([u for u in user_ids if u != sender]),
+                 content=_words(rng, 3, 25), is_read=rng.random() < 0.7,
+                 created_at=now - timedelta(minutes=rng.randint(0, 100000)))
+            for sender in (rng.choice(user_ids) for _ in range(messages))
+        ] if members > 1 else [])
+        _insert(Post, [
+            _row(Post, family_id=family.id, author_id=rng.choice(user_ids),
+                 content=_words(rng, 5, 40), created_at=now - timedelta(minutes=rng.randint(0, 100000)))
+            for _ in range(posts)
+        ])
+
+        _insert(RemembranceMember, [
+            _row(RemembranceMember, family_id=family.id, name=f'Ancestor {f}-{r}',
+                 birth_date=date(1900 + rng.randint(0, 60), rng.randint(1, 12), rng.randint(1, 28)),
+                 passing_date=date(1980 + rng.randint(0, 40), rng.randint(1, 12), rng.randint(1, 28)),
+                 life_story=_words(rng, 40, 120), legacy=_words(rng, 10, 30), created_by=user_ids[0])
+            for r in range(remembrance)
+        ])
+        remembrance_ids = [row[0] for row in db.session.query(RemembranceMember.id).filter_by(family_id=family.id)]
+        _insert(Memory, [
+            _row(Memory, remembrance_member_id=member_id, author_id=rng.choice(user_ids),
+                 title=_words(rng, 2, 5).title() if rng.random() < 0.5 else None, content=_words(rng, 10, 60),
+                 created_at=now - timedelta(minutes=rng.randint(0, 100000)))
+            for member_id in remembrance_ids for _ in range(tributes)
+        ])
+
+        chore_ids = [row[0] for row in db.session.query(Chore.id).filter_by(family_id=family.id)]
+        seeded.append({
+            'family_id': family.id,
+            'user_ids': user_ids,
+            'remembrance_ids': remembrance_ids,
+            'chore_ids': chore_ids,
+        })
+
+    db.session.commit()
+    for family in seeded:
+        rebuild_family_graph(family['family_id'])
+        reindex_all(family['family_id'])
+    return seeded
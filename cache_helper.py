@@ -0,0 +1,187 @@
+# Pluggable cache for per-family snapshots and hot lookups
+# The default backend is an in-process TTL/LRU cache; set CACHE_URL=redis://...
+# to share entries between workers. Invalidation never relies on the backend
+# being shared: cache keys embed versions persisted in the database, so a
+# bump made by one worker retires the entry in every worker at once.
+
+import os
+import pickle
+import threading
+import time
+import logging
+from collections import OrderedDict
+
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app import db
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = int(os.environ.get('CACHE_DEFAULT_TTL', '300'))
+DEFAULT_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', '10000'))
+
+
+class MemoryCache:
+    """Thread-safe in-process cache with per-entry TTL and LRU eviction"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, default_ttl=DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires_at = item
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def incr(self, key):
+        """Atomically increment an integer counter that never expires"""
+        with self._lock:
+            value, _ = self._data.get(key, (0, None))
+            value += 1
+            self._data[key] = (value, None)
+            self._data.move_to_end(key)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class RedisCache:
+    """Redis-backed cache shared between worker processes"""
+
+    def __init__(self, url, default_ttl=DEFAULT_TTL, prefix='fp:'):
+        import redis  # optional dependency, only needed for this backend
+        self.client = redis.Redis.from_url(url)
+        self.default_ttl = default_ttl
+        self.prefix = prefix
+
+    def get(self, key, default=None):
+        raw = self.client.get(self.prefix + key)
+        return default if raw is None else pickle.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        self.client.set(self.prefix + key, pickle.dumps(value), ex=ttl or None)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def incr(self, key):
+        return int(self.client.incr(self.prefix + key))
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Return the configured cache backend, creating it on first use"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                cache_url = os.environ.get('CACHE_URL')
+                if cache_url and cache_url.startswith('redis'):
+                    try:
+                        _cache = RedisCache(cache_url)
+                    except Exception as e:
+                        logger.warning(f"Falling back to in-process cache: {e}")
+                        _cache = MemoryCache()
+                else:
+                    _cache = MemoryCache()
+    return _cache
+
+
+def set_cache(backend):
+    """Swap the cache backend (used by tests and benchmarks)"""
+    global _cache
+    with _cache_lock:
+        _cache = backend
+
+
+class CacheVersion(db.Model):
+    """Persisted version of a cache scope (e.g. 'family:12'), shared by every worker"""
+    __tablename__ = 'cache_versions'
+
+    scope = db.Column(db.String(100), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+def cache_versions(*scopes):
+    """Current version of each scope in one query; scopes never bumped are at 0"""
+    rows = dict(db.session.query(CacheVersion.scope, CacheVersion.version).filter(CacheVersion.scope.in_(scopes)))
+    return {scope: rows.get(scope, 0) for scope in scopes}
+
+
+def bump_cache_versions(scopes, connection=None):
+    """
+    Move scopes to new versions, retiring every cache entry keyed on them
+
+    Args:
+        scopes: Scope names to bump
+        connection: Connection of the transaction that changed the data (e.g.
+            from a flush hook), so the bump commits with it; without one the
+            bump commits on its own and should be made after the data commit
+    """
+    scopes = sorted(set(scopes))
+    if not scopes:
+        return
+
+    def bump(conn):
+        table = CacheVersion.__table__
+        insert = pg_insert if conn.dialect.name == 'postgresql' else sqlite_insert
+        statement = insert(table).on_conflict_do_update(
+            index_elements=[table.c.scope], set_={'version': table.c.version + 1})
+        conn.execute(statement, [{'scope': scope, 'version': 1} for scope in scopes])
+
+    if connection is not None:
+        bump(connection)
+    else:
+        with db.engine.begin() as conn:
+            bump(conn)
+
+
+def family_version(family_id):
+    """Current data version for a family; part of every family-scoped cache key"""
+    return cache_versions(f'family:{family_id}')[f'family:{family_id}']
+
+
+def bump_family_version(family_id, connection=None):
+    """Invalidate every family-scoped cache entry by moving to a new version"""
+    if family_id is None:
+        return
+    bump_cache_versions([f'family:{family_id}'], connection)
+
+
+def family_key(family_id, *parts):
+    """Build a cache key that is implicitly invalidated by bump_family_version"""
+    suffix = ':'.join(str(p) for p in parts)
+    return f'family:{family_id}:v{family_version(family_id)}:{suffix}'
@@ -0,0 +1,172 @@
+# Date-windowed calendar queries
+# Events and chores are read per [start, end) window using the
+# (family_id, event_date) and (family_id, due_date) indexes and merged into a
+# single sorted stream that can be paged with an opaque keyset cursor.
+
+import heapq
+from datetime import datetime, date, timedelta
+
+from sqlalchemy import and_, or_
+
+from models import Event, Chore
+from schema_helper import register_index, encode_cursor, decode_cursor
+from recurrence_helper import expand_occurrences, recurring_event_ids
+
+register_index('ix_event_family_event_date', Event.family_id, Event.event_date, Event.id)
+register_index('ix_chore_family_due_date', Chore.family_id, Chore.due_date, Chore.id)
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+MAX_WINDOW_DAYS = 366
+
+
+def month_window(month=None):
+    """
+    Return the [start, end) datetimes for a month
+
+    Args:
+        month: 'YYYY-MM' string; defaults to the current month
+    """
+    if month:
+        start = datetime.strptime(month, '%Y-%m')
+    else:
+        today = date.today()
+        start = datetime(today.year, today.month, 1)
+    end = (start + timedelta(days=32)).replace(day=1)
+    return start, end
+
+
+def parse_window(start_str, end_str):
+    """Parse ISO start/end query parameters, defaulting to the current month"""
+    default_start, default_end = month_window()
+    start = datetime.fromisoformat(start_str) if start_str else default_start
+    end = datetime.fromisoformat(end_str) if end_str else (
+        default_end if not start_str else (start + timedelta(days=32)).replace(day=1)
+    )
+    if end <= start:
+        raise ValueError('end must be after start')
+    if end - start > timedelta(days=MAX_WINDOW_DAYS):
+        raise ValueError(f'window may not exceed {MAX_WINDOW_DAYS} days')
+    return start, end
+
+
+def events_in_window(family_id, start, end):
+    """Query for a family's one-off events in [start, end), ordered by date"""
+    query = Event.query.filter(
+        Event.family_id == family_id,
+        Event.event_date >= start,
+        Event.event_date < end
+    )
+    # Recurring events are expanded separately by expand_occurrences()
+    recurring_ids = recurring_event_ids(family_id)
+    if recurring_ids:
+        query = query.filter(Event.id.notin_(recurring_ids))
+    return query.order_by(Event.event_date, Event.id)
+
+
+def calendar_events(family_id, start, end):
+    """One-off events plus recurring occurrences in [start, end), sorted by date"""
+    events = events_in_window(family_id, start, end).all()
+    occurrences = expand_occurrences(family_id, start, end)
+    if not occurrences:
+        return events
+    return list(heapq.merge(events, occurrences, key=lambda e: (e.event_date, e.id)))
+
+
+def chores_in_window(family_id, start, end):
+    """Query for a family's dated chores in [start, end), ordered by due date"""
+    return Chore.query.filter(
+        Chore.family_id == family_id,
+        Chore.due_date >= start,
+        Chore.due_date < end
+    ).order_by(Chore.due_date, Chore.id)
+
+
+def undated_chores(family_id):
+    """Query for a family's chores without a due date, which belong to no window"""
+    return Chore.query.filter(
+        Chore.family_id == family_id,
+        Chore.due_date.is_(None)
+    ).order_by(Chore.id)
+
+
+def _after_cursor(query, date_column, id_column, kind, cursor):
+    """Restrict a single-kind query to rows sorting after (date, kind, id)"""
+    if cursor is None:
+        return query
+    when, cursor_kind, cursor_id = cursor
+    if kind > cursor_kind:
+        return query.filter(date_column >= when)
+    if kind < cursor_kind:
+        return query.filter(date_column > when)
+    return query.filter(or_(
+        date_column > when,
+        and_(date_column == when, id_column > cursor_id)
+    ))
+
+
+def event_to_dict(event):
+    return {
+        'kind': 'event',
+        'id': event.id,
+        'date': event.event_date.isoformat(),
+        'title': event.title,
+        'description': event.description,
+        'event_type': event.event_type,
+        'location': event.location,
+        'is_recurring': event.is_recurring,
+        'recurrence_rule': getattr(event, 'recurrence_rule', None),
+    }
+
+
+def chore_to_dict(chore):
+    return {
+        'kind': 'chore',
+        'id': chore.id,
+        'date': chore.due_date.isoformat() if chore.due_date else None,
+        'title': chore.title,
+        'description': chore.description,
+        'assigned_to': chore.assigned_to,
+        'priority': chore.priority,
+        'status': chore.status,
+    }
+
+
+def get_calendar_page(family_id, start, end, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Return one page of merged calendar items for a window
+
+    Args:
+        family_id: Family whose calendar is read
+        start, end: Window bounds as datetimes, end exclusive
+        cursor: Opaque cursor from a previous page, or None
+        limit: Maximum number of items to return
+
+    Returns:
+        dict: {'items': [...], 'next_cursor': str or None}
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    position = decode_cursor(cursor, datetime, str, int) if cursor else None
+
+    events = _after_cursor(events_in_window(family_id, start, end),
+                           Event.event_date, Event.id, 'event', position)
+    chores = _after_cursor(chores_in_window(family_id, start, end),
+                           Chore.due_date, Chore.id, 'chore', position)
+
+    occurrences = expand_occurrences(family_id, start, end)
+    if position is not None:
+        occurrences = [o for o in occurrences if (o.event_date, 'event', o.id) > position]
+
+    # Each source is already sorted, so merging limit + 1 rows of each is enough
+    merged = heapq.merge(
+        (event_to_dict(e) for e in events.limit(limit + 1)),
+        (event_to_dict(o) for o in occurrences[:limit + 1]),
+        (chore_to_dict(c) for c in chores.limit(limit + 1)),
+        key=lambda item: (item['date'], item['kind'], item['id'])
+    )
+    items = []
+    for item in merged:
+        if len(items) == limit:
+            return {'items': items, 'next_cursor': encode_cursor(items[-1]['date'], items[-1]['kind'], items[-1]['id'])}
+        items.append(item)
+    return {'items': items, 'next_cursor': None}
@@ -0,0 +1,343 @@
+# Per-family change feed for delta sync
+# Every flush that touches synced rows moves the family to a new version and
+# records one change-log row per changed object (the latest operation wins),
+# so a client holding version N downloads only what changed after N. Deleted
+# rows leave tombstones, which are compacted after a retention period; a
+# client whose cursor predates compaction is told to reset. First syncs and
+# resets page through a snapshot pinned at the version it started from, then
+# continue with deltas from that version.
+
+import os
+import logging
+from datetime import datetime, timedelta
+
+import click
+from sqlalchemy import event, inspect, or_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app import app, db
+from models import User, Event, Chore, Message
+from schema_helper import register_index, to_json_dict, encode_cursor, decode_cursor
+
+logger = logging.getLogger(__name__)
+
+SYNC_BATCH_SIZE = 500
+SYNC_MAX_BATCH_SIZE = 2000
+TOMBSTONE_RETENTION_DAYS = int(os.environ.get('SYNC_TOMBSTONE_RETENTION_DAYS', '30'))
+
+OP_UPSERT = 'u'
+OP_DELETE = 'd'
+
+# Synced tables by name in the feed; messages are additionally limited to
+# their sender and receiver
+SYNCED_MODELS = {
+    'events': Event,
+    'chores': Chore,
+    'members': User,
+    'messages': Message,
+}
+MEMBER_FIELDS = ('id', 'first_name', 'last_name', 'profile_image_url', 'family_id', 'is_family_admin')
+
+
+class FamilyVersion(db.Model):
+    """Latest change version of a family and the version its tombstones are compacted through"""
+    __tablename__ = 'family_versions'
+
+    family_id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+    compacted_through = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+class ChangeLog(db.Model):
+    """Most recent change to one synced row"""
+    __tablename__ = 'change_log'
+
+    id = db.Column(db.Integer, primary_key=True)
+    family_id = db.Column(db.Integer, nullable=False)
+    table_name = db.Column(db.String(30), nullable=False)
+    row_id = db.Column(db.String(64), nullable=False)
+    version = db.Column(db.BigInteger, nullable=False)
+    op = db.Column(db.String(1), nullable=False)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+    __table_args__ = (db.UniqueConstraint('family_id', 'table_name', 'row_id', name='uq_change_log_row'),)
+
+
+register_index('ix_change_log_family_version', ChangeLog.family_id, ChangeLog.version)
+
+
+_TABLE_NAMES = {model: name for name, model in SYNCED_MODELS.items()}
+
+
+def _insert(connection, table):
+    return (pg_insert if connection.dialect.name == 'postgresql' else sqlite_insert)(table)
+
+
+def _next_version(connection, family_id):
+    """
+    Atomically bump a family's version
+
+    The row lock taken here is held until commit, so concurrent writers to a
+    family commit their versions in increasing order.
+    """
+    table = FamilyVersion.__table__
+    statement = _insert(connection, table).values(family_id=family_id, version=1, compacted_through=0)
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.family_id],
+        set_={'version': table.c.version + 1}
+    ).returning(table.c.version)
+    return connection.execute(statement).scalar()
+
+
+def record_changes(connection, family_id, table_name, row_ids, op):
+    """Write change-log rows for one family under a fresh version"""
+    if not family_id or not row_ids:
+        return None
+    version = _next_version(connection, family_id)
+    table = ChangeLog.__table__
+    statement = _insert(connection, table)
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.family_id, table.c.table_name, table.c.row_id],
+        set_={'version': statement.excluded.version, 'op': statement.excluded.op,
+              'changed_at': statement.excluded.changed_at}
+    )
+    now = datetime.now()
+    connection.execute(statement, [
+        {'family_id': family_id, 'table_name': table_name, 'row_id': str(row_id),
+         'version': version, 'op': op, 'changed_at': now}
+        for row_id in row_ids
+    ])
+    return version
+
+
+def _message_families(session, messages):
+    """
+    Family of each message, taken from its sender's row (or the receiver's)
+
+    Messages have no family_id column; resolving it from the users rather
+    than the request means CLI, worker and script writes are logged too.
+    """
+    user_ids = {m.sender_id for m in messages} | {m.receiver_id for m in messages}
+    user_ids.discard(None)
+    if not user_ids:
+        return {}
+    with session.no_autoflush:
+        families = dict(session.query(User.id, User.family_id).filter(User.id.in_(user_ids)))
+    return {m: families.get(m.sender_id) or families.get(m.receiver_id) for m in messages}
+
+
+def _families_of(obj, message_families):
+    """(family before the flush, family after it) for a synced row"""
+    if isinstance(obj, Message):
+        family_id = message_families.get(obj)
+        return family_id, family_id
+    history = inspect(obj).attrs.family_id.history
+    before = history.deleted[0] if history.deleted else obj.family_id
+    return before, obj.family_id
+
+
+# Collected before the flush, while old family ids are still visible; written
+# after it, once new rows have primary keys.
+@event.listens_for(db.session, 'before_flush')
+def _collect_sync_changes(session, flush_context, instances):
+    pending = session.info.setdefault('sync_changes', [])
+    for obj in session.new:
+        if type(obj) in _TABLE_NAMES:
+            pending.append((obj, OP_UPSERT, None))
+    dirty = [obj for obj in session.dirty
+             if type(obj) in _TABLE_NAMES and session.is_modified(obj, include_collections=False)]
+    deleted = [obj for obj in session.deleted if type(obj) in _TABLE_NAMES]
+    message_families = _message_families(session, [obj for obj in dirty + deleted if isinstance(obj, Message)])
+    for obj in dirty:
+        before, after = _families_of(obj, message_families)
+        if before != after:
+            pending.append((obj, OP_DELETE, before))
+        pending.append((obj, OP_UPSERT, None))
+    for obj in deleted:
+        pending.append((obj, OP_DELETE, _families_of(obj, message_families)[0]))
+
+
+@event.listens_for(db.session, 'after_flush')
+def _write_sync_changes(session, flush_context):
+    pending = session.info.pop('sync_changes', None)
+    if not pending:
+        return
+    message_families = _message_families(
+        session, [obj for obj, op, _ in pending if op == OP_UPSERT and isinstance(obj, Message)])
+    grouped = {}
+    for obj, op, family_id in pending:
+        family_id = family_id if op == OP_DELETE else _families_of(obj, message_families)[1]
+        if family_id:
+            grouped.setdefault((family_id, _TABLE_NAMES[type(obj)], op), set()).add(obj.id)
+    connection = session.connection()
+    for (family_id, table_name, op), row_ids in grouped.items():
+        record_changes(connection, family_id, table_name, sorted(row_ids, key=str), op)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_sync_changes(session):
+    session.info.pop('sync_changes', None)
+
+
+def _visible_query(table_name, family_id, user_id):
+    model = SYNCED_MODELS[table_name]
+    if model is Message:
+        return Message.query.filter(or_(Message.sender_id == user_id, Message.receiver_id == user_id))
+    return model.query.filter(model.family_id == family_id)
+
+
+def _serialize(table_name, obj):
+    if table_name == 'members':
+        return {field: getattr(obj, field, None) for field in MEMBER_FIELDS}
+    return to_json_dict(obj)
+
+
+def _pk_value(table_name, value):
+    return SYNCED_MODELS[table_name].__table__.c.id.type.python_type(value)
+
+
+def _snapshot_page(family_id, user_id, limit, position=None):
+    """
+    Up to `limit` visible rows in table, then id, order
+
+    Args:
+        position: (table name, last id sent or None) to continue from
+
+    Returns:
+        tuple: (changes, next position or None when the snapshot is complete)
+    """
+    names = list(SYNCED_MODELS)
+    start = names.index(position[0]) if position else 0
+    changes = {}
+    remaining = limit
+    for table_name in names[start:]:
+        model = SYNCED_MODELS[table_name]
+        query = _visible_query(table_name, family_id, user_id)
+        if position and table_name == position[0] and position[1] is not None:
+            query = query.filter(model.id > position[1])
+        rows = query.order_by(model.id).limit(remaining + 1).all()
+        full = len(rows) > remaining
+        rows = rows[:remaining]
+        if rows:
+            changes[table_name] = {'upserts': [_serialize(table_name, row) for row in rows], 'deletes': []}
+        if full:
+            return changes, (table_name, rows[-1].id if rows else None)
+        remaining -= len(rows)
+    return changes, None
+
+
+def _decode_snapshot_cursor(cursor):
+    version, table_name, last_id = decode_cursor(cursor, int, str, str)
+    if table_name not in SYNCED_MODELS:
+        raise ValueError('invalid cursor')
+    return version, (table_name, _pk_value(table_name, last_id) if last_id else None)
+
+
+def changes_since(family_id, user_id, since=0, limit=SYNC_BATCH_SIZE, cursor=None):
+    """
+    Rows changed in a family after version `since`
+
+    Batches never split a version, so the returned version is always a
+    safe cursor for the next call. A first sync or reset returns the
+    snapshot in pages: while the response carries a 'cursor', pass it back to
+    get the next page; the last page returns the version the snapshot was
+    taken at, from which deltas continue.
+
+    Raises:
+        ValueError: The snapshot cursor is malformed
+
+    Returns:
+        dict: {'version', 'has_more', 'reset', 'cursor' (snapshot pages only),
+            'changes': {table: {'upserts': [...], 'deletes': [ids]}}}
+    """
+    limit = max(1, min(limit, SYNC_MAX_BATCH_SIZE))
+    state = FamilyVersion.query.get(family_id)
+    current = state.version if state else 0
+
+    if cursor:
+        pinned, position = _decode_snapshot_cursor(cursor)
+        return _snapshot_response(family_id, user_id, limit, since, pinned, current, position, reset=since > 0)
+    if since <= 0 or (state and since < state.compacted_through) or since > current:
+        return _snapshot_response(family_id, user_id, limit, since, current, current, reset=since > 0)
+
+    entries = ChangeLog.query.filter(
+        ChangeLog.family_id == family_id, ChangeLog.version > since
+    ).order_by(ChangeLog.version, ChangeLog.id).limit(limit + 1).all()
+
+    has_more = len(entries) > limit
+    if has_more:
+        last_version = entries[limit - 1].version
+        if entries[0].version == last_version:
+            # One version larger than a batch: send all of it
+            entries = ChangeLog.query.filter_by(family_id=family_id, version=last_version).all()
+            has_more = last_version < current
+        else:
+            entries = [e for e in entries[:limit] if e.version < last_version]
+
+    version = entries[-1].version if entries else current
+    wanted = {}
+    changes = {name: {'upserts': [], 'deletes': []} for name in SYNCED_MODELS}
+    for entry in entries:
+        if entry.op == OP_DELETE:
+            changes[entry.table_name]['deletes'].append(entry.row_id)
+        else:
+            wanted.setdefault(entry.table_name, set()).add(entry.row_id)
+
+    for table_name, row_ids in wanted.items():
+        model = SYNCED_MODELS[table_name]
+        pk = model.__table__.c.id
+        keys = [pk.type.python_type(r) for r in row_ids]
+        rows = _visible_query(table_name, family_id, user_id).filter(model.id.in_(keys)).all()
+        changes[table_name]['upserts'] = [_serialize(table_name, row) for row in rows]
+        # Rows that are gone or no longer visible are deletions for this client
+        found = {str(row.id) for row in rows}
+        changes[table_name]['deletes'].extend(sorted(row_ids - found))
+
+    return {
+        'version': version,
+        'has_more': has_more,
+        'reset': False,
+        'changes': {name: c for name, c in changes.items() if c['upserts'] or c['deletes']},
+    }
+
+
+def _snapshot_response(family_id, user_id, limit, since, pinned, current, position=None, reset=False):
+    changes, position = _snapshot_page(family_id, user_id, limit, position)
+    if position is not None:
+        # Until the snapshot is complete the client's own version stays its
+        # safe resume point; the next page is reached through the cursor
+        return {'version': since, 'has_more': True, 'reset': reset,
+                'cursor': encode_cursor(pinned, position[0], '' if position[1] is None else str(position[1])),
+                'changes': changes}
+    # Anything written while the snapshot was paged is picked up as a delta
+    return {'version': pinned, 'has_more': pinned < current, 'reset': reset, 'changes': changes}
+
+
+def compact_tombstones(retention_days=TOMBSTONE_RETENTION_DAYS):
+    """
+    Drop tombstones older than the retention period
+
+    Returns:
+        int: Number of tombstones removed
+    """
+    cutoff = datetime.now() - timedelta(days=retention_days)
+    expired = db.session.query(ChangeLog.family_id, db.func.max(ChangeLog.version)).filter(
+        ChangeLog.op == OP_DELETE, ChangeLog.changed_at < cutoff
+    ).group_by(ChangeLog.family_id).all()
+    for family_id, through in expired:
+        FamilyVersion.query.filter(
+            FamilyVersion.family_id == family_id, FamilyVersion.compacted_through < through
+        ).update({'compacted_through': through}, synchronize_session=False)
+    removed = ChangeLog.query.filter(
+        ChangeLog.op == OP_DELETE, ChangeLog.changed_at < cutoff
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return removed
+
+
+@app.cli.command('compact-sync-log')
+@click.option('--days', type=int, default=TOMBSTONE_RETENTION_DAYS, help='Tombstone retention in days')
+def compact_sync_log_command(days):
+    """Remove old delete tombstones from the sync change log"""
+    logger.info(f"Removed {compact_tombstones(days)} sync tombstones")
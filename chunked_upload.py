@@ -0,0 +1,264 @@
+# Resumable chunked uploads
+# Clients open an upload session, PUT fixed-size chunks (in any order, with a
+# per-chunk SHA-256), query which chunks arrived to resume after a dropped
+# connection, then finalize. Each chunk is streamed into a spooled temporary
+# file and only copied to its offset in the partial file once its length and
+# checksum match, so memory use stays bounded and a bad chunk never
+# overwrites good data.
+
+import hashlib
+import os
+import shutil
+import tempfile
+import uuid
+import logging
+from datetime import datetime, timedelta
+
+from app import app, db
+from image_pipeline import UPLOAD_ROOT, store_file, image_extension
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', str(5 * 1024 * 1024)))
+UPLOAD_MAX_CHUNK_SIZE = 32 * 1024 * 1024
+UPLOAD_MAX_SIZE = int(os.environ.get('UPLOAD_MAX_SIZE', str(2 * 1024 * 1024 * 1024)))
+UPLOAD_EXPIRY_HOURS = int(os.environ.get('UPLOAD_EXPIRY_HOURS', '48'))
+STREAM_BLOCK_SIZE = 64 * 1024
+# Chunks up to this size are verified in memory, larger ones in a temp file
+CHUNK_SPOOL_SIZE = 1024 * 1024
+
+PARTIAL_DIR = os.path.join(UPLOAD_ROOT, '.partial')
+
+
+class UploadError(Exception):
+    """Raised for invalid upload requests; carries an HTTP status"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class UploadSession(db.Model):
+    """An in-progress or finished chunked upload"""
+    __tablename__ = 'upload_sessions'
+
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = db.Column(db.String, nullable=False, index=True)
+    family_id = db.Column(db.Integer, index=True)
+    filename = db.Column(db.String(255), nullable=False)
+    total_size = db.Column(db.BigInteger, nullable=False)
+    chunk_size = db.Column(db.Integer, nullable=False)
+    sha256 = db.Column(db.String(64))
+    status = db.Column(db.String(20), nullable=False, default='open')
+    url = db.Column(db.String(512))
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    finalized_at = db.Column(db.DateTime)
+
+    @property
+    def total_chunks(self):
+        return max(1, -(-self.total_size // self.chunk_size))
+
+    @property
+    def partial_path(self):
+        return os.path.join(PARTIAL_DIR, f'{self.id}.part')
+
+    def expected_length(self, index):
+        if index == self.total_chunks - 1:
+            return self.total_size - index * self.chunk_size
+        return self.chunk_size
+
+
+class UploadChunk(db.Model):
+    """A chunk that has been received and verified"""
+    __tablename__ = 'upload_chunks'
+
+    upload_id = db.Column(db.String(36), db.ForeignKey('upload_sessions.id', ondelete='CASCADE'), primary_key=True)
+    index = db.Column(db.Integer, primary_key=True)
+    sha256 = db.Column(db.String(64), nullable=False)
+
+
+def _as_int(value, name):
+    """Integer from a JSON field; strings of digits are accepted, anything else is a 400"""
+    if isinstance(value, bool):
+        raise UploadError(f'{name} must be an integer')
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value)
+    raise UploadError(f'{name} must be an integer')
+
+
+def create_upload(user, filename, total_size, chunk_size=None, sha256=None):
+    """Open a new upload session and pre-size its partial file"""
+    if not filename:
+        raise UploadError('filename is required')
+    try:
+        image_extension(filename)
+    except ValueError as e:
+        raise UploadError(str(e), 415)
+    if total_size is None:
+        raise UploadError('size is required')
+    total_size = _as_int(total_size, 'size')
+    if total_size <= 0:
+        raise UploadError('size must be positive')
+    if total_size > UPLOAD_MAX_SIZE:
+        raise UploadError(f'file exceeds {UPLOAD_MAX_SIZE} bytes', 413)
+    chunk_size = _as_int(chunk_size, 'chunk_size') if chunk_size is not None else UPLOAD_CHUNK_SIZE
+    if sha256 is not None and not isinstance(sha256, str):
+        raise UploadError('sha256 must be a string')
+    if not 0 < chunk_size <= UPLOAD_MAX_CHUNK_SIZE:
+        raise UploadError(f'chunk_size must be between 1 and {UPLOAD_MAX_CHUNK_SIZE}')
+
+    upload = UploadSession(
+        user_id=user.id,
+        family_id=user.family_id,
+        filename=os.path.basename(filename)[:255],
+        total_size=total_size,
+        chunk_size=chunk_size,
+        sha256=sha256.lower() if sha256 else None
+    )
+    db.session.add(upload)
+    db.session.flush()
+
+    os.makedirs(PARTIAL_DIR, exist_ok=True)
+    with open(upload.partial_path, 'wb') as f:
+        f.truncate(total_size)
+    db.session.commit()
+    return upload
+
+
+def get_upload(upload_id, user):
+    upload = UploadSession.query.get(upload_id)
+    if upload is None or upload.user_id != user.id:
+        raise UploadError('upload not found', 404)
+    return upload
+
+
+def received_chunks(upload):
+    return [row.index for row in db.session.query(UploadChunk.index).filter_by(upload_id=upload.id).order_by(UploadChunk.index)]
+
+
+def upload_status(upload):
+    received = received_chunks(upload) if upload.status == 'open' else []
+    received_set = set(received)
+    return {
+        'upload_id': upload.id,
+        'status': upload.status,
+        'filename': upload.filename,
+        'size': upload.total_size,
+        'chunk_size': upload.chunk_size,
+        'total_chunks': upload.total_chunks,
+        'received': received,
+        'missing': [] if upload.status != 'open' else [i for i in range(upload.total_chunks) if i not in received_set],
+        'url': upload.url,
+    }
+
+
+def write_chunk(upload, index, stream, expected_sha256):
+    """
+    Receive one chunk from the request body and write it to its offset
+
+    The chunk is spooled and verified first; only a chunk whose length and
+    checksum match is written to the partial file and recorded as received,
+    so a corrupted or interrupted chunk is simply sent again.
+    """
+    if upload.status != 'open':
+        raise UploadError('upload is already finalized', 409)
+    if not 0 <= index < upload.total_chunks:
+        raise UploadError('chunk index out of range')
+    if not expected_sha256:
+        raise UploadError('X-Chunk-SHA256 header is required')
+
+    expected_length = upload.expected_length(index)
+    digest = hashlib.sha256()
+    written = 0
+    with tempfile.SpooledTemporaryFile(max_size=CHUNK_SPOOL_SIZE, dir=PARTIAL_DIR) as spool:
+        while written <= expected_length:
+            block = stream.read(min(STREAM_BLOCK_SIZE, expected_length + 1 - written))
+            if not block:
+                break
+            written += len(block)
+            if written > expected_length:
+                raise UploadError(f'chunk {index} is larger than {expected_length} bytes')
+            digest.update(block)
+            spool.write(block)
+
+        if written != expected_length:
+            raise UploadError(f'chunk {index} is {written} bytes, expected {expected_length}')
+        if digest.hexdigest() != expected_sha256.lower():
+            raise UploadError(f'checksum mismatch for chunk {index}', 422)
+
+        spool.seek(0)
+        with open(upload.partial_path, 'r+b') as f:
+            f.seek(index * upload.chunk_size)
+            shutil.copyfileobj(spool, f, STREAM_BLOCK_SIZE)
+
+    existing = UploadChunk.query.get((upload.id, index))
+    if existing:
+        existing.sha256 = digest.hexdigest()
+    else:
+        db.session.add(UploadChunk(upload_id=upload.id, index=index, sha256=digest.hexdigest()))
+    db.session.commit()
+
+
+def finalize_upload(upload):
+    """
+    Verify that every chunk arrived and move the file into storage
+
+    Returns:
+        str: URL of the stored file
+    """
+    if upload.status == 'complete':
+        return upload.url
+
+    missing = upload_status(upload)['missing']
+    if missing:
+        raise UploadError(f'{len(missing)} chunk(s) missing', 409)
+
+    digest = hashlib.sha256()
+    with open(upload.partial_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    if upload.sha256 and digest.hexdigest() != upload.sha256:
+        raise UploadError('file checksum mismatch', 422)
+
+    try:
+        url, _, _ = store_file(upload.partial_path, digest.hexdigest(), image_extension(upload.filename), upload.total_size)
+    except ValueError as e:
+        raise UploadError(str(e), 415)
+    if os.path.exists(upload.partial_path):
+        os.remove(upload.partial_path)
+
+    upload.status = 'complete'
+    upload.url = url
+    upload.finalized_at = datetime.now()
+    UploadChunk.query.filter_by(upload_id=upload.id).delete(synchronize_session=False)
+    db.session.commit()
+    return url
+
+
+def completed_upload_url(upload_id, user):
+    """URL of a finished upload owned by the user, or None"""
+    upload = UploadSession.query.get(upload_id)
+    if upload and upload.user_id == user.id and upload.status == 'complete':
+        return upload.url
+    return None
+
+
+def purge_stale_uploads(hours=UPLOAD_EXPIRY_HOURS):
+    """Delete unfinished uploads older than the expiry window"""
+    cutoff = datetime.now() - timedelta(hours=hours)
+    stale = UploadSession.query.filter(UploadSession.status == 'open', UploadSession.created_at < cutoff).all()
+    for upload in stale:
+        if os.path.exists(upload.partial_path):
+            os.remove(upload.partial_path)
+        UploadChunk.query.filter_by(upload_id=upload.id).delete(synchronize_session=False)
+        db.session.delete(upload)
+    db.session.commit()
+    return len(stale)
+
+
+@app.cli.command('purge-uploads')
+def purge_uploads_command():
+    """Remove abandoned partial uploads"""
+    logger.info(f"Purged {purge_stale_uploads()} stale uploads")
@@ -0,0 +1,150 @@
+# Cached home dashboard snapshots
+# Each section of the home page is built once and stored in the shared cache;
+# write routes invalidate only the sections they touch by bumping the
+# section's persisted version, which is part of its cache key, so the
+# invalidation reaches every worker even with the in-process cache.
+
+import os
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from sqlalchemy.orm import selectinload
+
+from app import db
+from models import FamilyProfile, Event, Chore, Memory, RemembranceMember
+from cache_helper import get_cache, cache_versions, bump_cache_versions
+from schema_helper import column_values
+from unread_counters import get_unread_count
+
+DASHBOARD_TTL = int(os.environ.get('DASHBOARD_CACHE_TTL', '300'))
+
+FAMILY_SECTIONS = ('events', 'memories')
+USER_SECTIONS = ('profile', 'chores')
+
+
+def _parent_relations(model):
+    """Names of a model's many-to-one relationships (e.g. Memory.author)"""
+    return [rel.key for rel in model.__mapper__.relationships if rel.direction.name == 'MANYTOONE']
+
+
+def _with_parents(query, model):
+    """Preload every many-to-one relationship so snapshots cost one query each"""
+    return query.options(*(selectinload(getattr(model, name)) for name in _parent_relations(model)))
+
+
+def snapshot(obj, **extra):
+    """
+    Copy an ORM row into a detached, cache-safe object
+
+    Column values are copied along with column snapshots of the row's
+    many-to-one relationships, so templates can keep using e.g. memory.author.
+    """
+    if obj is None:
+        return None
+    values = column_values(obj)
+    for name in _parent_relations(type(obj)):
+        if name not in extra:
+            parent = getattr(obj, name)
+            values[name] = SimpleNamespace(**column_values(parent)) if parent is not None else None
+    values.update(extra)
+    return SimpleNamespace(**values)
+
+
+def blank_snapshot(model, **values):
+    """Snapshot of a row that does not exist yet: every column None except values"""
+    row = {column.key: None for column in model.__mapper__.column_attrs}
+    row.update(values)
+    return SimpleNamespace(**row)
+
+
+def _family_scope(family_id, section):
+    return f'dashboard:family:{family_id}:{section}'
+
+
+def _user_scope(user_id, section):
+    return f'dashboard:user:{user_id}:{section}'
+
+
+def _build_profile(user):
+    # Read-only: the profile row is created by the profile routes when first edited
+    profile = FamilyProfile.query.filter_by(user_id=user.id).first()
+    return snapshot(profile) if profile else blank_snapshot(FamilyProfile, user_id=user.id)
+
+
+def _build_events(family_id):
+    now = datetime.now()
+    events = _with_parents(Event.query, Event).filter(
+        Event.family_id == family_id,
+        Event.event_date >= now,
+        Event.event_date <= now + timedelta(days=30)
+    ).order_by(Event.event_date).limit(5).all()
+    return [snapshot(event) for event in events]
+
+
+def _build_chores(user):
+    chores = _with_parents(Chore.query, Chore).filter_by(
+        family_id=user.family_id,
+        assigned_to=user.id,
+        status='pending'
+    ).order_by(Chore.due_date).limit(5).all()
+    return [snapshot(chore) for chore in chores]
+
+
+def _build_memories(family_id):
+    rows = _with_parents(db.session.query(Memory, RemembranceMember), Memory).join(
+        RemembranceMember, Memory.remembrance_member_id == RemembranceMember.id
+    ).filter(
+        RemembranceMember.family_id == family_id
+    ).order_by(Memory.created_at.desc()).limit(3).all()
+    return [snapshot(memory, remembrance_member=snapshot(member)) for memory, member in rows]
+
+
+def get_dashboard(user):
+    """
+    Return the home page context for a user, building missing sections
+
+    Args:
+        user: The logged in User (must belong to a family)
+
+    Returns:
+        dict: Keyword arguments for rendering home.html
+    """
+    cache = get_cache()
+    builders = {
+        _user_scope(user.id, 'profile'): lambda: _build_profile(user),
+        _family_scope(user.family_id, 'events'): lambda: _build_events(user.family_id),
+        _user_scope(user.id, 'chores'): lambda: _build_chores(user),
+        _family_scope(user.family_id, 'memories'): lambda: _build_memories(user.family_id),
+    }
+    versions = cache_versions(*builders)
+
+    values = []
+    for scope, build in builders.items():
+        key = f'{scope}:v{versions[scope]}'
+        value = cache.get(key)
+        if value is None:
+            value = build()
+            cache.set(key, value, ttl=DASHBOARD_TTL)
+        values.append(value)
+
+    profile, upcoming_events, pending_chores, recent_memories = values
+    return {
+        'profile': profile,
+        'upcoming_events': upcoming_events,
+        'pending_chores': pending_chores,
+        # Kept live: the counter is a primary-key lookup
+        'unread_count': get_unread_count(user.id),
+        'recent_memories': recent_memories,
+    }
+
+
+def invalidate_family_dashboard(family_id, *sections):
+    """Retire family-wide dashboard sections ('events', 'memories'); all when none given; call after commit"""
+    bump_cache_versions([_family_scope(family_id, section) for section in sections or FAMILY_SECTIONS])
+
+
+def invalidate_user_dashboard(user_id, *sections):
+    """Retire per-user dashboard sections ('profile', 'chores'); all when none given; call after commit"""
+    if not user_id:
+        return
+    bump_cache_versions([_user_scope(user_id, section) for section in sections or USER_SECTIONS])
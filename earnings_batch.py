@@ -0,0 +1,258 @@
+# Batch data-earnings job
+# Consent flags and activity counts for every wallet are loaded with a handful
+# of grouped queries into NumPy arrays, earnings for the whole population are
+# computed in vectorised form, and the results are credited in batches through
+# the token ledger's bulk award, which updates UserWallet, its transaction
+# history and the ledger in one transaction per batch. NumPy is optional;
+# without it the same formula runs in plain Python.
+# The rates are not defined here: they come from an EarningsFormula (a JSON
+# file for the CLI) so they can be kept identical to simulate_data_earnings.
+# Runs are dry by default. Each committed run records the cutoff it counted
+# activity up to, and the next run counts only activity after it, so work is
+# paid for once however often the job runs.
+
+import json
+import logging
+from datetime import date, datetime
+
+import click
+from sqlalchemy import func
+
+from app import app, db
+from models import UserWallet, DataConsent, Event, Chore, Memory, Message, Post
+from token_ledger import bulk_award
+
+logger = logging.getLogger(__name__)
+
+WRITE_BATCH_SIZE = 5000
+EARNINGS_REASON = 'data_earnings'
+
+# Activity that can be weighted: name -> (user column, timestamp attributes
+# to try in order, extra filter or None). The first timestamp the model has
+# places each item in a run's window; chores have no creation-time meaning,
+# so they are windowed by completion (or, failing that, last update) time.
+ACTIVITY_SOURCES = {
+    'events': (Event.creator_id, ('created_at',), None),
+    'chores_completed': (Chore.assigned_to, ('completed_at', 'updated_at'), lambda: Chore.status == 'completed'),
+    'memories': (Memory.author_id, ('created_at',), None),
+    'messages': (Message.sender_id, ('created_at',), None),
+    'posts': (Post.author_id, ('created_at',), None),
+}
+
+
+def activity_time(name):
+    """Timestamp column that windows an activity source, or None if its model has none"""
+    column, candidates, _ = ACTIVITY_SOURCES[name]
+    model = column.class_
+    for attr in candidates:
+        if attr in model.__table__.c:
+            return getattr(model, attr)
+    return None
+
+
+class EarningsRun(db.Model):
+    """A committed earnings run and the activity window it paid for"""
+    __tablename__ = 'earnings_runs'
+
+    run_id = db.Column(db.String(64), primary_key=True)
+    since = db.Column(db.DateTime)
+    cutoff = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+
+class EarningsFormula:
+    """
+    Linear earnings per wallet
+
+    earnings = sum(consent_rates[flag] for each enabled flag)
+             + sum(activity_weights[source] * count of that activity)
+
+    Args:
+        consent_rates: DataConsent column name -> tokens when the flag is on;
+            only listed columns are read
+        activity_weights: ACTIVITY_SOURCES name -> tokens per item
+    """
+
+    def __init__(self, consent_rates, activity_weights=None):
+        activity_weights = activity_weights or {}
+        unknown_flags = [flag for flag in consent_rates if flag not in DataConsent.__table__.columns]
+        if unknown_flags:
+            raise ValueError(f"Not DataConsent columns: {', '.join(unknown_flags)}")
+        unknown_sources = [name for name in activity_weights if name not in ACTIVITY_SOURCES]
+        if unknown_sources:
+            raise ValueError(f"Unknown activity sources: {', '.join(unknown_sources)}")
+        unwindowed = [name for name in activity_weights if activity_time(name) is None]
+        if unwindowed:
+            raise ValueError(f"Activity sources without a timestamp to window runs by: {', '.join(unwindowed)}")
+        self.flags = list(consent_rates)
+        self.rates = [float(consent_rates[flag]) for flag in self.flags]
+        self.sources = list(activity_weights)
+        self.weights = [float(activity_weights[name]) for name in self.sources]
+
+    @classmethod
+    def from_file(cls, path):
+        """Load {"consent_rates": {...}, "activity_weights": {...}} from JSON"""
+        with open(path) as f:
+            spec = json.load(f)
+        return cls(spec.get('consent_rates', {}), spec.get('activity_weights', {}))
+
+
+def _numpy():
+    """NumPy if installed; imported on first use so it does not slow worker boot"""
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def load_population(formula, since=None, cutoff=None):
+    """
+    Load every wallet's consent flags and activity counts used by the formula
+
+    Activity is counted in the window (since, cutoff]; either bound may be None.
+
+    Returns:
+        tuple: (user_ids, consent rows, activity rows); rows are NumPy arrays
+            when NumPy is available, otherwise lists
+    """
+    np = _numpy()
+    user_ids = [row[0] for row in db.session.query(UserWallet.user_id).order_by(UserWallet.user_id)]
+    position = {user_id: i for i, user_id in enumerate(user_ids)}
+
+    if np is not None:
+        consent = np.zeros((len(user_ids), len(formula.flags)), dtype=bool)
+        activity = np.zeros((len(user_ids), len(formula.sources)), dtype=np.float64)
+    else:
+        consent = [[False] * len(formula.flags) for _ in user_ids]
+        activity = [[0.0] * len(formula.sources) for _ in user_ids]
+
+    if formula.flags:
+        columns = [DataConsent.__table__.c[flag] for flag in formula.flags]
+        rows = db.session.query(DataConsent.user_id, *columns).execution_options(
+            stream_results=True).yield_per(WRITE_BATCH_SIZE)
+        for user_id, *values in rows:
+            i = position.get(user_id)
+            if i is not None:
+                consent[i][:] = [bool(v) for v in values]
+
+    for j, name in enumerate(formula.sources):
+        column, _, condition = ACTIVITY_SOURCES[name]
+        query = db.session.query(column, func.count()).filter(column.isnot(None))
+        if condition is not None:
+            query = query.filter(condition())
+        timestamp = activity_time(name)
+        if since is not None:
+            query = query.filter(timestamp > since)
+        if cutoff is not None:
+            query = query.filter(timestamp <= cutoff)
+        for user_id, count in query.group_by(column):
+            i = position.get(user_id)
+            if i is not None:
+                activity[i][j] = count
+
+    return user_ids, consent, activity
+
+
+def compute_earnings(consent, activity, formula):
+    """Earnings per wallet under the formula, vectorised when given NumPy arrays"""
+    np = _numpy() if not isinstance(consent, list) else None
+    if np is not None and isinstance(consent, np.ndarray):
+        earnings = consent.astype(np.float64) @ np.asarray(formula.rates, dtype=np.float64)
+        earnings += activity @ np.asarray(formula.weights, dtype=np.float64)
+        return np.round(earnings, 4)
+
+    earnings = []
+    for flags_row, activity_row in zip(consent, activity):
+        base = sum(rate for rate, enabled in zip(formula.rates, flags_row) if enabled)
+        score = sum(weight * count for weight, count in zip(formula.weights, activity_row))
+        earnings.append(round(base + score, 4))
+    return earnings
+
+
+def run_window(run_id, record=False):
+    """
+    Activity window (since, cutoff) for a run
+
+    A run that was already recorded keeps its window, so rerunning it only
+    fills in missed wallets. A new run starts at the latest recorded cutoff
+    (the first run counts all earlier activity) and ends now; with record it
+    is stored before anything is credited.
+    """
+    run = EarningsRun.query.get(run_id)
+    if run is not None:
+        return run.since, run.cutoff
+    since = db.session.query(func.max(EarningsRun.cutoff)).scalar()
+    cutoff = datetime.now()
+    if record:
+        db.session.add(EarningsRun(run_id=run_id, since=since, cutoff=cutoff))
+        db.session.commit()
+    return since, cutoff
+
+
+def run_earnings(formula, run_id=None, dry_run=True, progress=None):
+    """
+    Compute earnings for every wallet and, unless dry_run, credit them
+
+    Only activity since the previous committed run's cutoff is counted. Each
+    wallet's award carries the key earnings:<run_id>:<user_id>, so a rerun of
+    the same run reuses its window and only credits wallets that were missed.
+
+    Args:
+        formula: EarningsFormula to apply
+        run_id: Identifies the run (defaults to today's date)
+        dry_run: Only compute and summarise (the default)
+        progress: Optional callable(done, total) invoked after each batch
+
+    Returns:
+        dict: {'wallets', 'credited', 'skipped', 'total_tokens', 'dry_run',
+            'since', 'cutoff'}
+    """
+    run_id = run_id or date.today().isoformat()
+    since, cutoff = run_window(run_id, record=not dry_run)
+    user_ids, consent, activity = load_population(formula, since, cutoff)
+    earnings = compute_earnings(consent, activity, formula)
+
+    summary = {'wallets': len(user_ids), 'credited': 0, 'skipped': 0,
+               'total_tokens': float(sum(earnings)), 'dry_run': dry_run,
+               'since': since, 'cutoff': cutoff}
+    if dry_run:
+        return summary
+
+    awards = (
+        {'user_id': user_id, 'amount': float(amount), 'idempotency_key': f'earnings:{run_id}:{user_id}'}
+        for user_id, amount in zip(user_ids, earnings) if amount > 0
+    )
+    batch = []
+    done = 0
+    for award in awards:
+        batch.append(award)
+        if len(batch) == WRITE_BATCH_SIZE:
+            written, skipped = bulk_award(batch, reason=EARNINGS_REASON)
+            summary['credited'] += written
+            summary['skipped'] += skipped
+            done += len(batch)
+            batch = []
+            if progress:
+                progress(done, len(user_ids))
+    if batch:
+        written, skipped = bulk_award(batch, reason=EARNINGS_REASON)
+        summary['credited'] += written
+        summary['skipped'] += skipped
+    if progress:
+        progress(len(user_ids), len(user_ids))
+    return summary
+
+
+@app.cli.command('simulate-earnings')
+@click.option('--formula', 'formula_path', required=True, type=click.Path(exists=True, dir_okay=False),
+              help='JSON file with consent_rates and activity_weights')
+@click.option('--run-id', default=None, help='Idempotency scope for the run (default: today)')
+@click.option('--commit', is_flag=True, help='Credit wallets; without it the run is a dry run')
+def simulate_earnings_command(formula_path, run_id, commit):
+    """Compute data earnings for all wallets (dry run unless --commit)"""
+    def report(done, total):
+        logger.info(f"Credited {done}/{total} wallets")
+
+    summary = run_earnings(EarningsFormula.from_file(formula_path), run_id, dry_run=not commit, progress=report)
+    logger.info(f"Earnings run finished: {summary}")
@@ -2,11 +2,18 @@
 # References: blueprint:replitmail
 
 import os
+import html
+import threading
 import requests
 import logging
 
 logger = logging.getLogger(__name__)
 
+MAIL_API_URL = os.environ.get('MAIL_API_URL', 'https://connectors.replit.com/api/v2/mailer/send')
+MAIL_TIMEOUT = float(os.environ.get('MAIL_TIMEOUT', '15'))
+
+_local = threading.local()
+
 
 def get_auth_token():
     """Get authentication token for Replit services"""
@@ -21,6 +28,114 @@ def get_auth_token():
         raise Exception("No authentication token found. Please ensure you're running in Replit environment.")
 
 
+def get_http_session():
+    """Keep-alive requests.Session shared by all mail sends on this thread"""
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _local.session = session
+    return session
+
+
+def send_email(recipient_email, subject, html_content, text_content):
+    """
+    Send a single email through the mail API over a pooled connection
+    
+    Raises:
+        requests.HTTPError: If the mail service rejects the message
+    """
+    response = get_http_session().post(
+        MAIL_API_URL,
+        headers={
+            "Content-Type": "application/json",
+            "X_REPLIT_TOKEN": get_auth_token()
+        },
+        json={
+            "to": recipient_email,
+            "subject": subject,
+            "html": html_content,
+            "text": text_content
+        },
+        timeout=MAIL_TIMEOUT
+    )
+    response.raise_for_status()
+    return response.json() if response.content else {}
+
+
+RECIPIENT_PLACEHOLDER = '%%RECIPIENT_EMAIL%%'
+
+
+def render_family_invite_email(family_name, invite_code, inviter_name, app_url, recipient_email=RECIPIENT_PLACEHOLDER):
+    """
+    Render the family invite message
+    
+    Bulk sends render once with the default placeholder and substitute each
+    address with personalize_email().
+    
+    Returns:
+        dict: subject, html and text bodies
+    """
+    recipient = recipient_email if recipient_email == RECIPIENT_PLACEHOLDER else html.escape(recipient_email)
+    family = html.escape(family_name)
+    inviter = html.escape(inviter_name)
+    code = html.escape(invite_code)
+    url = html.escape(app_url)
+    
+    html_content = f"""
+        <html>
+        <head>
+            <style>
+                body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
+                .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
+                .header {{ background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 30px; text-align: center; border-radius: 8px 8px 0 0; }}
+                .content {{ background: #f9f9f9; padding: 30px; border-radius: 0 0 8px 8px; }}
+                .code {{ font-size: 28px; font-weight: bold; letter-spacing: 4px; color: #667eea; text-align: center; padding: 15px; background: white; border-radius: 8px; }}
+                .button {{ display: inline-block; padding: 12px 30px; background: #667eea; color: white; text-decoration: none; border-radius: 6px; }}
+            </style>
+        </head>
+        <body>
+            <div class="container">
+                <div class="header">
+                    <h1>You're invited to the {family} family!</h1>
+                </div>
+                <div class="content">
+                    <p>{inviter} has invited you to join the {family} family on our family app.</p>
+                    <p>Your invite code:</p>
+                    <div class="code">{code}</div>
+                    <p style="text-align: center;"><a class="button" href="{url}">Join your family</a></p>
+                    <p style="font-size: 12px; color: #888;">This invitation was sent to {recipient}.</p>
+                </div>
+            </div>
+        </body>
+        </html>
+        """
+    
+    text_content = (
+        f"{inviter_name} has invited you to join the {family_name} family!\n\n"
+        f"Your invite code: {invite_code}\n"
+        f"Join here: {app_url}\n\n"
+        f"This invitation was sent to {recipient_email}.\n"
+    )
+    
+    return {
+        'subject': f"You're invited to join the {family_name} family!",
+        'html': html_content,
+        'text': text_content
+    }
+
+
+def personalize_email(message, recipient_email):
+    """Fill the recipient placeholder of a pre-rendered message"""
+    return {
+        'subject': message['subject'],
+        'html': message['html'].replace(RECIPIENT_PLACEHOLDER, html.escape(recipient_email)),
+        'text': message['text'].replace(RECIPIENT_PLACEHOLDER, recipient_email)
+    }
+
+
 def send_family_invite_email(recipient_email, family_name, invite_code, inviter_name, app_url):
     """
     Send a family invite email using Replit Mail
@@ -35,15 +150,9 @@ def send_family_invite_email(recipient_email, family_name, invite_code, inviter_
     Returns:
         dict: Response from the email service
     """
+    message = render_family_invite_email(family_name, invite_code, inviter_name, app_url, recipient_email)
     try:
-        auth_token = get_auth_token()
-        
-        # Create beautiful HTML email
-        html_content = f"""
-        <html>
-        <head>
-            <style>
-                body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
-                .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-                .header {{ background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 30px; text-align: center; border-radius: 8px 8px 0 0; }}
-      
+        return send_email(recipient_email, message['subject'], message['html'], message['text'])
+    except Exception as e:
+        logger.error(f"Failed to send invite email to {recipient_email}: {e}")
+        raise
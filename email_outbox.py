@@ -0,0 +1,283 @@
+# Persistent email outbox
+# Routes enqueue messages into the outbox table and return immediately; a
+# separate `flask outbox-worker` process runs a pool of worker threads that
+# drains it over pooled HTTP sessions, retrying failures with exponential
+# backoff and dead-lettering messages that keep failing. Web workers never
+# start delivery threads themselves.
+
+import os
+import random
+import threading
+import time
+import logging
+from datetime import datetime, timedelta
+
+from app import app, db
+from schema_helper import register_index
+from lazy_loader import lazy_import
+
+email_helper = lazy_import('email_helper')
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_WORKERS = int(os.environ.get('OUTBOX_WORKERS', '4'))
+OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', '20'))
+OUTBOX_POLL_INTERVAL = float(os.environ.get('OUTBOX_POLL_INTERVAL', '5'))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', '6'))
+OUTBOX_BACKOFF_BASE = float(os.environ.get('OUTBOX_BACKOFF_BASE', '2'))
+OUTBOX_BACKOFF_CAP = float(os.environ.get('OUTBOX_BACKOFF_CAP', '900'))
+OUTBOX_CLAIM_TIMEOUT = int(os.environ.get('OUTBOX_CLAIM_TIMEOUT', '300'))
+# Throughput and latency cover messages sent within this many seconds
+OUTBOX_METRICS_WINDOW = int(os.environ.get('OUTBOX_METRICS_WINDOW', '300'))
+OUTBOX_LATENCY_SAMPLES = 1000
+
+STATUS_PENDING = 'pending'
+STATUS_SENDING = 'sending'
+STATUS_SENT = 'sent'
+STATUS_DEAD = 'dead'
+
+
+class OutboxEmail(db.Model):
+    """An email waiting to be delivered (or the record of one that was)"""
+    __tablename__ = 'email_outbox'
+
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(255), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    html = db.Column(db.Text, nullable=False)
+    text = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default=STATUS_PENDING)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    claimed_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    sent_at = db.Column(db.DateTime)
+
+
+register_index('ix_email_outbox_status_next_attempt', OutboxEmail.status, OutboxEmail.next_attempt_at)
+register_index('ix_email_outbox_sent_at', OutboxEmail.sent_at)
+
+
+_wakeup = threading.Event()
+_workers = []
+_workers_lock = threading.Lock()
+_stopping = threading.Event()
+
+
+def enqueue_email(recipient, subject, html_content, text_content, commit=True):
+    """
+    Queue an email for background delivery
+
+    Args:
+        commit: Commit the current session; pass False to enqueue as part of
+            a larger transaction
+
+    Returns:
+        OutboxEmail: The queued row
+    """
+    message = OutboxEmail(
+        recipient=recipient,
+        subject=subject,
+        html=html_content,
+        text=text_content
+    )
+    db.session.add(message)
+    if commit:
+        db.session.commit()
+    # Wakes the pool when enqueued from inside the worker process; web
+    # processes have no waiting threads and the pool picks the row up on its
+    # next poll
+    _wakeup.set()
+    return message
+
+
+def backoff_delay(attempts):
+    """Seconds to wait before the next attempt, with full jitter"""
+    delay = min(OUTBOX_BACKOFF_CAP, OUTBOX_BACKOFF_BASE * (2 ** max(0, attempts - 1)))
+    return random.uniform(delay / 2, delay)
+
+
+def _release_stale_claims():
+    """
+    Return messages claimed by a crashed worker to the queue
+
+    The claim already counted as an attempt, so a message that keeps crashing
+    its worker is dead-lettered once it reaches OUTBOX_MAX_ATTEMPTS instead of
+    being retried forever.
+    """
+    cutoff = datetime.now() - timedelta(seconds=OUTBOX_CLAIM_TIMEOUT)
+    stale = OutboxEmail.query.filter(
+        OutboxEmail.status == STATUS_SENDING,
+        OutboxEmail.claimed_at < cutoff
+    )
+    dead = stale.filter(OutboxEmail.attempts >= OUTBOX_MAX_ATTEMPTS).update(
+        {'status': STATUS_DEAD, 'last_error': 'Claim timed out'}, synchronize_session=False
+    )
+    stale.filter(OutboxEmail.attempts < OUTBOX_MAX_ATTEMPTS).update(
+        {'status': STATUS_PENDING}, synchronize_session=False
+    )
+    db.session.commit()
+    if dead:
+        logger.error(f"Dead-lettered {dead} emails whose worker stopped mid-delivery")
+
+
+def _claim_batch():
+    """
+    Atomically claim due messages; a conditional UPDATE guards against other workers
+
+    Taking a claim counts as an attempt, so a worker that dies mid-delivery
+    still uses one up.
+    """
+    now = datetime.now()
+    candidates = [row.id for row in db.session.query(OutboxEmail.id).filter(
+        OutboxEmail.status == STATUS_PENDING,
+        OutboxEmail.next_attempt_at <= now
+    ).order_by(OutboxEmail.next_attempt_at).limit(OUTBOX_BATCH_SIZE)]
+
+    claimed = []
+    for message_id in candidates:
+        updated = OutboxEmail.query.filter_by(id=message_id, status=STATUS_PENDING).update(
+            {'status': STATUS_SENDING, 'claimed_at': now, 'attempts': OutboxEmail.attempts + 1},
+            synchronize_session=False
+        )
+        if updated:
+            claimed.append(message_id)
+    db.session.commit()
+    return claimed
+
+
+def _deliver(message_id):
+    message = OutboxEmail.query.get(message_id)
+    if message is None:
+        return
+    try:
+        email_helper.send_email(message.recipient, message.subject, message.html, message.text)
+    except Exception as e:
+        message.last_error = str(e)[:2000]
+        if message.attempts >= OUTBOX_MAX_ATTEMPTS:
+            message.status = STATUS_DEAD
+            logger.error(f"Dead-lettered email {message.id} to {message.recipient}: {e}")
+        else:
+            message.status = STATUS_PENDING
+            message.next_attempt_at = datetime.now() + timedelta(seconds=backoff_delay(message.attempts))
+            logger.warning(f"Email {message.id} failed (attempt {message.attempts}), retrying: {e}")
+    else:
+        message.status = STATUS_SENT
+        message.sent_at = datetime.now()
+    db.session.commit()
+
+
+def drain_outbox(max_batches=None):
+    """
+    Deliver due messages on the calling thread until none are left
+
+    Returns:
+        int: Number of messages processed
+    """
+    processed = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        claimed = _claim_batch()
+        if not claimed:
+            break
+        for message_id in claimed:
+            _deliver(message_id)
+        processed += len(claimed)
+        batches += 1
+    return processed
+
+
+def _worker_loop():
+    with app.app_context():
+        while not _stopping.is_set():
+            try:
+                _release_stale_claims()
+                if drain_outbox() == 0:
+                    _wakeup.wait(OUTBOX_POLL_INTERVAL)
+                    _wakeup.clear()
+            except Exception as e:
+                logger.error(f"Outbox worker error: {e}")
+                db.session.rollback()
+                time.sleep(OUTBOX_POLL_INTERVAL)
+            finally:
+                db.session.remove()
+
+
+def start_outbox_workers(count=OUTBOX_WORKERS):
+    """Start the worker pool in this process (idempotent); used by `flask outbox-worker`"""
+    if count <= 0:
+        return
+    with _workers_lock:
+        alive = [t for t in _workers if t.is_alive()]
+        _workers[:] = alive
+        _stopping.clear()
+        for i in range(len(alive), count):
+            thread = threading.Thread(target=_worker_loop, name=f'email-outbox-{i}', daemon=True)
+            thread.start()
+            _workers.append(thread)
+
+
+def stop_outbox_workers(timeout=5):
+    """Signal the worker pool to exit and wait for it"""
+    _stopping.set()
+    _wakeup.set()
+    with _workers_lock:
+        for thread in _workers:
+            thread.join(timeout)
+        _workers.clear()
+
+
+def get_outbox_metrics(window=OUTBOX_METRICS_WINDOW):
+    """
+    Queue depth by status plus throughput and latency figures
+
+    Everything is read from the outbox table, so the figures are the same in
+    every process: delivery happens in `flask outbox-worker`, while /metrics
+    is served by the web workers.
+    """
+    depth = dict(db.session.query(OutboxEmail.status, db.func.count(OutboxEmail.id)).group_by(OutboxEmail.status).all())
+    retried = db.session.query(db.func.coalesce(db.func.sum(OutboxEmail.attempts - 1), 0)).filter(
+        OutboxEmail.attempts > 1
+    ).scalar()
+
+    since = datetime.now() - timedelta(seconds=window)
+    recent = db.session.query(OutboxEmail.created_at, OutboxEmail.sent_at).filter(
+        OutboxEmail.status == STATUS_SENT,
+        OutboxEmail.sent_at >= since
+    ).order_by(OutboxEmail.sent_at.desc()).limit(OUTBOX_LATENCY_SAMPLES).all()
+    recent_count = db.session.query(db.func.count(OutboxEmail.id)).filter(
+        OutboxEmail.status == STATUS_SENT,
+        OutboxEmail.sent_at >= since
+    ).scalar()
+    latencies = sorted((sent_at - created_at).total_seconds() for created_at, sent_at in recent)
+
+    def percentile(p):
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+    return {
+        'enqueued': sum(depth.values()),
+        'sent': depth.get(STATUS_SENT, 0),
+        'retried': int(retried),
+        'dead': depth.get(STATUS_DEAD, 0),
+        'throughput_per_sec': recent_count / window,
+        'latency_p50': percentile(0.50),
+        'latency_p95': percentile(0.95),
+        'latency_p99': percentile(0.99),
+        'depth': {status: depth.get(status, 0) for status in (STATUS_PENDING, STATUS_SENDING, STATUS_SENT, STATUS_DEAD)},
+    }
+
+
+@app.cli.command('outbox-worker')
+def outbox_worker_command():
+    """Run the email outbox worker pool in the foreground"""
+    start_outbox_workers()
+    logger.info(f"Email outbox running with {OUTBOX_WORKERS} workers")
+    try:
+        while True:
+            time.sleep(60)
+            logger.info(f"Outbox metrics: {get_outbox_metrics()}")
+    except KeyboardInterrupt:
+        stop_outbox_workers()
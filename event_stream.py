@@ -0,0 +1,260 @@
+# Family activity push channel
+# Write routes publish small activity events per family; clients receive them
+# over Server-Sent Events or long-polling instead of reloading pages. Events
+# fan out in-process; with EVENTS_REDIS_URL set they travel through Redis
+# pub/sub so every worker sees every event, and event ids come from a
+# per-family Redis counter so they increase across workers.
+
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+SSE_HEARTBEAT_SECONDS = float(os.environ.get('SSE_HEARTBEAT_SECONDS', '15'))
+SSE_MAX_CONNECTION_SECONDS = float(os.environ.get('SSE_MAX_CONNECTION_SECONDS', '900'))
+SSE_CLIENT_BUFFER = int(os.environ.get('SSE_CLIENT_BUFFER', '100'))
+EVENT_HISTORY_SIZE = int(os.environ.get('EVENT_HISTORY_SIZE', '200'))
+
+
+class Subscription:
+    """A client's bounded event buffer; the oldest events are dropped when full"""
+
+    def __init__(self, family_id, maxsize=SSE_CLIENT_BUFFER):
+        self.family_id = family_id
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def put(self, event):
+        while True:
+            try:
+                self.queue.put_nowait(event)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class EventBroker:
+    """In-process pub/sub keyed by family, with a short replay history"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._history = {}
+        self._ids = itertools.count(int(time.time() * 1000))
+        self.published = 0
+        self.dropped = 0
+
+    def next_id(self):
+        """Ids for LocalBackend; only increasing within this process"""
+        return next(self._ids)
+
+    def subscribe(self, family_id):
+        subscription = Subscription(family_id)
+        with self._lock:
+            self._subscribers.setdefault(family_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.family_id)
+            if subscribers:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.family_id]
+            self.dropped += subscription.dropped
+
+    def deliver(self, family_id, event):
+        """Hand an event to local subscribers and record it for replay"""
+        with self._lock:
+            history = self._history.setdefault(family_id, deque(maxlen=EVENT_HISTORY_SIZE))
+            history.append(event)
+            subscribers = list(self._subscribers.get(family_id, ()))
+            self.published += 1
+        for subscription in subscribers:
+            subscription.put(event)
+
+    def history_since(self, family_id, since_id):
+        with self._lock:
+            return [e for e in self._history.get(family_id, ()) if e['id'] > since_id]
+
+    def connection_count(self):
+        with self._lock:
+            return sum(len(s) for s in self._subscribers.values())
+
+
+class LocalBackend:
+    """Single-process transport: publishing delivers directly"""
+
+    def __init__(self, broker):
+        self.broker = broker
+
+    def publish(self, family_id, event):
+        """Assign the event its id and deliver it; returns the id"""
+        event['id'] = self.broker.next_id()
+        self.broker.deliver(family_id, event)
+        return event['id']
+
+
+class RedisBackend:
+    """Multi-worker transport over Redis pub/sub"""
+
+    channel_prefix = 'family-events:'
+    id_prefix = 'family-event-ids:'
+
+    # Allocating the id and publishing in one script keeps publish order equal
+    # to id order. A missing counter starts from the current time in
+    # milliseconds, so ids keep increasing if Redis loses the key.
+    PUBLISH_SCRIPT = """
+    if redis.call('EXISTS', KEYS[1]) == 0 then
+        redis.call('SET', KEYS[1], ARGV[2])
+    end
+    local id = redis.call('INCR', KEYS[1])
+    redis.call('PUBLISH', KEYS[2], id .. ' ' .. ARGV[1])
+    return id
+    """
+
+    def __init__(self, broker, url):
+        import redis  # optional dependency, only needed for this backend
+        self.broker = broker
+        self.client = redis.Redis.from_url(url)
+        self._publish = self.client.register_script(self.PUBLISH_SCRIPT)
+        self._listener = None
+
+    def publish(self, family_id, event):
+        """Publish with an id from the family's Redis counter; returns the id"""
+        self._ensure_listener()
+        return self._publish(
+            keys=[f'{self.id_prefix}{family_id}', f'{self.channel_prefix}{family_id}'],
+            args=[json.dumps(event), int(time.time() * 1000)]
+        )
+
+    def _ensure_listener(self):
+        if self._listener is None or not self._listener.is_alive():
+            self._listener = threading.Thread(target=self._listen, name='family-events-redis', daemon=True)
+            self._listener.start()
+
+    def _listen(self):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.psubscribe(f'{self.channel_prefix}*')
+        for message in pubsub.listen():
+            try:
+                family_id = int(message['channel'].decode().rsplit(':', 1)[1])
+                event_id, payload = message['data'].split(b' ', 1)
+                event = json.loads(payload)
+                event['id'] = int(event_id)
+                self.broker.deliver(family_id, event)
+            except Exception as e:
+                logger.error(f"Bad family event from Redis: {e}")
+
+
+broker = EventBroker()
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        url = os.environ.get('EVENTS_REDIS_URL')
+        if url:
+            try:
+                _backend = RedisBackend(broker, url)
+                _backend._ensure_listener()
+            except Exception as e:
+                logger.warning(f"Falling back to in-process events: {e}")
+                _backend = LocalBackend(broker)
+        else:
+            _backend = LocalBackend(broker)
+    return _backend
+
+
+def set_backend(backend):
+    """Swap the transport (tests, alternative brokers)"""
+    global _backend
+    _backend = backend
+
+
+def publish_family_event(family_id, event_type, **data):
+    """
+    Publish an activity event to everyone in a family
+
+    Call after the write has been committed. Payloads should carry ids and
+    small fields only; clients fetch details through the normal APIs.
+    """
+    if not family_id:
+        return
+    event = {'type': event_type, 'data': data, 'ts': time.time()}
+    try:
+        get_backend().publish(family_id, event)
+    except Exception as e:
+        logger.error(f"Could not publish {event_type} for family {family_id}: {e}")
+
+
+def format_sse(event):
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+
+
+def sse_stream(family_id, last_event_id=None):
+    """
+    Generator of SSE frames for one client
+
+    Replays buffered events after Last-Event-ID, sends a comment heartbeat
+    when idle, and ends after SSE_MAX_CONNECTION_SECONDS so the client
+    reconnects and the worker is recycled.
+    """
+    get_backend()
+    subscription = broker.subscribe(family_id)
+    try:
+        yield f'retry: {int(SSE_HEARTBEAT_SECONDS * 1000)}\n\n'
+        if last_event_id is not None:
+            for event in broker.history_since(family_id, last_event_id):
+                yield format_sse(event)
+        deadline = time.monotonic() + SSE_MAX_CONNECTION_SECONDS
+        while time.monotonic() < deadline:
+            event = subscription.get(timeout=SSE_HEARTBEAT_SECONDS)
+            yield format_sse(event) if event else ': heartbeat\n\n'
+    finally:
+        broker.unsubscribe(subscription)
+
+
+def poll_events(family_id, since_id, timeout=25):
+    """
+    Long-poll: return events after since_id, waiting up to timeout seconds
+
+    Returns:
+        list: Events, oldest first (possibly empty)
+    """
+    get_backend()
+    # Subscribe before reading history so nothing published in between is lost
+    subscription = broker.subscribe(family_id)
+    try:
+        events = broker.history_since(family_id, since_id)
+        if events:
+            return events
+        event = subscription.get(timeout=timeout)
+        return [event] if event else []
+    finally:
+        broker.unsubscribe(subscription)
+
+
+def stream_metrics():
+    return {
+        'connections': broker.connection_count(),
+        'published': broker.published,
+        'dropped': broker.dropped,
+    }
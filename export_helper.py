@@ -0,0 +1,293 @@
+# Streaming family archive export
+# The archive is a ZIP produced on the fly by generators: one NDJSON file per
+# table, read with server-side cursors in fixed-size batches, followed by the
+# photo files copied in chunks. Nothing is held in memory beyond one batch or
+# chunk. Entries use fixed timestamps and order, so an unchanged family always
+# produces the same bytes. The first download is spooled to disk as it
+# streams; later downloads (including HTTP range resumes) are served from the
+# spooled file until the family's data changes, as tracked by persisted
+# per-family versions (the sync feed's, plus one for exported tables the feed
+# does not cover). Only files inside the upload root are ever exported.
+
+import os
+import io
+import json
+import time
+import uuid
+import zipfile
+import tempfile
+import logging
+
+from sqlalchemy import event, or_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app import app, db
+from models import User, RemembranceMember, Memory, Event, Chore, Message, Photo
+from change_feed import FamilyVersion, MEMBER_FIELDS
+from image_pipeline import UPLOAD_ROOT, UPLOAD_URL_PREFIX
+from schema_helper import to_json_dict
+
+logger = logging.getLogger(__name__)
+
+EXPORT_BATCH_SIZE = 500
+COPY_CHUNK_SIZE = 64 * 1024
+EXPORT_DIR = os.environ.get('EXPORT_DIR', os.path.join(tempfile.gettempdir(), 'family-exports'))
+EXPORT_SPOOL_TTL = int(os.environ.get('EXPORT_SPOOL_TTL', '3600'))
+
+# Fixed entry metadata keeps the archive byte-for-byte reproducible
+ZIP_EPOCH = (1980, 1, 1, 0, 0, 0)
+
+
+class ExportVersion(db.Model):
+    """Per-family version of exported rows the sync feed does not track"""
+    __tablename__ = 'family_export_versions'
+
+    family_id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+@event.listens_for(db.session, 'before_flush')
+def _collect_export_changes(session, flush_context, instances):
+    families = session.info.setdefault('export_families', set())
+    member_ids = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, (RemembranceMember, Photo)):
+            families.add(obj.family_id)
+        elif isinstance(obj, Memory):
+            member_ids.add(obj.remembrance_member_id)
+    member_ids.discard(None)
+    if member_ids:
+        with session.no_autoflush:
+            families.update(row[0] for row in session.query(RemembranceMember.family_id).filter(
+                RemembranceMember.id.in_(member_ids)))
+    families.discard(None)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _bump_export_versions(session, flush_context):
+    families = session.info.pop('export_families', None)
+    if not families:
+        return
+    connection = session.connection()
+    table = ExportVersion.__table__
+    insert = pg_insert if connection.dialect.name == 'postgresql' else sqlite_insert
+    statement = insert(table).on_conflict_do_update(
+        index_elements=[table.c.family_id], set_={'version': table.c.version + 1})
+    connection.execute(statement, [{'family_id': family_id, 'version': 1} for family_id in sorted(families)])
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_export_changes(session):
+    session.info.pop('export_families', None)
+
+
+class _ZipSink(io.RawIOBase):
+    """Unseekable file object that collects what ZipFile writes until drained"""
+
+    def __init__(self):
+        self._parts = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def _entry_info(name, compress_type=zipfile.ZIP_DEFLATED):
+    info = zipfile.ZipInfo(name, date_time=ZIP_EPOCH)
+    info.compress_type = compress_type
+    info.create_system = 3
+    info.external_attr = 0o644 << 16
+    return info
+
+
+def _stream_rows(query):
+    return query.execution_options(stream_results=True).yield_per(EXPORT_BATCH_SIZE)
+
+
+def _member_dict(user):
+    return {field: getattr(user, field, None) for field in MEMBER_FIELDS}
+
+
+def export_tables(family_id, user_id):
+    """
+    (archive name, row query, serializer) for every exported table
+
+    Messages are limited to the requesting user's own conversations.
+    """
+    return (
+        ('members.ndjson', User.query.filter(User.family_id == family_id).order_by(User.id), _member_dict),
+        ('remembrance_members.ndjson',
+         RemembranceMember.query.filter(RemembranceMember.family_id == family_id).order_by(RemembranceMember.id),
+         to_json_dict),
+        ('tributes.ndjson',
+         Memory.query.join(RemembranceMember, Memory.remembrance_member_id == RemembranceMember.id).filter(
+             RemembranceMember.family_id == family_id).order_by(Memory.id),
+         to_json_dict),
+        ('events.ndjson', Event.query.filter(Event.family_id == family_id).order_by(Event.id), to_json_dict),
+        ('chores.ndjson', Chore.query.filter(Chore.family_id == family_id).order_by(Chore.id), to_json_dict),
+        ('messages.ndjson',
+         Message.query.filter(or_(Message.sender_id == user_id, Message.receiver_id == user_id)).order_by(Message.id),
+         to_json_dict),
+        ('photos.ndjson', Photo.query.filter(Photo.family_id == family_id).order_by(Photo.id), to_json_dict),
+    )
+
+
+def _local_path(url):
+    """
+    Filesystem path of an uploaded file from its public URL, or None
+
+    Only URLs under UPLOAD_URL_PREFIX resolve, and only to regular files
+    inside UPLOAD_ROOT (symlinks and '..' are resolved first); hidden entries
+    such as partial uploads are skipped.
+    """
+    if not url or not url.startswith(UPLOAD_URL_PREFIX + '/'):
+        return None
+    relative = url[len(UPLOAD_URL_PREFIX) + 1:]
+    if any(part.startswith('.') for part in relative.split('/')):
+        return None
+    root = os.path.realpath(UPLOAD_ROOT)
+    path = os.path.realpath(os.path.join(root, relative))
+    if os.path.commonpath([root, path]) != root or not os.path.isfile(path):
+        return None
+    return path
+
+
+def _photo_files(family_id):
+    """(archive name, path) for every uploaded image the family owns"""
+    photos = db.session.query(Photo.id, Photo.photo_url).filter(
+        Photo.family_id == family_id, Photo.photo_url.isnot(None)
+    ).order_by(Photo.id)
+    for photo_id, url in _stream_rows(photos):
+        path = _local_path(url)
+        if path:
+            yield f'photos/{photo_id}-{os.path.basename(path)}', path
+    members = db.session.query(RemembranceMember.id, RemembranceMember.photo_url).filter(
+        RemembranceMember.family_id == family_id, RemembranceMember.photo_url.isnot(None)
+    ).order_by(RemembranceMember.id)
+    for member_id, url in _stream_rows(members):
+        path = _local_path(url)
+        if path:
+            yield f'remembrance/{member_id}-{os.path.basename(path)}', path
+
+
+def export_chunks(family_id, user_id):
+    """
+    Yield the family archive as a sequence of byte chunks
+
+    Must run inside an application context (wrap with stream_with_context).
+    """
+    sink = _ZipSink()
+    archive = zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED)
+
+    manifest = {'family_id': family_id, 'format': 1, 'tables': []}
+    for name, query, serialize in export_tables(family_id, user_id):
+        count = 0
+        with archive.open(_entry_info(name), 'w', force_zip64=True) as entry:
+            for row in _stream_rows(query):
+                entry.write(json.dumps(serialize(row), default=str, sort_keys=True).encode() + b'\n')
+                count += 1
+                if count % EXPORT_BATCH_SIZE == 0:
+                    yield sink.drain()
+        manifest['tables'].append({'file': name, 'rows': count})
+        yield sink.drain()
+
+    for name, path in _photo_files(family_id):
+        # Images are already compressed
+        with archive.open(_entry_info(name, zipfile.ZIP_STORED), 'w', force_zip64=True) as entry, \
+                open(path, 'rb') as source:
+            while True:
+                chunk = source.read(COPY_CHUNK_SIZE)
+                if not chunk:
+                    break
+                entry.write(chunk)
+                yield sink.drain()
+        yield sink.drain()
+
+    with archive.open(_entry_info('manifest.json'), 'w') as entry:
+        entry.write(json.dumps(manifest, indent=2, sort_keys=True).encode())
+    archive.close()
+    yield sink.drain()
+
+
+def data_version(family_id):
+    """Persisted version of everything the family export contains"""
+    synced = db.session.query(FamilyVersion.version).filter_by(family_id=family_id).scalar() or 0
+    exported = db.session.query(ExportVersion.version).filter_by(family_id=family_id).scalar() or 0
+    return f'{synced}.{exported}'
+
+
+def spool_path(family_id, user_id):
+    """Where the archive for this family data version and user is spooled"""
+    safe_user = ''.join(c for c in str(user_id) if c.isalnum() or c in '-_')
+    return os.path.join(EXPORT_DIR, f'family-{family_id}-v{data_version(family_id)}-{safe_user}.zip')
+
+
+def spooled_export(family_id, user_id):
+    """Path of a complete, current spooled archive, or None"""
+    path = spool_path(family_id, user_id)
+    try:
+        if time.time() - os.path.getmtime(path) < EXPORT_SPOOL_TTL:
+            return path
+        os.remove(path)
+    except OSError:
+        pass
+    return None
+
+
+def stream_export(family_id, user_id):
+    """
+    Stream the archive while writing it to the spool
+
+    The spool only becomes visible once the whole archive was produced; an
+    abandoned download leaves nothing behind.
+    """
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    final_path = spool_path(family_id, user_id)
+    part_path = f'{final_path}.{uuid.uuid4().hex}.part'
+    completed = False
+    try:
+        with open(part_path, 'wb') as spool:
+            for chunk in export_chunks(family_id, user_id):
+                if chunk:
+                    spool.write(chunk)
+                    yield chunk
+        os.replace(part_path, final_path)
+        completed = True
+    finally:
+        if not completed:
+            try:
+                os.remove(part_path)
+            except OSError:
+                pass
+
+
+def purge_stale_exports():
+    """Delete expired spooled archives and leftovers of interrupted downloads"""
+    removed = 0
+    if not os.path.isdir(EXPORT_DIR):
+        return removed
+    cutoff = time.time() - EXPORT_SPOOL_TTL
+    for name in os.listdir(EXPORT_DIR):
+        path = os.path.join(EXPORT_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+@app.cli.command('purge-exports')
+def purge_exports_command():
+    """Remove expired spooled export archives"""
+    logger.info(f"Removed {purge_stale_exports()} spooled exports")
@@ -0,0 +1,250 @@
+# Family relationship graph
+# Relationships typed into remembrance members as comma-separated names are
+# normalised into person nodes and parent/sibling edges when a member is
+# added. An ancestor/descendant closure table is maintained incrementally, so
+# "all descendants of X", generation depth and tree rendering are indexed
+# lookups instead of repeated string parsing.
+
+import re
+import logging
+
+from app import app, db
+from models import RemembranceMember
+from schema_helper import register_index
+
+logger = logging.getLogger(__name__)
+
+EDGE_PARENT = 'parent'
+EDGE_SIBLING = 'sibling'
+
+
+class PersonNode(db.Model):
+    """A person in a family's tree, optionally backed by a remembrance member"""
+    __tablename__ = 'family_person_nodes'
+
+    id = db.Column(db.Integer, primary_key=True)
+    family_id = db.Column(db.Integer, nullable=False)
+    name = db.Column(db.String(200), nullable=False)
+    name_key = db.Column(db.String(200), nullable=False)
+    remembrance_member_id = db.Column(db.Integer, db.ForeignKey(RemembranceMember.id, ondelete='SET NULL'), unique=True)
+
+    __table_args__ = (db.UniqueConstraint('family_id', 'name_key', name='uq_person_node_family_name'),)
+
+
+class RelationshipEdge(db.Model):
+    """A typed edge; for 'parent' edges from_id is the parent of to_id"""
+    __tablename__ = 'family_relationship_edges'
+
+    from_id = db.Column(db.Integer, db.ForeignKey('family_person_nodes.id', ondelete='CASCADE'), primary_key=True)
+    to_id = db.Column(db.Integer, db.ForeignKey('family_person_nodes.id', ondelete='CASCADE'), primary_key=True)
+    kind = db.Column(db.String(20), primary_key=True)
+    family_id = db.Column(db.Integer, nullable=False, index=True)
+
+
+class AncestryClosure(db.Model):
+    """Transitive closure of parent edges: ancestor_id is `depth` generations above descendant_id"""
+    __tablename__ = 'family_ancestry_closure'
+
+    ancestor_id = db.Column(db.Integer, db.ForeignKey('family_person_nodes.id', ondelete='CASCADE'), primary_key=True)
+    descendant_id = db.Column(db.Integer, db.ForeignKey('family_person_nodes.id', ondelete='CASCADE'), primary_key=True)
+    depth = db.Column(db.Integer, nullable=False)
+    family_id = db.Column(db.Integer, nullable=False)
+
+
+register_index('ix_ancestry_closure_descendant', AncestryClosure.descendant_id, AncestryClosure.depth)
+register_index('ix_ancestry_closure_family', AncestryClosure.family_id)
+
+
+def name_key(name):
+    """Normalised form used to match the same person typed in different places"""
+    return re.sub(r'\s+', ' ', name).strip().lower()
+
+
+def split_names(value):
+    """Parse a comma/semicolon/'and' separated list of names"""
+    if not value:
+        return []
+    parts = re.split(r'\s*(?:,|;|\n|\band\b|&)\s*', value)
+    return [p.strip() for p in parts if p and p.strip()]
+
+
+def get_or_create_node(family_id, name, remembrance_member_id=None):
+    key = name_key(name)
+    node = PersonNode.query.filter_by(family_id=family_id, name_key=key).first()
+    if node is None:
+        node = PersonNode(family_id=family_id, name=name.strip(), name_key=key,
+                          remembrance_member_id=remembrance_member_id)
+        db.session.add(node)
+        db.session.flush()
+    elif remembrance_member_id and not node.remembrance_member_id:
+        node.remembrance_member_id = remembrance_member_id
+    return node
+
+
+def _add_edge(family_id, from_id, to_id, kind):
+    if from_id == to_id or RelationshipEdge.query.get((from_id, to_id, kind)):
+        return False
+    db.session.add(RelationshipEdge(from_id=from_id, to_id=to_id, kind=kind, family_id=family_id))
+    return True
+
+
+def _ensure_self_row(node):
+    if not AncestryClosure.query.get((node.id, node.id)):
+        db.session.add(AncestryClosure(ancestor_id=node.id, descendant_id=node.id, depth=0, family_id=node.family_id))
+
+
+def _link_parent(family_id, parent_id, child_id):
+    """
+    Add a parent edge and extend the closure: every ancestor of the parent
+    becomes an ancestor of every descendant of the child
+    """
+    # Refuse edges that would make someone their own ancestor
+    if AncestryClosure.query.get((child_id, parent_id)):
+        logger.warning(f"Ignoring cyclic parent edge {parent_id} -> {child_id}")
+        return
+    if not _add_edge(family_id, parent_id, child_id, EDGE_PARENT):
+        return
+
+    ancestors = db.session.query(AncestryClosure.ancestor_id, AncestryClosure.depth).filter(
+        AncestryClosure.descendant_id == parent_id).all()
+    descendants = db.session.query(AncestryClosure.descendant_id, AncestryClosure.depth).filter(
+        AncestryClosure.ancestor_id == child_id).all()
+    existing = {
+        (row.ancestor_id, row.descendant_id): row
+        for row in AncestryClosure.query.filter(
+            AncestryClosure.ancestor_id.in_([a for a, _ in ancestors]),
+            AncestryClosure.descendant_id.in_([d for d, _ in descendants])
+        )
+    }
+    for ancestor_id, up in ancestors:
+        for descendant_id, down in descendants:
+            depth = up + down + 1
+            row = existing.get((ancestor_id, descendant_id))
+            if row is None:
+                db.session.add(AncestryClosure(ancestor_id=ancestor_id, descendant_id=descendant_id,
+                                               depth=depth, family_id=family_id))
+            elif depth < row.depth:
+                row.depth = depth
+
+
+def add_member_to_graph(member):
+    """
+    Materialise a remembrance member and its typed relatives (call before commit)
+
+    Returns:
+        PersonNode: The member's node
+    """
+    family_id = member.family_id
+    node = get_or_create_node(family_id, member.name, member.id)
+    _ensure_self_row(node)
+
+    relatives = (
+        [(get_or_create_node(family_id, n), 'parent') for n in split_names(member.parents_names)] +
+        [(get_or_create_node(family_id, n), 'child') for n in split_names(member.children_names)] +
+        [(get_or_create_node(family_id, n), 'sibling') for n in split_names(member.siblings_names)]
+    )
+    for relative, relation in relatives:
+        _ensure_self_row(relative)
+    db.session.flush()
+
+    for relative, relation in relatives:
+        if relation == 'parent':
+            _link_parent(family_id, relative.id, node.id)
+        elif relation == 'child':
+            _link_parent(family_id, node.id, relative.id)
+        else:
+            _add_edge(family_id, node.id, relative.id, EDGE_SIBLING)
+            _add_edge(family_id, relative.id, node.id, EDGE_SIBLING)
+        db.session.flush()
+    return node
+
+
+def node_for_member(member_id):
+    return PersonNode.query.filter_by(remembrance_member_id=member_id).first()
+
+
+def descendants(node_id, max_depth=None):
+    """All descendants of a person as (PersonNode, generations below) pairs"""
+    query = db.session.query(PersonNode, AncestryClosure.depth).join(
+        AncestryClosure, AncestryClosure.descendant_id == PersonNode.id
+    ).filter(AncestryClosure.ancestor_id == node_id, AncestryClosure.depth > 0)
+    if max_depth is not None:
+        query = query.filter(AncestryClosure.depth <= max_depth)
+    return query.order_by(AncestryClosure.depth, PersonNode.name).all()
+
+
+def ancestors(node_id, max_depth=None):
+    """All ancestors of a person as (PersonNode, generations above) pairs"""
+    query = db.session.query(PersonNode, AncestryClosure.depth).join(
+        AncestryClosure, AncestryClosure.ancestor_id == PersonNode.id
+    ).filter(AncestryClosure.descendant_id == node_id, AncestryClosure.depth > 0)
+    if max_depth is not None:
+        query = query.filter(AncestryClosure.depth <= max_depth)
+    return query.order_by(AncestryClosure.depth, PersonNode.name).all()
+
+
+def generation_depths(family_id):
+    """Generation number per node: 0 for people with no known ancestors"""
+    rows = db.session.query(AncestryClosure.descendant_id, db.func.max(AncestryClosure.depth)).filter(
+        AncestryClosure.family_id == family_id).group_by(AncestryClosure.descendant_id).all()
+    return dict(rows)
+
+
+def family_tree(family_id):
+    """
+    Whole tree in two queries, ready for rendering or an AI prompt
+
+    Returns:
+        dict: {'nodes': [{'id', 'name', 'generation', 'remembrance_member_id'}],
+               'edges': [{'from', 'to', 'kind'}]}
+    """
+    generations = generation_depths(family_id)
+    nodes = PersonNode.query.filter_by(family_id=family_id).order_by(PersonNode.name).all()
+    edges = RelationshipEdge.query.filter_by(family_id=family_id).all()
+    return {
+        'nodes': [
+            {'id': n.id, 'name': n.name, 'generation': generations.get(n.id, 0),
+             'remembrance_member_id': n.remembrance_member_id}
+            for n in nodes
+        ],
+        'edges': [{'from': e.from_id, 'to': e.to_id, 'kind': e.kind} for e in edges],
+    }
+
+
+def describe_tree(family_id):
+    """Compact text outline of the tree, by generation, for AI prompts"""
+    tree = family_tree(family_id)
+    names = {n['id']: n['name'] for n in tree['nodes']}
+    children = {}
+    for edge in tree['edges']:
+        if edge['kind'] == EDGE_PARENT:
+            children.setdefault(edge['from'], []).append(names[edge['to']])
+
+    lines = []
+    for node in sorted(tree['nodes'], key=lambda n: (n['generation'], n['name'])):
+        line = f"Generation {node['generation'] + 1}: {node['name']}"
+        if node['id'] in children:
+            line += f" (children: {', '.join(sorted(children[node['id']]))})"
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def rebuild_family_graph(family_id=None):
+    """Recreate the graph from remembrance members (backfill or repair)"""
+    families = [family_id] if family_id else [
+        row[0] for row in db.session.query(RemembranceMember.family_id).distinct()
+    ]
+    for fid in families:
+        AncestryClosure.query.filter_by(family_id=fid).delete(synchronize_session=False)
+        RelationshipEdge.query.filter_by(family_id=fid).delete(synchronize_session=False)
+        PersonNode.query.filter_by(family_id=fid).delete(synchronize_session=False)
+        for member in RemembranceMember.query.filter_by(family_id=fid).order_by(RemembranceMember.id):
+            add_member_to_graph(member)
+        db.session.commit()
+    return len(families)
+
+
+@app.cli.command('rebuild-family-graph')
+def rebuild_family_graph_command():
+    """Backfill the relationship graph from existing remembrance members"""
+    logger.info(f"Rebuilt relationship graphs for {rebuild_family_graph()} families")
@@ -0,0 +1,249 @@
+# Family feed timeline
+# Posts are read newest first with keyset pagination on (created_at, id).
+# Like and comment counts live in a post_stats side table that is adjusted in
+# the same transaction as the like or comment, likes are unique per
+# (post, user) so concurrent toggles cannot double count, and the viewer's
+# likes for a page are fetched in one query. A feed page is a fixed number of
+# queries regardless of its size.
+
+import logging
+from datetime import datetime
+from types import SimpleNamespace
+
+from sqlalchemy import event, and_, or_, func, case
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app import app, db
+from models import Post, PostLike, PostComment, User
+from schema_helper import register_index, to_json_dict, encode_cursor, decode_cursor
+
+logger = logging.getLogger(__name__)
+
+FEED_PAGE_SIZE = 20
+FEED_MAX_PAGE_SIZE = 100
+COMMENT_PAGE_SIZE = 50
+
+register_index('ix_post_family_created', Post.family_id, Post.created_at, Post.id)
+register_index('ux_post_like_post_user', PostLike.post_id, PostLike.user_id, unique=True)
+register_index('ix_post_comment_post_created', PostComment.post_id, PostComment.created_at, PostComment.id)
+
+
+class PostStats(db.Model):
+    """Denormalised like and comment counts for a post"""
+    __tablename__ = 'post_stats'
+
+    post_id = db.Column(db.Integer, db.ForeignKey(Post.id, ondelete='CASCADE'), primary_key=True)
+    like_count = db.Column(db.Integer, nullable=False, default=0)
+    comment_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+def _insert(table):
+    return (pg_insert if db.engine.dialect.name == 'postgresql' else sqlite_insert)(table)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _create_stats_for_new_posts(session, flush_context):
+    post_ids = [obj.id for obj in session.new if isinstance(obj, Post)]
+    if post_ids:
+        session.connection().execute(
+            _insert(PostStats.__table__).on_conflict_do_nothing(),
+            [{'post_id': post_id, 'like_count': 0, 'comment_count': 0} for post_id in post_ids]
+        )
+
+
+def _counted_stats(post_ids):
+    """Like and comment counts from the source tables (one grouped query each), not stored"""
+    likes = dict(db.session.query(PostLike.post_id, func.count()).filter(
+        PostLike.post_id.in_(post_ids)).group_by(PostLike.post_id))
+    comments = dict(db.session.query(PostComment.post_id, func.count()).filter(
+        PostComment.post_id.in_(post_ids)).group_by(PostComment.post_id))
+    return {
+        post_id: SimpleNamespace(post_id=post_id, like_count=likes.get(post_id, 0),
+                                 comment_count=comments.get(post_id, 0))
+        for post_id in post_ids
+    }
+
+
+def ensure_stats(post_ids):
+    """Backfill counter rows for posts that predate the stats table; used by the write paths"""
+    post_ids = set(post_ids)
+    if not post_ids:
+        return
+    missing = post_ids - {
+        row[0] for row in db.session.query(PostStats.post_id).filter(PostStats.post_id.in_(post_ids))
+    }
+    if not missing:
+        return
+    counts = _counted_stats(missing)
+    db.session.execute(_insert(PostStats.__table__).on_conflict_do_nothing(), [
+        {'post_id': post_id, 'like_count': counts[post_id].like_count, 'comment_count': counts[post_id].comment_count}
+        for post_id in missing
+    ])
+
+
+def _adjust(post_id, column, delta):
+    """Atomically add delta to a post counter (never below zero)"""
+    value = getattr(PostStats, column) + delta
+    PostStats.query.filter_by(post_id=post_id).update(
+        {column: case((value < 0, 0), else_=value)},
+        synchronize_session=False
+    )
+
+
+def feed_page(family_id, viewer_id, cursor=None, limit=FEED_PAGE_SIZE):
+    """
+    One page of the family feed, newest first
+
+    Returns:
+        tuple: (list of post dicts with 'like_count', 'comment_count',
+            'liked_by_me' and 'author', next cursor or None)
+    """
+    limit = max(1, min(limit, FEED_MAX_PAGE_SIZE))
+    query = db.session.query(Post, PostStats).outerjoin(PostStats, PostStats.post_id == Post.id).filter(
+        Post.family_id == family_id)
+    if cursor:
+        created_at, post_id = decode_cursor(cursor, datetime, int)
+        query = query.filter(or_(
+            Post.created_at < created_at,
+            and_(Post.created_at == created_at, Post.id < post_id)
+        ))
+    rows = query.order_by(Post.created_at.desc(), Post.id.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1][0]
+        next_cursor = encode_cursor(last.created_at, last.id)
+
+    post_ids = [post.id for post, _ in rows]
+    missing = [post.id for post, stats in rows if stats is None]
+    if missing:
+        # Posts that predate the stats table; counted but not stored, so a
+        # read never writes (reconcile-post-stats backfills them)
+        counts = _counted_stats(missing)
+        rows = [(post, stats or counts[post.id]) for post, stats in rows]
+
+    liked = {
+        row[0] for row in db.session.query(PostLike.post_id).filter(
+            PostLike.user_id == viewer_id, PostLike.post_id.in_(post_ids))
+    } if post_ids else set()
+
+    authors = {}
+    if rows:
+        author_ids = {post.author_id for post, _ in rows}
+        authors = {
+            user.id: {'id': user.id, 'first_name': user.first_name, 'last_name': user.last_name,
+                      'profile_image_url': user.profile_image_url}
+            for user in User.query.filter(User.id.in_(author_ids))
+        }
+
+    posts = []
+    for post, stats in rows:
+        item = to_json_dict(post)
+        item['like_count'] = stats.like_count if stats else 0
+        item['comment_count'] = stats.comment_count if stats else 0
+        item['liked_by_me'] = post.id in liked
+        item['author'] = authors.get(post.author_id)
+        posts.append(item)
+    return posts, next_cursor
+
+
+def set_like(post_id, user_id, liked):
+    """
+    Like or unlike a post (idempotent and safe under concurrent requests)
+
+    Returns:
+        bool: True when the call changed anything (caller commits)
+    """
+    # Counters must exist before the like changes, or a backfill would count it twice
+    ensure_stats([post_id])
+    if liked:
+        result = db.session.execute(
+            _insert(PostLike.__table__).values(post_id=post_id, user_id=user_id).on_conflict_do_nothing()
+        )
+    else:
+        result = db.session.execute(
+            PostLike.__table__.delete().where(PostLike.post_id == post_id, PostLike.user_id == user_id)
+        )
+    if result.rowcount:
+        _adjust(post_id, 'like_count', 1 if liked else -1)
+    return bool(result.rowcount)
+
+
+def toggle_like(post_id, user_id):
+    """
+    Flip the user's like on a post
+
+    Returns:
+        bool: Whether the post is now liked by the user (caller commits)
+    """
+    liked = db.session.query(PostLike.query.filter_by(post_id=post_id, user_id=user_id).exists()).scalar()
+    set_like(post_id, user_id, not liked)
+    return not liked
+
+
+def like_count(post_id):
+    return db.session.query(PostStats.like_count).filter_by(post_id=post_id).scalar() or 0
+
+
+def add_comment(post_id, user_id, content):
+    """Add a comment and bump the post's comment count (caller commits)"""
+    ensure_stats([post_id])
+    comment = PostComment(post_id=post_id, user_id=user_id, content=content)
+    db.session.add(comment)
+    _adjust(post_id, 'comment_count', 1)
+    return comment
+
+
+def comment_page(post_id, cursor=None, limit=COMMENT_PAGE_SIZE):
+    """
+    One page of comments, oldest first
+
+    Returns:
+        tuple: (list of PostComment, next cursor or None)
+    """
+    limit = max(1, min(limit, FEED_MAX_PAGE_SIZE))
+    query = PostComment.query.filter(PostComment.post_id == post_id)
+    if cursor:
+        created_at, comment_id = decode_cursor(cursor, datetime, int)
+        query = query.filter(or_(
+            PostComment.created_at > created_at,
+            and_(PostComment.created_at == created_at, PostComment.id > comment_id)
+        ))
+    comments = query.order_by(PostComment.created_at, PostComment.id).limit(limit + 1).all()
+    if len(comments) > limit:
+        comments = comments[:limit]
+        return comments, encode_cursor(comments[-1].created_at, comments[-1].id)
+    return comments, None
+
+
+def reconcile_post_stats():
+    """
+    Recompute every post's counters from the like and comment tables
+
+    Returns:
+        int: Number of stats rows repaired
+    """
+    likes = dict(db.session.query(PostLike.post_id, func.count()).group_by(PostLike.post_id))
+    comments = dict(db.session.query(PostComment.post_id, func.count()).group_by(PostComment.post_id))
+    stored = {row.post_id: row for row in PostStats.query}
+    repaired = 0
+    for (post_id,) in db.session.query(Post.id):
+        expected = (likes.get(post_id, 0), comments.get(post_id, 0))
+        row = stored.get(post_id)
+        if row is None:
+            db.session.add(PostStats(post_id=post_id, like_count=expected[0], comment_count=expected[1]))
+            repaired += 1
+        elif (row.like_count, row.comment_count) != expected:
+            row.like_count, row.comment_count = expected
+            repaired += 1
+    db.session.commit()
+    if repaired:
+        logger.warning(f"Reconciled {repaired} post stats rows")
+    return repaired
+
+
+@app.cli.command('reconcile-post-stats')
+def reconcile_post_stats_command():
+    """Backfill and repair denormalised post like/comment counts"""
+    logger.info(f"Repaired {reconcile_post_stats()} post stats rows")
@@ -0,0 +1,99 @@
+# Photo gallery queries
+# Album counts and covers are computed in the database with GROUP BY and a
+# window function; album contents are read with keyset pagination on
+# (created_at, id) so only the photos on screen are loaded.
+
+import os
+from datetime import datetime
+
+from sqlalchemy import func, and_, or_
+
+from app import db
+from models import Photo
+from schema_helper import register_index, encode_cursor, decode_cursor
+
+GALLERY_PREVIEW_SIZE = int(os.environ.get('GALLERY_PREVIEW_SIZE', '8'))
+GALLERY_PAGE_SIZE = 48
+GALLERY_MAX_PAGE_SIZE = 200
+DEFAULT_ALBUM = 'General'
+
+register_index('ix_photo_family_album_created', Photo.family_id, Photo.album_name, Photo.created_at, Photo.id)
+register_index('ix_photo_family_created', Photo.family_id, Photo.created_at, Photo.id)
+
+album_label = func.coalesce(Photo.album_name, DEFAULT_ALBUM)
+
+
+def album_summaries(family_id):
+    """
+    Per-album photo counts and latest upload time for a family
+
+    Returns:
+        dict: album name -> {'count': int, 'latest': datetime}, newest album first
+    """
+    rows = db.session.query(
+        album_label.label('album'),
+        func.count(Photo.id),
+        func.max(Photo.created_at)
+    ).filter(
+        Photo.family_id == family_id
+    ).group_by(album_label).order_by(func.max(Photo.created_at).desc()).all()
+    return {album: {'count': count, 'latest': latest} for album, count, latest in rows}
+
+
+def album_previews(family_id, per_album=GALLERY_PREVIEW_SIZE):
+    """
+    The newest photos of every album in a single query
+
+    The first photo of each list is the album cover.
+
+    Returns:
+        dict: album name -> list of Photo
+    """
+    position = func.row_number().over(
+        partition_by=album_label,
+        order_by=(Photo.created_at.desc(), Photo.id.desc())
+    ).label('position')
+    ranked = db.session.query(Photo.id.label('photo_id'), position).filter(
+        Photo.family_id == family_id
+    ).subquery()
+
+    photos = Photo.query.join(ranked, ranked.c.photo_id == Photo.id).filter(
+        ranked.c.position <= per_album
+    ).order_by(Photo.created_at.desc(), Photo.id.desc()).all()
+
+    previews = {}
+    for photo in photos:
+        previews.setdefault(photo.album_name or DEFAULT_ALBUM, []).append(photo)
+    return previews
+
+
+def album_page(family_id, album=None, cursor=None, limit=GALLERY_PAGE_SIZE):
+    """
+    One page of photos, newest first
+
+    Args:
+        album: Album name, or None for every album
+        cursor: Opaque cursor from the previous page
+
+    Returns:
+        tuple: (list of Photo, next cursor or None)
+    """
+    limit = max(1, min(limit, GALLERY_MAX_PAGE_SIZE))
+    query = Photo.query.filter(Photo.family_id == family_id)
+    if album == DEFAULT_ALBUM:
+        query = query.filter(or_(Photo.album_name.is_(None), Photo.album_name == DEFAULT_ALBUM))
+    elif album:
+        query = query.filter(Photo.album_name == album)
+
+    if cursor:
+        created_at, photo_id = decode_cursor(cursor, datetime, int)
+        query = query.filter(or_(
+            Photo.created_at < created_at,
+            and_(Photo.created_at == created_at, Photo.id < photo_id)
+        ))
+
+    photos = query.order_by(Photo.created_at.desc(), Photo.id.desc()).limit(limit + 1).all()
+    if len(photos) > limit:
+        photos = photos[:limit]
+        return photos, encode_cursor(photos[-1].created_at, photos[-1].id)
+    return photos, None
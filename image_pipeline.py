@@ -0,0 +1,196 @@
+# Content-addressed image storage and derivative generation
+# Each upload is stored once under its SHA-256, so duplicate uploads share a
+# file. Resized JPEG and WebP derivatives are produced by a process pool off
+# the request path, and templates pick the smallest one that fits.
+
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_ROOT = os.environ.get('UPLOAD_FOLDER', os.path.join('static', 'uploads'))
+UPLOAD_URL_PREFIX = os.environ.get('UPLOAD_URL_PREFIX', '/static/uploads')
+IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', '0')) or None
+
+CHUNK_SIZE = 1024 * 1024
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic', '.bmp'}
+
+# Derivative name -> longest edge in pixels, smallest first
+DERIVATIVES = {'thumb': 256, 'medium': 1024}
+
+_HASHED_URL = re.compile(r'^(?P<dir>.*/)(?P<digest>[0-9a-f]{64})(?P<ext>\.[A-Za-z0-9]+)$')
+
+_executor = None
+_executor_lock = threading.Lock()
+_variant_cache = {}
+
+
+def _storage_path(digest, suffix):
+    return os.path.join(UPLOAD_ROOT, digest[:2], f'{digest}{suffix}')
+
+
+def _storage_url(digest, suffix):
+    return f'{UPLOAD_URL_PREFIX}/{digest[:2]}/{digest}{suffix}'
+
+
+def image_extension(filename):
+    """
+    Lower-cased extension of an uploaded image's filename
+
+    Raises:
+        ValueError: The extension is not in IMAGE_EXTENSIONS; anything else
+            (HTML, SVG, scripts) would be served from our origin as-is
+    """
+    ext = os.path.splitext(filename or '')[1].lower()
+    if ext not in IMAGE_EXTENSIONS:
+        raise ValueError(f"Unsupported file type '{ext or filename}'; allowed: {', '.join(sorted(IMAGE_EXTENSIONS))}")
+    return ext
+
+
+def save_content_addressed(file, schedule=True):
+    """
+    Stream an uploaded file to storage under its content hash
+
+    Args:
+        file: Werkzeug FileStorage (or any object with .stream/.filename)
+        schedule: Queue derivative generation for new images
+
+    Returns:
+        tuple: (url, digest, size in bytes)
+
+    Raises:
+        ValueError: The file is not an allowed image type
+    """
+    ext = image_extension(file.filename)
+    os.makedirs(UPLOAD_ROOT, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+
+    fd, tmp_path = tempfile.mkstemp(dir=UPLOAD_ROOT, prefix='.upload-')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            stream = getattr(file, 'stream', file)
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+        return store_file(tmp_path, digest.hexdigest(), ext, size, schedule=schedule)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def store_file(tmp_path, digest, ext, size, schedule=True):
+    """Move an already-hashed temporary file into content-addressed storage"""
+    if ext not in IMAGE_EXTENSIONS:
+        raise ValueError(f"Unsupported file type '{ext}'")
+    final_path = _storage_path(digest, ext)
+    if os.path.exists(final_path):
+        logger.info(f"Duplicate upload {digest[:12]} reused existing file")
+    else:
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        os.replace(tmp_path, final_path)
+        if schedule:
+            schedule_derivatives(final_path)
+    return _storage_url(digest, ext), digest, size
+
+
+def generate_derivatives(path):
+    """
+    Write resized JPEG and WebP copies of an image next to the original
+
+    Runs in worker processes; existing derivatives are left alone.
+
+    Returns:
+        list: Paths written
+    """
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        logger.warning("Pillow is not installed; skipping image derivatives")
+        return []
+
+    base = os.path.splitext(path)[0]
+    targets = {
+        name: (f'{base}_{name}.jpg', f'{base}_{name}.webp')
+        for name in DERIVATIVES
+    }
+    if all(os.path.exists(p) for pair in targets.values() for p in pair):
+        return []
+
+    written = []
+    with Image.open(path) as source:
+        image = ImageOps.exif_transpose(source).convert('RGB')
+        for name, edge in DERIVATIVES.items():
+            resized = image.copy()
+            resized.thumbnail((edge, edge), Image.LANCZOS)
+            jpeg_path, webp_path = targets[name]
+            for target, fmt, options in ((jpeg_path, 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+                                         (webp_path, 'WEBP', {'quality': 80, 'method': 4})):
+                if os.path.exists(target):
+                    continue
+                tmp_target = f'{target}.tmp'
+                resized.save(tmp_target, fmt, **options)
+                os.replace(tmp_target, target)
+                written.append(target)
+    return written
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                # Imported here: it pulls in multiprocessing, which workers
+                # that never receive an upload do not need at boot
+                from concurrent.futures import ProcessPoolExecutor
+                _executor = ProcessPoolExecutor(max_workers=IMAGE_WORKERS)
+    return _executor
+
+
+def _log_result(future):
+    try:
+        future.result()
+    except Exception as e:
+        logger.error(f"Image derivative generation failed: {e}")
+
+
+def schedule_derivatives(path):
+    """Queue derivative generation in the process pool and return immediately"""
+    future = _get_executor().submit(generate_derivatives, path)
+    future.add_done_callback(_log_result)
+    return future
+
+
+def image_variant(url, width=DERIVATIVES['thumb'], webp=False):
+    """
+    URL of the smallest derivative at least `width` pixels wide
+
+    Falls back to the original when the image is not content-addressed, is
+    larger than every derivative, or its derivatives are not ready yet.
+    Registered as a Jinja global for templates.
+    """
+    match = _HASHED_URL.match(url or '')
+    if not match:
+        return url
+    for name, edge in DERIVATIVES.items():
+        if edge < width:
+            continue
+        suffix = f'_{name}.webp' if webp else f'_{name}.jpg'
+        key = (match['digest'], suffix)
+        if not _variant_cache.get(key):
+            # Only successes are remembered; missing files are re-checked
+            if len(_variant_cache) > 100000:
+                _variant_cache.clear()
+            _variant_cache[key] = os.path.exists(_storage_path(match['digest'], suffix))
+        if _variant_cache[key]:
+            return f"{match['dir']}{match['digest']}{suffix}"
+        break
+    return url
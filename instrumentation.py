@@ -0,0 +1,243 @@
+# Request and SQL instrumentation
+# Engine event hooks count and time every query per request, slow queries are
+# logged with their route, and statements repeated many times in one request
+# are flagged as likely N+1 lazy loads. Per-route latency histograms and query
+# counts are kept in memory and rendered in the Prometheus text format.
+# Setting PROFILE_SAMPLE_RATE profiles a fraction of requests with cProfile.
+
+import os
+import time
+import random
+import io
+import logging
+import threading
+from collections import Counter
+
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app import app
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '200'))
+NPLUSONE_THRESHOLD = int(os.environ.get('NPLUSONE_THRESHOLD', '5'))
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_DIR = os.environ.get('PROFILE_DIR')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250)
+
+
+def _route_label():
+    rule = request.url_rule
+    return rule.rule if rule is not None else 'unmatched'
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class RequestMetrics:
+    """Thread-safe per-route request, latency and query figures"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = {}
+        self.queries = {}
+        self.query_seconds = Counter()
+        self.slow_queries = Counter()
+        self.nplusone = Counter()
+        self.responses = Counter()
+
+    def record_request(self, route, method, status, seconds, query_count, query_seconds):
+        with self._lock:
+            self.latency.setdefault(route, Histogram(LATENCY_BUCKETS)).observe(seconds)
+            self.queries.setdefault(route, Histogram(QUERY_COUNT_BUCKETS)).observe(query_count)
+            self.query_seconds[route] += query_seconds
+            self.responses[(route, method, status)] += 1
+
+    def record_slow_query(self, route):
+        with self._lock:
+            self.slow_queries[route] += 1
+
+    def record_nplusone(self, route):
+        with self._lock:
+            self.nplusone[route] += 1
+
+
+metrics = RequestMetrics()
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('query_start_time')
+    if not starts:
+        return
+    started = starts.pop()
+    elapsed = time.perf_counter() - started
+    if not has_request_context() or 'sql_count' not in g:
+        return
+
+    g.sql_count += 1
+    g.sql_time += elapsed
+    g.sql_statements[statement] += 1
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        route = _route_label()
+        metrics.record_slow_query(route)
+        logger.warning(f"Slow query ({elapsed * 1000:.0f} ms) in {request.method} {route}: {' '.join(statement.split())[:500]}")
+
+
+@event.listens_for(Engine, 'handle_error')
+def _discard_failed_query(context):
+    # after_cursor_execute does not run for a statement that raises; a
+    # connection runs one statement at a time, so nothing else is pending
+    if context.connection is not None:
+        context.connection.info.pop('query_start_time', None)
+
+
+_profiler_lock = threading.Lock()
+
+
+@app.before_request
+def _start_request_instrumentation():
+    g.request_started = time.perf_counter()
+    g.sql_count = 0
+    g.sql_time = 0.0
+    g.sql_statements = Counter()
+
+    # Only one profiler can be active per process, so sampled requests never overlap
+    if PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE and _profiler_lock.acquire(blocking=False):
+        import cProfile  # only sampled requests need the profiler
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            g.profiler = profiler
+        except ValueError:
+            _profiler_lock.release()
+
+
+def _finish_profile(route):
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        return
+    try:
+        profiler.disable()
+        if PROFILE_DIR:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            name = route.strip('/').replace('/', '_').replace('<', '').replace('>', '') or 'index'
+            profiler.dump_stats(os.path.join(PROFILE_DIR, f'{name}-{int(time.time() * 1000)}.prof'))
+        import pstats
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(15)
+        logger.info(f"Profile for {request.method} {route}:\n{out.getvalue()}")
+    finally:
+        _profiler_lock.release()
+
+
+@app.teardown_request
+def _stop_abandoned_profile(exc):
+    # after_request is skipped when a view raises; without this the profiler
+    # would stay enabled and the lock held for the life of the process
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        try:
+            profiler.disable()
+        finally:
+            _profiler_lock.release()
+
+
+@app.after_request
+def _finish_request_instrumentation(response):
+    if 'request_started' not in g:
+        return response
+    elapsed = time.perf_counter() - g.request_started
+    route = _route_label()
+    _finish_profile(route)
+
+    metrics.record_request(route, request.method, response.status_code, elapsed, g.sql_count, g.sql_time)
+    repeated = [(statement, n) for statement, n in g.sql_statements.items() if n >= NPLUSONE_THRESHOLD]
+    if repeated:
+        metrics.record_nplusone(route)
+        for statement, n in repeated:
+            logger.warning(f"Possible N+1 in {request.method} {route}: {n}x {' '.join(statement.split())[:300]}")
+
+    response.headers['Server-Timing'] = (
+        f'db;dur={g.sql_time * 1000:.1f};desc="{g.sql_count} queries", app;dur={elapsed * 1000:.1f}'
+    )
+    return response
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + '}'
+
+
+def _histogram_lines(name, histograms):
+    for route, hist in sorted(histograms.items()):
+        for bound, count in zip(hist.buckets, hist.counts):
+            yield f'{name}_bucket{_labels(route=route, le=bound)} {count}'
+        yield f'{name}_bucket{_labels(route=route, le="+Inf")} {hist.count}'
+        yield f'{name}_sum{_labels(route=route)} {hist.sum}'
+        yield f'{name}_count{_labels(route=route)} {hist.count}'
+
+
+def render_metrics(series=None):
+    """
+    Prometheus text exposition of the request metrics
+
+    Args:
+        series: Optional {name: (help, value or {label value: value}, label name)}
+            for figures owned by other subsystems; names ending in _total are
+            exposed as counters, everything else as gauges
+    """
+    lines = []
+    with metrics._lock:
+        lines += ['# HELP http_request_duration_seconds Request latency by route',
+                  '# TYPE http_request_duration_seconds histogram']
+        lines += _histogram_lines('http_request_duration_seconds', metrics.latency)
+        lines += ['# HELP http_request_queries SQL statements issued per request',
+                  '# TYPE http_request_queries histogram']
+        lines += _histogram_lines('http_request_queries', metrics.queries)
+        lines += ['# HELP http_requests_total Responses by route, method and status',
+                  '# TYPE http_requests_total counter']
+        lines += [f'http_requests_total{_labels(route=r, method=m, status=s)} {n}'
+                  for (r, m, s), n in sorted(metrics.responses.items())]
+        for name, help_text, counter in (
+            ('sql_query_seconds_total', 'Time spent in SQL by route', metrics.query_seconds),
+            ('sql_slow_queries_total', f'Queries slower than {SLOW_QUERY_MS:g} ms by route', metrics.slow_queries),
+            ('sql_nplusone_requests_total', 'Requests with repeated identical statements by route', metrics.nplusone),
+        ):
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+            lines += [f'{name}{_labels(route=route)} {value}' for route, value in sorted(counter.items())]
+
+    for name, (help_text, value, label) in (series or {}).items():
+        kind = 'counter' if name.endswith('_total') else 'gauge'
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+        if isinstance(value, dict):
+            lines += [f'{name}{_labels(**{label: key})} {v}' for key, v in sorted(value.items())]
+        else:
+            lines.append(f'{name} {value}')
+    return '\n'.join(lines) + '\n'
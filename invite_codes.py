@@ -0,0 +1,132 @@
+# Invite code allocation and lookup
+# A pool of pre-generated codes, verified free against Family.invite_code in
+# batches, lets family creation and regeneration take a code with a single
+# atomic claim instead of a generate-and-check loop. The pool is refilled by
+# `flask invite-pool-refill` on its own connection, never inside a request;
+# if it runs dry a single code is generated and checked instead. Joins
+# resolve codes through a small TTL cache in front of the unique index.
+
+import os
+import logging
+from datetime import datetime
+
+from sqlalchemy import select
+
+from app import app, db
+from models import Family
+from cache_helper import get_cache
+from schema_helper import register_index
+
+logger = logging.getLogger(__name__)
+
+INVITE_POOL_LOW_WATER = int(os.environ.get('INVITE_POOL_LOW_WATER', '50'))
+INVITE_POOL_BATCH = int(os.environ.get('INVITE_POOL_BATCH', '200'))
+INVITE_LOOKUP_TTL = int(os.environ.get('INVITE_LOOKUP_TTL', '300'))
+
+register_index('ux_family_invite_code', Family.invite_code, unique=True)
+
+
+class InviteCodePool(db.Model):
+    """Pre-generated invite codes known not to be in use"""
+    __tablename__ = 'invite_code_pool'
+
+    code = db.Column(db.String(16), primary_key=True)
+    created_at = db.Column(db.DateTime, default=datetime.now, nullable=False)
+
+
+def refill_pool(batch_size=INVITE_POOL_BATCH):
+    """
+    Generate a batch of codes and store the ones not already taken
+
+    Candidates are checked against families and the pool with one IN query
+    each, so a refill costs a constant number of round trips. The refill runs
+    and commits on its own connection, leaving any session transaction alone.
+
+    Returns:
+        int: Number of codes added
+    """
+    candidates = {Family.generate_invite_code() for _ in range(batch_size)}
+    pool = InviteCodePool.__table__
+    with db.engine.begin() as conn:
+        taken = set(conn.execute(select(Family.invite_code).where(Family.invite_code.in_(candidates))).scalars())
+        taken |= set(conn.execute(select(pool.c.code).where(pool.c.code.in_(candidates))).scalars())
+        fresh = candidates - taken
+        if fresh:
+            now = datetime.now()
+            conn.execute(pool.insert(), [{'code': code, 'created_at': now} for code in fresh])
+    return len(fresh)
+
+
+def _claim_code():
+    """Delete one code from the pool; returns None if another worker won the race or the pool is empty"""
+    row = db.session.query(InviteCodePool.code).order_by(InviteCodePool.created_at).with_for_update(skip_locked=True).first()
+    if row is None:
+        return None
+    deleted = InviteCodePool.query.filter_by(code=row.code).delete(synchronize_session=False)
+    return row.code if deleted else None
+
+
+def _generate_free_code(attempts=10):
+    """Generate and check single codes; the fallback while the pool is empty"""
+    for _ in range(attempts):
+        code = Family.generate_invite_code()
+        in_use = db.session.query(Family.query.filter_by(invite_code=code).exists()).scalar()
+        pooled = db.session.query(InviteCodePool.query.filter_by(code=code).exists()).scalar()
+        if not in_use and not pooled:
+            return code
+    raise RuntimeError('Could not generate a free invite code')
+
+
+def allocate_invite_code():
+    """
+    Take a free invite code from the pool
+
+    The claim is part of the caller's transaction, so it is released again if
+    the caller rolls back, and nothing else is committed. An empty pool falls
+    back to generating one code rather than refilling inside the request.
+    """
+    code = _claim_code()
+    if code is None:
+        logger.warning("Invite code pool is empty; run 'flask invite-pool-refill'")
+        code = _generate_free_code()
+    return code
+
+
+def ensure_pool_level():
+    """Refill the pool if it has dropped below the low-water mark"""
+    if InviteCodePool.query.count() < INVITE_POOL_LOW_WATER:
+        return refill_pool()
+    return 0
+
+
+def _lookup_key(code):
+    return f'invite-code:{code}'
+
+
+def find_family_by_invite_code(code):
+    """Resolve an invite code to its Family, caching the code -> id mapping"""
+    cache = get_cache()
+    family_id = cache.get(_lookup_key(code))
+    if family_id is not None:
+        family = Family.query.get(family_id)
+        if family and family.invite_code == code:
+            return family
+        cache.delete(_lookup_key(code))
+
+    family = Family.query.filter_by(invite_code=code).first()
+    if family:
+        cache.set(_lookup_key(code), family.id, ttl=INVITE_LOOKUP_TTL)
+    return family
+
+
+def forget_invite_code(code):
+    """Drop a retired code from the lookup cache"""
+    if code:
+        get_cache().delete(_lookup_key(code))
+
+
+@app.cli.command('invite-pool-refill')
+def invite_pool_refill_command():
+    """Top up the invite code pool ahead of an onboarding campaign"""
+    added = ensure_pool_level()
+    logger.info(f"Added {added} invite codes to the pool")
@@ -0,0 +1,54 @@
+# Bulk family invites
+# Recipients are parsed from a pasted list or a CSV upload, validated and
+# de-duplicated; the message is rendered once and delivered to every address
+# through the email outbox.
+
+import csv
+import io
+import os
+import re
+
+MAX_BULK_RECIPIENTS = int(os.environ.get('MAX_BULK_RECIPIENTS', '500'))
+
+EMAIL_PATTERN = re.compile(r'^[^@\s,;<>]+@[^@\s,;<>]+\.[A-Za-z]{2,}$')
+
+
+def parse_recipients(text=None, csv_file=None):
+    """
+    Collect candidate addresses from free text and/or a CSV upload
+
+    Any CSV cell containing an '@' is treated as an address, so both a bare
+    list and an exported contacts sheet with a header row work.
+    """
+    candidates = []
+    if text:
+        candidates.extend(re.split(r'[\s,;]+', text))
+    if csv_file:
+        content = csv_file.read()
+        if isinstance(content, bytes):
+            content = content.decode('utf-8-sig', errors='replace')
+        for row in csv.reader(io.StringIO(content)):
+            candidates.extend(cell for cell in row if '@' in cell)
+    return [c.strip().strip('<>"\'') for c in candidates if c.strip()]
+
+
+def validate_recipients(candidates):
+    """
+    Split candidates into valid unique addresses and rejected ones
+
+    Returns:
+        tuple: (valid list in input order, list of {'email', 'error'} dicts)
+    """
+    valid = []
+    rejected = []
+    seen = set()
+    for email in candidates:
+        key = email.lower()
+        if not EMAIL_PATTERN.match(email):
+            rejected.append({'email': email, 'error': 'Invalid email address'})
+        elif key in seen:
+            rejected.append({'email': email, 'error': 'Duplicate address'})
+        else:
+            seen.add(key)
+            valid.append(email)
+    return valid, rejected
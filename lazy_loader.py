@@ -0,0 +1,117 @@
+# Lazy subsystem loading
+# Heavy helper modules (AI, data marketplace, uploads, email and the HTTP
+# client) are imported on first use instead of when routes.py is imported, so
+# workers boot quickly. Once a worker is serving, a background thread imports
+# them anyway so later requests that need one do not pay the cost.
+# LAZY_IMPORTS=0 restores eager imports (useful for comparisons).
+
+import os
+import time
+import logging
+import threading
+import importlib
+
+logger = logging.getLogger(__name__)
+
+LAZY_IMPORTS = os.environ.get('LAZY_IMPORTS', '1') != '0'
+LAZY_WARMUP = os.environ.get('LAZY_WARMUP', '1') != '0'
+WARMUP_DELAY = float(os.environ.get('LAZY_WARMUP_DELAY', '0.5'))
+
+# Imported in this order by the background warm-up
+WARMUP_MODULES = ('requests', 'email_helper', 'upload_helper', 'ai_helper', 'data_marketplace')
+
+_lock = threading.RLock()
+_proxies = {}
+_load_times = {}
+_warmup_pid = None
+
+
+class LazyModule:
+    """Stand-in for a module that is imported on first attribute access"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            with _lock:
+                if self._module is None:
+                    started = time.perf_counter()
+                    module = importlib.import_module(self._name)
+                    _load_times.setdefault(self._name, time.perf_counter() - started)
+                    self._module = module
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f'<lazy module {self._name!r} ({state})>'
+
+
+def lazy_import(name):
+    """Module proxy for `name`; the real import happens on first use"""
+    with _lock:
+        proxy = _proxies.get(name)
+        if proxy is None:
+            proxy = _proxies[name] = LazyModule(name)
+    if not LAZY_IMPORTS:
+        proxy._load()
+    return proxy
+
+
+def lazy_functions(module_name, *names):
+    """
+    Callables that forward to module_name.<name>, importing the module on first call
+
+    Usage mirrors a from-import:
+        send_invite, render = lazy_functions('email_helper', 'send_invite', 'render')
+    """
+    module = lazy_import(module_name)
+
+    def make(name):
+        def call(*args, **kwargs):
+            return getattr(module, name)(*args, **kwargs)
+        call.__name__ = call.__qualname__ = name
+        call.__module__ = module_name
+        return call
+
+    functions = tuple(make(name) for name in names)
+    return functions[0] if len(functions) == 1 else functions
+
+
+def warm_up(names=WARMUP_MODULES):
+    """Import the given lazy modules now, logging (not raising) failures"""
+    for name in names:
+        try:
+            lazy_import(name)._load()
+        except Exception as e:
+            logger.warning(f"Background import of {name} failed: {e}")
+
+
+def start_background_warmup(delay=WARMUP_DELAY):
+    """Warm up the lazy modules in a daemon thread, once per process"""
+    global _warmup_pid
+    # Runs before every request: the unlocked check keeps the common case
+    # lock-free, the locked one settles races between the first requests
+    if _warmup_pid == os.getpid() or not LAZY_WARMUP or not LAZY_IMPORTS:
+        return
+    with _lock:
+        if _warmup_pid == os.getpid():
+            return
+        _warmup_pid = os.getpid()
+
+    def run():
+        time.sleep(delay)
+        started = time.perf_counter()
+        warm_up()
+        logger.info(f"Warmed up lazy modules in {time.perf_counter() - started:.2f}s")
+
+    threading.Thread(target=run, name='lazy-warmup', daemon=True).start()
+
+
+def load_times():
+    """Seconds each lazy module took to import, for modules loaded so far"""
+    return dict(_load_times)
@@ -0,0 +1,281 @@
+# Recurring events
+# Events carry an RRULE-style rule (FREQ, INTERVAL, BYDAY, COUNT, UNTIL) in a
+# side table. Occurrences are never stored: a generator jumps straight to the
+# requested window and yields only the instances inside it. Cached rules and
+# occurrences are keyed on a persisted per-family version that is bumped in
+# the same transaction as any change to a recurring event.
+
+import calendar as _calendar
+import os
+import logging
+from datetime import datetime, time, timedelta
+from types import SimpleNamespace
+
+from sqlalchemy import event as sa_event, inspect
+
+from app import db
+from models import Event
+from cache_helper import get_cache, cache_versions, bump_cache_versions
+from dashboard_helper import snapshot
+
+logger = logging.getLogger(__name__)
+
+RECURRENCE_CACHE_TTL = int(os.environ.get('RECURRENCE_CACHE_TTL', '3600'))
+
+FREQUENCIES = ('DAILY', 'WEEKLY', 'MONTHLY', 'YEARLY')
+WEEKDAYS = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+
+
+class EventRecurrence(db.Model):
+    """Recurrence rule attached to an Event (one rule per event)"""
+    __tablename__ = 'event_recurrences'
+
+    id = db.Column(db.Integer, primary_key=True)
+    event_id = db.Column(db.Integer, db.ForeignKey(Event.id, ondelete='CASCADE'), unique=True, nullable=False)
+    family_id = db.Column(db.Integer, index=True, nullable=False)
+    rule = db.Column(db.String(255), nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+
+class RecurrenceRule:
+    """Parsed form of an RRULE string"""
+
+    def __init__(self, freq, interval=1, byday=None, count=None, until=None):
+        if freq not in FREQUENCIES:
+            raise ValueError(f'Unsupported FREQ: {freq}')
+        if interval < 1:
+            raise ValueError('INTERVAL must be positive')
+        if byday and freq != 'WEEKLY':
+            raise ValueError('BYDAY is only supported with FREQ=WEEKLY')
+        self.freq = freq
+        self.interval = interval
+        self.byday = sorted(set(byday)) if byday else None
+        self.count = count
+        self.until = until
+
+    @classmethod
+    def parse(cls, text):
+        """Parse 'FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,WE;COUNT=10;UNTIL=2026-01-01'"""
+        parts = {}
+        for chunk in text.strip().removeprefix('RRULE:').split(';'):
+            if not chunk:
+                continue
+            key, _, value = chunk.partition('=')
+            parts[key.strip().upper()] = value.strip()
+
+        byday = None
+        if parts.get('BYDAY'):
+            try:
+                byday = [WEEKDAYS.index(day.upper()) for day in parts['BYDAY'].split(',')]
+            except ValueError:
+                raise ValueError(f"Unsupported BYDAY: {parts['BYDAY']}")
+
+        until = _parse_until(parts['UNTIL']) if parts.get('UNTIL') else None
+
+        return cls(
+            freq=parts.get('FREQ', '').upper(),
+            interval=int(parts.get('INTERVAL', 1)),
+            byday=byday,
+            count=int(parts['COUNT']) if parts.get('COUNT') else None,
+            until=until
+        )
+
+
+def _parse_until(value):
+    """
+    UNTIL as a datetime; a bare date includes the whole of that day
+
+    Accepts the RFC 5545 forms (20260101, 20260101T090000, with or without a
+    trailing Z) and ISO dates or datetimes.
+    """
+    text = value.strip().upper().removesuffix('Z')
+    try:
+        if text[:8].isdigit():
+            if len(text) == 8:
+                return datetime.combine(datetime.strptime(text, '%Y%m%d').date(), time.max)
+            return datetime.strptime(text, '%Y%m%dT%H%M%S')
+        if len(text) == 10:
+            return datetime.combine(datetime.fromisoformat(text).date(), time.max)
+        return datetime.fromisoformat(text)
+    except ValueError:
+        raise ValueError(f'Unsupported UNTIL: {value}')
+
+
+def _add_months(dt, months):
+    """Shift by whole months, clamping the day to the end of shorter months"""
+    month_index = dt.month - 1 + months
+    year, month = dt.year + month_index // 12, month_index % 12 + 1
+    day = min(dt.day, _calendar.monthrange(year, month)[1])
+    return dt.replace(year=year, month=month, day=day)
+
+
+def _months_between(start, end):
+    return (end.year - start.year) * 12 + (end.month - start.month)
+
+
+def iter_occurrences(dtstart, rule, window_start, window_end):
+    """
+    Lazily yield occurrences of a rule that fall in [window_start, window_end)
+
+    The first candidate is computed arithmetically from the window start, so
+    the cost is proportional to the window, not to the age of the event.
+    """
+    def in_bounds(occurrence, index):
+        if rule.count is not None and index >= rule.count:
+            return False
+        if rule.until is not None and occurrence > rule.until:
+            return False
+        return True
+
+    if rule.freq == 'WEEKLY' and rule.byday:
+        yield from _iter_weekly_byday(dtstart, rule, window_start, window_end, in_bounds)
+        return
+
+    if rule.freq in ('DAILY', 'WEEKLY'):
+        step = timedelta(days=rule.interval * (7 if rule.freq == 'WEEKLY' else 1))
+        index = max(0, -(-(window_start - dtstart) // step))
+        occurrence = dtstart + index * step
+        while occurrence < window_end and in_bounds(occurrence, index):
+            yield occurrence
+            index += 1
+            occurrence = dtstart + index * step
+        return
+
+    months_per_step = rule.interval * (12 if rule.freq == 'YEARLY' else 1)
+    index = max(0, _months_between(dtstart, window_start) // months_per_step)
+    while True:
+        occurrence = _add_months(dtstart, index * months_per_step)
+        if occurrence >= window_end or not in_bounds(occurrence, index):
+            return
+        if occurrence >= window_start:
+            yield occurrence
+        index += 1
+
+
+def _iter_weekly_byday(dtstart, rule, window_start, window_end, in_bounds):
+    week0 = (dtstart - timedelta(days=dtstart.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
+    offset = dtstart - dtstart.replace(hour=0, minute=0, second=0, microsecond=0)
+    period = timedelta(days=7 * rule.interval)
+    first_week_days = [d for d in rule.byday if d >= dtstart.weekday()]
+
+    week = max(0, (window_start - week0) // period)
+    # Occurrences in earlier periods, needed to honour COUNT
+    index = 0 if week == 0 else len(first_week_days) + (week - 1) * len(rule.byday)
+    while True:
+        period_start = week0 + week * period
+        if period_start >= window_end:
+            return
+        for day in (first_week_days if week == 0 else rule.byday):
+            occurrence = period_start + timedelta(days=day) + offset
+            if not in_bounds(occurrence, index):
+                return
+            index += 1
+            if window_start <= occurrence < window_end:
+                yield occurrence
+        week += 1
+
+
+def _version_scope(family_id):
+    return f'recurrence:{family_id}'
+
+
+def _rules_version(family_id):
+    return cache_versions(_version_scope(family_id))[_version_scope(family_id)]
+
+
+def invalidate_family_recurrences(family_id):
+    """Drop a family's cached rules and occurrences; session writes bump the version themselves"""
+    bump_cache_versions([_version_scope(family_id)])
+
+
+def _is_recurring_change(obj):
+    if isinstance(obj, EventRecurrence):
+        return True
+    if isinstance(obj, Event):
+        return bool(obj.is_recurring) or bool(inspect(obj).attrs.is_recurring.history.deleted)
+    return False
+
+
+@sa_event.listens_for(db.session, 'before_flush')
+def _collect_recurrence_changes(session, flush_context, instances):
+    families = session.info.setdefault('recurrence_families', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if _is_recurring_change(obj) and obj.family_id:
+            families.add(obj.family_id)
+
+
+@sa_event.listens_for(db.session, 'after_flush')
+def _bump_recurrence_versions(session, flush_context):
+    families = session.info.pop('recurrence_families', None)
+    if families:
+        bump_cache_versions([_version_scope(family_id) for family_id in families], session.connection())
+
+
+@sa_event.listens_for(db.session, 'after_rollback')
+def _discard_recurrence_changes(session):
+    session.info.pop('recurrence_families', None)
+
+
+def set_event_recurrence(event, rule_text):
+    """Attach, replace or (with an empty rule) remove an event's recurrence rule"""
+    existing = EventRecurrence.query.filter_by(event_id=event.id).first()
+    if rule_text:
+        RecurrenceRule.parse(rule_text)
+        if existing:
+            existing.rule = rule_text
+        else:
+            db.session.add(EventRecurrence(event_id=event.id, family_id=event.family_id, rule=rule_text))
+    elif existing:
+        db.session.delete(existing)
+
+
+def _family_rules(family_id):
+    """Recurring events of a family with parsed rules, cached per rule version"""
+    cache = get_cache()
+    key = f'recurrence:{family_id}:v{_rules_version(family_id)}:rules'
+    rules = cache.get(key)
+    if rules is None:
+        rows = db.session.query(Event, EventRecurrence.rule).outerjoin(
+            EventRecurrence, EventRecurrence.event_id == Event.id
+        ).filter(
+            Event.family_id == family_id,
+            db.or_(EventRecurrence.id.isnot(None), Event.is_recurring.is_(True))
+        ).all()
+        rules = []
+        for event, rule in rows:
+            # Legacy events only have is_recurring set; treat them as yearly
+            rule = rule or 'FREQ=YEARLY'
+            try:
+                RecurrenceRule.parse(rule)
+            except ValueError as e:
+                # Saved before the rule was validated; the event shows as a one-off
+                logger.warning(f"Ignoring recurrence of event {event.id}: {e}")
+                continue
+            rules.append((snapshot(event), rule))
+        cache.set(key, rules, ttl=RECURRENCE_CACHE_TTL)
+    return rules
+
+
+def recurring_event_ids(family_id):
+    return {event.id for event, _ in _family_rules(family_id)}
+
+
+def expand_occurrences(family_id, start, end):
+    """
+    Return a family's recurring-event occurrences inside [start, end)
+
+    Returns:
+        list: Event snapshots whose event_date is the occurrence date, sorted
+    """
+    cache = get_cache()
+    key = f'recurrence:{family_id}:v{_rules_version(family_id)}:{start.isoformat()}:{end.isoformat()}'
+    occurrences = cache.get(key)
+    if occurrences is None:
+        occurrences = []
+        for event, rule_text in _family_rules(family_id):
+            rule = RecurrenceRule.parse(rule_text)
+            for when in iter_occurrences(event.event_date, rule, start, end):
+                occurrences.append(SimpleNamespace(**dict(vars(event), event_date=when, recurrence_rule=rule_text)))
+        occurrences.sort(key=lambda e: (e.event_date, e.id))
+        cache.set(key, occurrences, ttl=RECURRENCE_CACHE_TTL)
+    return occurrences
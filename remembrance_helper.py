@@ -0,0 +1,92 @@
+# Remembrance wall queries
+# Tributes are read a page at a time with a (created_at, id) keyset cursor and
+# their authors loaded in one batched query. The member header and tribute
+# count are cached and dropped when a tribute is added.
+
+import os
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import load_only, selectinload
+
+from app import db
+from models import Memory, RemembranceMember
+from cache_helper import get_cache
+from dashboard_helper import snapshot
+from schema_helper import register_index, encode_cursor, decode_cursor
+
+TRIBUTE_PAGE_SIZE = int(os.environ.get('TRIBUTE_PAGE_SIZE', '25'))
+TRIBUTE_MAX_PAGE_SIZE = 100
+REMEMBRANCE_HEADER_TTL = int(os.environ.get('REMEMBRANCE_HEADER_TTL', '600'))
+
+# Columns the remembrance wall cards actually render
+CARD_COLUMNS = (
+    RemembranceMember.id,
+    RemembranceMember.family_id,
+    RemembranceMember.name,
+    RemembranceMember.birth_date,
+    RemembranceMember.passing_date,
+    RemembranceMember.role,
+    RemembranceMember.photo_url,
+    RemembranceMember.favorite_quote,
+)
+
+register_index('ix_memory_member_created', Memory.remembrance_member_id, Memory.created_at, Memory.id)
+register_index('ix_remembrance_member_family', RemembranceMember.family_id)
+
+
+def remembrance_cards(family_id):
+    """Remembrance members for the wall, without the long genealogy text columns"""
+    return RemembranceMember.query.options(load_only(*CARD_COLUMNS)).filter_by(
+        family_id=family_id
+    ).order_by(RemembranceMember.id).all()
+
+
+def _header_key(member_id):
+    return f'remembrance:{member_id}:header'
+
+
+def get_member_header(member_id):
+    """
+    Cached member details and tribute count
+
+    Returns:
+        tuple: (member snapshot, tribute count), or (None, 0) if not found
+    """
+    cache = get_cache()
+    header = cache.get(_header_key(member_id))
+    if header is None:
+        member = RemembranceMember.query.get(member_id)
+        if member is None:
+            return None, 0
+        count = db.session.query(db.func.count(Memory.id)).filter(Memory.remembrance_member_id == member_id).scalar()
+        header = (snapshot(member), count)
+        cache.set(_header_key(member_id), header, ttl=REMEMBRANCE_HEADER_TTL)
+    return header
+
+
+def invalidate_member_header(member_id):
+    get_cache().delete(_header_key(member_id))
+
+
+def tribute_page(member_id, cursor=None, limit=TRIBUTE_PAGE_SIZE):
+    """
+    One page of tributes, newest first, with authors preloaded
+
+    Returns:
+        tuple: (list of Memory, next cursor or None)
+    """
+    limit = max(1, min(limit, TRIBUTE_MAX_PAGE_SIZE))
+    query = Memory.query.options(selectinload(Memory.author)).filter(Memory.remembrance_member_id == member_id)
+    if cursor:
+        created_at, memory_id = decode_cursor(cursor, datetime, int)
+        query = query.filter(or_(
+            Memory.created_at < created_at,
+            and_(Memory.created_at == created_at, Memory.id < memory_id)
+        ))
+
+    tributes = query.order_by(Memory.created_at.desc(), Memory.id.desc()).limit(limit + 1).all()
+    if len(tributes) > limit:
+        tributes = tributes[:limit]
+        return tributes, encode_cursor(tributes[-1].created_at, tributes[-1].id)
+    return tributes, None
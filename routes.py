@@ -1,18 +1,61 @@
-from flask import session, render_template, request, redirect, url_for, jsonify, flash
+from flask import session, render_template, request, redirect, url_for, jsonify, flash, Response, abort, send_file, stream_with_context
 from app import app, db
 from replit_auth import require_login, make_replit_blueprint
 from flask_login import current_user
 from models import User, FamilyProfile, Event, Chore, Photo, Memory, RemembranceMember, Message, Family, UserWallet, DataConsent, TokenTransaction, Post, PostLike, PostComment
-from ai_helper import get_family_ai_response, generate_family_tree_insights, suggest_family_activities
-from email_helper import send_family_invite_email
-from data_marketplace import get_or_create_wallet, get_or_create_consent, award_tokens, simulate_data_earnings
-from upload_helper import save_uploaded_file, delete_uploaded_file
+from lazy_loader import lazy_functions, start_background_warmup
+from ai_cache import memoize_ai, stream_answer
+from invite_helper import parse_recipients, validate_recipients, MAX_BULK_RECIPIENTS
+from email_outbox import enqueue_email, get_outbox_metrics
+from invite_codes import allocate_invite_code, find_family_by_invite_code, forget_invite_code
+from token_ledger import LedgerEntry, get_balance
+import earnings_batch  # noqa: F401 - registers 'flask simulate-earnings'
+from image_pipeline import save_content_addressed, image_variant
+from remembrance_helper import remembrance_cards, get_member_header, invalidate_member_header, tribute_page, TRIBUTE_PAGE_SIZE
+from search_helper import index_documents, member_document, memory_document, search, SEARCH_PAGE_SIZE
+from family_graph import PersonNode, add_member_to_graph, family_tree, ancestors, descendants, describe_tree
+from event_stream import publish_family_event, sse_stream, poll_events, stream_metrics
+from chunked_upload import UploadError, create_upload, get_upload, upload_status, write_chunk, finalize_upload, completed_upload_url
+from dashboard_helper import get_dashboard, invalidate_family_dashboard, invalidate_user_dashboard
+from calendar_helper import month_window, parse_window, calendar_events, chores_in_window, undated_chores, chore_to_dict, get_calendar_page, DEFAULT_PAGE_SIZE
+from recurrence_helper import set_event_recurrence
+from schema_helper import ensure_schema, to_json_dict
+from gallery_helper import album_summaries, album_previews, album_page, GALLERY_PAGE_SIZE
+from instrumentation import render_metrics
+from change_feed import changes_since, SYNC_BATCH_SIZE
+from export_helper import spooled_export, stream_export
+from feed_helper import feed_page, set_like, toggle_like, like_count, add_comment, comment_page, FEED_PAGE_SIZE, COMMENT_PAGE_SIZE
 from datetime import datetime, timedelta
 from sqlalchemy import or_
+import json
 import os
 
+# Heavy helpers are imported on first use (and warmed up in the background)
+get_family_ai_response, generate_family_tree_insights, suggest_family_activities = lazy_functions(
+    'ai_helper', 'get_family_ai_response', 'generate_family_tree_insights', 'suggest_family_activities')
+send_family_invite_email, render_family_invite_email, personalize_email = lazy_functions(
+    'email_helper', 'send_family_invite_email', 'render_family_invite_email', 'personalize_email')
+get_or_create_wallet, get_or_create_consent, award_tokens, simulate_data_earnings = lazy_functions(
+    'data_marketplace', 'get_or_create_wallet', 'get_or_create_consent', 'award_tokens', 'simulate_data_earnings')
+save_uploaded_file, delete_uploaded_file = lazy_functions('upload_helper', 'save_uploaded_file', 'delete_uploaded_file')
+
+# Once per process: with a preloading server every forked worker warms itself
+# up, while forked helper processes that never serve requests do not
+app.before_request(start_background_warmup)
+
 app.register_blueprint(make_replit_blueprint(), url_prefix="/auth")
 
+# Create helper-owned tables and indexes
+ensure_schema()
+
+# AI answers are reused until the family's data changes
+get_family_ai_response = memoize_ai(get_family_ai_response)
+generate_family_tree_insights = memoize_ai(generate_family_tree_insights)
+suggest_family_activities = memoize_ai(suggest_family_activities)
+
+# Templates pick the smallest stored image derivative that fits
+app.jinja_env.globals['image_variant'] = image_variant
+
 # Make session permanent
 @app.before_request
 def make_session_permanent():
@@ -29,44 +72,8 @@ def index():
     if not current_user.family_id:
         return redirect(url_for('family_setup'))
     
-    # Get user's profile or create one if it doesn't exist
-    profile = FamilyProfile.query.filter_by(user_id=current_user.id).first()
-    if not profile:
-        profile = FamilyProfile(user_id=current_user.id)
-        db.session.add(profile)
-        db.session.commit()
-    
-    # Get upcoming events (next 30 days) for this family only
-    upcoming_events = Event.query.filter(
-        Event.family_id == current_user.family_id,
-        Event.event_date >= datetime.now(),
-        Event.event_date <= datetime.now() + timedelta(days=30)
-    ).order_by(Event.event_date).limit(5).all()
-    
-    # Get pending chores for this family
-    pending_chores = Chore.query.filter_by(
-        family_id=current_user.family_id,
-        assigned_to=current_user.id,
-        status='pending'
-    ).order_by(Chore.due_date).limit(5).all()
-    
-    # Get unread messages count
-    unread_count = Message.query.filter_by(
-        receiver_id=current_user.id,
-        is_read=False
-    ).count()
-    
-    # Get recent memories for this family only
-    recent_memories = Memory.query.join(RemembranceMember).filter(
-        RemembranceMember.family_id == current_user.family_id
-    ).order_by(Memory.created_at.desc()).limit(3).all()
-    
-    return render_template('home.html',
-                         profile=profile,
-                         upcoming_events=upcoming_events,
-                         pending_chores=pending_chores,
-                         unread_count=unread_count,
-                         recent_memories=recent_memories)
+    # Home page sections are served from the dashboard cache
+    return render_template('home.html', **get_dashboard(current_user))
 
 
 @app.route('/family/setup', methods=['GET', 'POST'])
@@ -87,10 +94,8 @@ def family_setup():
                 flash('Family surname is required!', 'error')
                 return redirect(url_for('family_setup'))
             
-            # Generate unique invite code
-            invite_code = Family.generate_invite_code()
-            while Family.query.filter_by(invite_code=invite_code).first():
-                invite_code = Family.generate_invite_code()
+            # Take a pre-verified unique invite code from the pool
+            invite_code = allocate_invite_code()
             
             # Create new family
             family = Family(
@@ -117,7 +122,7 @@ def family_setup():
                 flash('Invite code is required!', 'error')
                 return redirect(url_for('family_setup'))
             
-            family = Family.query.filter_by(invite_code=invite_code).first()
+            family = find_family_by_invite_code(invite_code)
             
             if not family:
                 flash('Invalid invite code!', 'error')
@@ -156,13 +161,13 @@ def regenerate_invite():
     
     family = Family.query.get(current_user.family_id)
     
-    # Generate new unique invite code
-    new_code = Family.generate_invite_code()
-    while Family.query.filter_by(invite_code=new_code).first():
-        new_code = Family.generate_invite_code()
+    # Take a pre-verified unique invite code from the pool
+    new_code = allocate_invite_code()
+    old_code = family.invite_code
     
     family.invite_code = new_code
     db.session.commit()
+    forget_invite_code(old_code)
     
     flash(f'New invite code generated: {new_code}', 'success')
     return redirect(url_for('manage_family'))
@@ -183,26 +188,69 @@ def send_invite():
         flash('Please provide a recipient email address.', 'error')
         return redirect(url_for('manage_family'))
     
-    try:
-        # Get the app URL
-        app_url = request.url_root.rstrip('/')
-        
-        # Get inviter name
-        inviter_name = current_user.first_name or 'A family member'
-        
-        # Send the invite email
-        send_family_invite_email(
-            recipient_email=recipient_email,
-            family_name=family.surname,
-            invite_code=family.invite_code,
-            inviter_name=inviter_name,
-            app_url=app_url
-        )
-        
-        flash(f'Invite sent to {recipient_email}!', 'success')
-    except Exception as e:
-        flash(f'Failed to send invite: {str(e)}', 'error')
+    # Queue the invite; the outbox workers deliver it in the background
+    message = render_family_invite_email(
+        family_name=family.surname,
+        invite_code=family.invite_code,
+        inviter_name=current_user.first_name or 'A family member',
+        app_url=request.url_root.rstrip('/'),
+        recipient_email=recipient_email
+    )
+    enqueue_email(recipient_email, message['subject'], message['html'], message['text'])
+    
+    flash(f'Invite to {recipient_email} is on its way!', 'success')
+    return redirect(url_for('manage_family'))
+
+
+@app.route('/family/send-invites', methods=['POST'])
+@require_login
+def send_bulk_invites():
+    """Queue family invites to many addresses (pasted list or CSV upload)"""
+    wants_json = request.args.get('format') == 'json' or request.accept_mimetypes.best == 'application/json'
+    
+    if not current_user.family_id:
+        if wants_json:
+            return jsonify({'success': False, 'error': 'No family'}), 400
+        flash('You must be part of a family to send invites.', 'error')
+        return redirect(url_for('family_setup'))
+    
+    candidates = parse_recipients(
+        text=request.form.get('recipient_emails', ''),
+        csv_file=request.files.get('recipients_csv')
+    )
+    recipients, rejected = validate_recipients(candidates)
+    
+    if len(recipients) > MAX_BULK_RECIPIENTS:
+        error = f'Please send at most {MAX_BULK_RECIPIENTS} invites at a time.'
+        if wants_json:
+            return jsonify({'success': False, 'error': error}), 400
+        flash(error, 'error')
+        return redirect(url_for('manage_family'))
     
+    family = Family.query.get(current_user.family_id)
+    message = render_family_invite_email(
+        family_name=family.surname,
+        invite_code=family.invite_code,
+        inviter_name=current_user.first_name or 'A family member',
+        app_url=request.url_root.rstrip('/')
+    )
+    # Queue every invite in one transaction; the outbox workers deliver them
+    for email in recipients:
+        personalized = personalize_email(message, email)
+        enqueue_email(email, personalized['subject'], personalized['html'], personalized['text'], commit=False)
+    db.session.commit()
+    
+    if wants_json:
+        return jsonify({
+            'success': True,
+            'queued': len(recipients),
+            'recipients': recipients,
+            'rejected': rejected
+        }), 202
+    
+    flash(f'{len(recipients)} invite(s) are on their way!', 'success')
+    if rejected:
+        flash(f'Skipped {len(rejected)} invalid or duplicate address(es).', 'warning')
     return redirect(url_for('manage_family'))
 
 
@@ -256,6 +304,7 @@ def edit_profile():
         profile.legacy_impact_on_family = request.form.get('legacy_impact_on_family')
         
         db.session.commit()
+        invalidate_user_dashboard(current_user.id, 'profile')
         flash('Profile updated successfully!', 'success')
         return redirect(url_for('view_profile', user_id=current_user.id))
     
@@ -281,10 +330,56 @@ def calendar():
     if not current_user.family_id:
         return redirect(url_for('family_setup'))
     
-    events = Event.query.filter_by(family_id=current_user.family_id).order_by(Event.event_date).all()
-    chores = Chore.query.filter_by(family_id=current_user.family_id).order_by(Chore.due_date).all()
+    # Only load the month being viewed
+    try:
+        start, end = month_window(request.args.get('month'))
+    except ValueError:
+        start, end = month_window()
     
-    return render_template('calendar.html', events=events, chores=chores)
+    events = calendar_events(current_user.family_id, start, end)
+    chores = chores_in_window(current_user.family_id, start, end).all()
+    undated = undated_chores(current_user.family_id).all()
+    
+    # Chores without a due date show in every month, as they did before windowing
+    return render_template('calendar.html',
+                         events=events,
+                         chores=chores + undated,
+                         undated_chores=undated,
+                         month=start,
+                         prev_month=(start - timedelta(days=1)).strftime('%Y-%m'),
+                         next_month=end.strftime('%Y-%m'))
+
+
+@app.route('/api/calendar')
+@require_login
+def calendar_api():
+    """Paginated calendar items (events and chores) for a date window"""
+    if not current_user.family_id:
+        return jsonify({'success': False, 'error': 'No family'}), 400
+    
+    try:
+        start, end = parse_window(request.args.get('start'), request.args.get('end'))
+        page = get_calendar_page(
+            current_user.family_id, start, end,
+            cursor=request.args.get('cursor'),
+            limit=request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    # Undated chores fall outside every window; send them with the first page
+    undated = [] if request.args.get('cursor') else [
+        chore_to_dict(chore) for chore in undated_chores(current_user.family_id)
+    ]
+    
+    return jsonify({
+        'success': True,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'items': page['items'],
+        'undated': undated,
+        'next_cursor': page['next_cursor']
+    })
 
 
 @app.route('/event/create', methods=['GET', 'POST'])
@@ -311,7 +406,22 @@ def create_event():
             is_recurring=request.form.get('is_recurring') == 'on'
         )
         db.session.add(event)
+        
+        # Recurring events keep an RRULE; a bare checkbox means yearly
+        recurrence_rule = request.form.get('recurrence_rule', '').strip()
+        if event.is_recurring or recurrence_rule:
+            db.session.flush()
+            try:
+                set_event_recurrence(event, recurrence_rule or 'FREQ=YEARLY')
+            except ValueError as e:
+                db.session.rollback()
+                flash(f'Invalid recurrence rule: {e}', 'error')
+                return redirect(url_for('create_event'))
+            event.is_recurring = True
+        
         db.session.commit()
+        invalidate_family_dashboard(current_user.family_id, 'events')
+        publish_family_event(current_user.family_id, 'event_created', event_id=event.id)
         flash('Event created successfully!', 'success')
         return redirect(url_for('calendar'))
     
@@ -336,6 +446,8 @@ def create_chore():
         )
         db.session.add(chore)
         db.session.commit()
+        invalidate_user_dashboard(chore.assigned_to, 'chores')
+        publish_family_event(current_user.family_id, 'chore_created', chore_id=chore.id, assigned_to=chore.assigned_to)
         flash('Chore created successfully!', 'success')
         return redirect(url_for('calendar'))
     
@@ -356,6 +468,8 @@ def update_chore_status(chore_id):
     if chore.assigned_to == current_user.id:
         chore.status = request.form.get('status', 'pending')
         db.session.commit()
+        invalidate_user_dashboard(chore.assigned_to, 'chores')
+        publish_family_event(chore.family_id, 'chore_updated', chore_id=chore.id, status=chore.status)
         return jsonify({'success': True})
     
     return jsonify({'success': False, 'error': 'Not authorized'}), 403
@@ -368,7 +482,7 @@ def remembrance():
     if not current_user.family_id:
         return redirect(url_for('family_setup'))
     
-    remembered_members = RemembranceMember.query.filter_by(family_id=current_user.family_id).all()
+    remembered_members = remembrance_cards(current_user.family_id)
     return render_template('remembrance.html', remembered_members=remembered_members)
 
 
@@ -376,15 +490,82 @@ def remembrance():
 @require_login
 def remembrance_detail(member_id):
     """Detailed memorial page with memories"""
-    member = RemembranceMember.query.get_or_404(member_id)
+    member, tribute_count = get_member_header(member_id)
+    if member is None:
+        abort(404)
     
     # Security: Only allow viewing remembrance members within the same family
     if member.family_id != current_user.family_id:
         flash('You can only view remembrance pages within your own family.', 'error')
         return redirect(url_for('remembrance'))
     
-    tributes = Memory.query.filter_by(remembrance_member_id=member_id).order_by(Memory.created_at.desc()).all()
-    return render_template('remembrance_detail.html', member=member, tributes=tributes)
+    try:
+        tributes, next_cursor = tribute_page(member_id, cursor=request.args.get('before'))
+    except ValueError:
+        return redirect(url_for('remembrance_detail', member_id=member_id))
+    
+    return render_template('remembrance_detail.html',
+                         member=member,
+                         tributes=tributes,
+                         tribute_count=tribute_count,
+                         next_cursor=next_cursor)
+
+
+@app.route('/api/remembrance/<int:member_id>/tributes')
+@require_login
+def remembrance_tributes_api(member_id):
+    """Keyset-paginated tributes for a remembrance member"""
+    member, _ = get_member_header(member_id)
+    
+    # Security: Only allow viewing remembrance members within the same family
+    if member is None or member.family_id != current_user.family_id:
+        return jsonify({'success': False, 'error': 'Not found'}), 404
+    
+    try:
+        tributes, next_cursor = tribute_page(
+            member_id,
+            cursor=request.args.get('cursor'),
+            limit=request.args.get('limit', TRIBUTE_PAGE_SIZE, type=int)
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    return jsonify({
+        'success': True,
+        'tributes': [
+            dict(to_json_dict(tribute), author_name=tribute.author.first_name if tribute.author else None)
+            for tribute in tributes
+        ],
+        'next_cursor': next_cursor
+    })
+
+
+@app.route('/api/family-tree')
+@require_login
+def family_tree_api():
+    """The family's relationship graph with generation numbers"""
+    if not current_user.family_id:
+        return jsonify({'success': False, 'error': 'No family'}), 400
+    return jsonify(dict(family_tree(current_user.family_id), success=True))
+
+
+@app.route('/api/family-tree/<int:node_id>/<any(ancestors, descendants):direction>')
+@require_login
+def family_tree_lineage_api(node_id, direction):
+    """All ancestors or descendants of one person"""
+    node = PersonNode.query.get_or_404(node_id)
+    
+    # Security: Only allow viewing trees within the same family
+    if node.family_id != current_user.family_id:
+        return jsonify({'success': False, 'error': 'Not authorized'}), 403
+    
+    lookup = ancestors if direction == 'ancestors' else descendants
+    people = lookup(node_id, max_depth=request.args.get('max_depth', type=int))
+    return jsonify({
+        'success': True,
+        'person': {'id': node.id, 'name': node.name},
+        direction: [{'id': person.id, 'name': person.name, 'generations': depth} for person, depth in people]
+    })
 
 
 @app.route('/remembrance/add', methods=['POST'])
@@ -411,10 +592,17 @@ def add_remembrance_member():
     
     # Handle photo upload
     photo_url = None
-    if 'photo' in request.files:
+    if request.form.get('upload_id'):
+        # Photo sent earlier through the resumable upload API
+        photo_url = completed_upload_url(request.form.get('upload_id'), current_user)
+    elif 'photo' in request.files:
         file = request.files['photo']
         if file and file.filename:
-            photo_url, _, _ = save_uploaded_file(file)
+            try:
+                photo_url, _, _ = save_content_addressed(file)
+            except ValueError as e:
+                flash(f'❌ {e}', 'error')
+                return redirect(url_for('remembrance'))
     
     member = RemembranceMember(
         family_id=current_user.family_id,
@@ -447,6 +635,9 @@ def add_remembrance_member():
     )
     
     db.session.add(member)
+    db.session.flush()
+    index_documents([member_document(member)])
+    add_member_to_graph(member)
     db.session.commit()
     
     flash(f'✅ {name} has been added to the remembrance wall', 'success')
@@ -472,7 +663,12 @@ def add_memory(member_id):
         memory_date=datetime.fromisoformat(request.form.get('memory_date')) if request.form.get('memory_date') else None
     )
     db.session.add(memory)
+    db.session.flush()
+    index_documents([memory_document(memory, member.family_id)])
     db.session.commit()
+    invalidate_family_dashboard(member.family_id, 'memories')
+    invalidate_member_header(member_id)
+    publish_family_event(member.family_id, 'tribute_added', remembrance_member_id=member_id, memory_id=memory.id)
     flash('Memory shared successfully!', 'success')
     return redirect(url_for('remembrance_detail', member_id=member_id))
 
@@ -501,11 +697,40 @@ def add_remembrance_tribute(member_id):
         memory_date=None
     )
     db.session.add(memory)
+    db.session.flush()
+    index_documents([memory_document(memory, member.family_id)])
     db.session.commit()
+    invalidate_family_dashboard(member.family_id, 'memories')
+    invalidate_member_header(member_id)
+    publish_family_event(member.family_id, 'tribute_added', remembrance_member_id=member_id, memory_id=memory.id)
     flash('🕊️ Tribute shared successfully!', 'success')
     return redirect(url_for('remembrance_detail', member_id=member_id))
 
 
+@app.route('/api/search')
+@require_login
+def search_api():
+    """Ranked full-text search across the family's stories, tributes, posts and messages"""
+    if not current_user.family_id:
+        return jsonify({'success': False, 'error': 'No family'}), 400
+    
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'success': True, 'results': [], 'next_cursor': None, 'has_more': False})
+    
+    try:
+        results = search(
+            current_user.family_id,
+            current_user.id,
+            query,
+            cursor=request.args.get('cursor'),
+            per_page=request.args.get('per_page', SEARCH_PAGE_SIZE, type=int)
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify(dict(results, success=True))
+
+
 @app.route('/photos')
 @require_login
 def photos():
@@ -513,18 +738,339 @@ def photos():
     if not current_user.family_id:
         return redirect(url_for('family_setup'))
     
-    all_photos = Photo.query.filter_by(family_id=current_user.family_id).order_by(Photo.created_at.desc()).all()
+    # Album counts and the first few photos of each album come from the database
+    album_info = album_summaries(current_user.family_id)
+    previews = album_previews(current_user.family_id)
+    albums = {name: previews.get(name, []) for name in album_info}
+    
+    return render_template('photos.html', albums=albums, album_info=album_info)
+
+
+@app.route('/api/photos')
+@require_login
+def photos_api():
+    """Keyset-paginated photos, optionally limited to one album"""
+    if not current_user.family_id:
+        return jsonify({'success': False, 'error': 'No family'}), 400
+    
+    try:
+        page, next_cursor = album_page(
+            current_user.family_id,
+            album=request.args.get('album'),
+            cursor=request.args.get('cursor'),
+            limit=request.args.get('limit', GALLERY_PAGE_SIZE, type=int)
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    return jsonify({
+        'success': True,
+        'photos': [to_json_dict(photo) for photo in page],
+        'next_cursor': next_cursor
+    })
+
+
+@app.route('/api/events/stream')
+@require_login
+def family_event_stream():
+    """Server-Sent Events feed of family activity"""
+    if not current_user.family_id:
+        return jsonify({'success': False, 'error': 'No family'}), 400
+    
+    last_event_id = request.headers.get('Last-Event-ID', request.args.get('last_event_id'))
+    return Response(
+        sse_stream(current_user.family_id, int(last_event_id) if last_event_id and last_event_id.isdigit() else None),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@app.route('/api/events/poll')
+@require_login
+def family_event_poll():
+    """Long-poll fallback for clients without EventSource"""
+    if not current_user.family_id:
+        return jsonify({'success': False, 'error': 'No family'}), 400
+    
+    since = request.args.get('since', 0, type=int)
+    timeout = max(0, min(request.args.get('timeout', 25, type=float), 55))
+    events = poll_events(current_user.family_id, since, timeout=timeout)
+    return jsonify({
+        'success': True,
+        'events': events,
+        'last_event_id': events[-1]['id'] if events else since
+    })
+
+
+@app.route('/api/ai/ask/stream', methods=['POST'])
+@require_login
+def ai_ask_stream():
+    """Stream the family assistant's answer as Server-Sent Events"""
+    if not current_user.family_id:
+        return jsonify({'success': False, 'error': 'No family'}), 400
+    
+    question = ((request.get_json(silent=True) or {}).get('question') or request.form.get('question', '')).strip()
+    if not question:
+        return jsonify({'success': False, 'error': 'Please ask a question.'}), 400
+    
+    family = Family.query.get(current_user.family_id)
+    messages = [
+        {'role': 'system', 'content': (
+            f'You are a warm, helpful assistant for the {family.surname} family. '
+            f'Known family tree:\n{describe_tree(family.id) or "(not recorded yet)"}'
+        )},
+        {'role': 'user', 'content': question}
+    ]
+    
+    def generate(family_id):
+        try:
+            for delta in stream_answer(family_id, messages):
+                yield f'data: {json.dumps({"delta": delta})}\n\n'
+            yield 'event: done\ndata: {}\n\n'
+        except Exception as e:
+            yield f'event: error\ndata: {json.dumps({"error": str(e)})}\n\n'
+    
+    return Response(
+        generate(current_user.family_id),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@app.route('/api/uploads', methods=['POST'])
+@require_login
+def start_upload():
+    """Open a resumable chunked upload"""
+    data = request.get_json(silent=True) or {}
+    try:
+        upload = create_upload(
+            current_user,
+            filename=data.get('filename'),
+            total_size=data.get('size'),
+            chunk_size=data.get('chunk_size'),
+            sha256=data.get('sha256')
+        )
+    except UploadError as e:
+        return jsonify({'success': False, 'error': str(e)}), e.status
+    return jsonify(dict(upload_status(upload), success=True)), 201
+
+
+@app.route('/api/uploads/<upload_id>')
+@require_login
+def upload_progress(upload_id):
+    """Which chunks have arrived, so an interrupted upload can resume"""
+    try:
+        upload = get_upload(upload_id, current_user)
+    except UploadError as e:
+        return jsonify({'success': False, 'error': str(e)}), e.status
+    return jsonify(dict(upload_status(upload), success=True))
+
+
+@app.route('/api/uploads/<upload_id>/chunks/<int:index>', methods=['PUT'])
+@require_login
+def upload_chunk(upload_id, index):
+    """Receive one chunk as the raw request body"""
+    try:
+        upload = get_upload(upload_id, current_user)
+        write_chunk(upload, index, request.stream, request.headers.get('X-Chunk-SHA256'))
+    except UploadError as e:
+        return jsonify({'success': False, 'error': str(e)}), e.status
+    return jsonify({'success': True, 'index': index})
+
+
+@app.route('/api/uploads/<upload_id>/finalize', methods=['POST'])
+@require_login
+def finalize_chunked_upload(upload_id):
+    """Assemble a completed upload and optionally attach it to a remembrance member"""
+    data = request.get_json(silent=True) or {}
+    try:
+        upload = get_upload(upload_id, current_user)
+        url = finalize_upload(upload)
+    except UploadError as e:
+        return jsonify({'success': False, 'error': str(e)}), e.status
+    
+    member_id = data.get('remembrance_member_id')
+    if member_id:
+        member = RemembranceMember.query.get(member_id)
+        # Security: Only allow updating remembrance members within the same family
+        if not member or member.family_id != current_user.family_id:
+            return jsonify({'success': False, 'error': 'Not authorized'}), 403
+        member.photo_url = url
+        db.session.commit()
+        invalidate_member_header(member.id)
+    
+    return jsonify({'success': True, 'upload_id': upload.id, 'url': url})
+
+
+@app.route('/family/export')
+@require_login
+def export_family_archive():
+    """Download the family's history as a ZIP of NDJSON tables and photos"""
+    if not current_user.family_id:
+        return redirect(url_for('family_setup'))
+    
+    family = Family.query.get(current_user.family_id)
+    download_name = f"{family.surname or 'family'}-archive-{datetime.now().strftime('%Y%m%d')}.zip"
+    
+    # A finished archive on disk supports Range requests, so interrupted downloads resume
+    path = spooled_export(current_user.family_id, current_user.id)
+    if path:
+        return send_file(path, mimetype='application/zip', as_attachment=True,
+                         download_name=download_name, conditional=True, max_age=0)
     
-    # Group photos by album
-    albums = {}
-    for photo in all_photos:
-        album_name = photo.album_name or 'General'
-        if album_name not in albums:
-            albums[album_name] = []
-        albums[album_name].append(photo)
+    # First download: stream while spooling (any Range header gets a full 200)
+    return Response(
+        stream_with_context(stream_export(current_user.family_id, current_user.id)),
+        mimetype='application/zip',
+        headers={
+            'Content-Disposition': f'attachment; filename="{download_name}"',
+            'Cache-Control': 'no-store',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+
+@app.route('/api/feed')
+@require_login
+def feed_api():
+    """Keyset-paginated family feed with like/comment counts and the viewer's likes"""
+    if not current_user.family_id:
+        return jsonify({'success': False, 'error': 'No family'}), 400
     
+    try:
+        posts, next_cursor = feed_page(
+            current_user.family_id,
+            current_user.id,
+            cursor=request.args.get('cursor'),
+            limit=request.args.get('limit', FEED_PAGE_SIZE, type=int)
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    return jsonify({'success': True, 'posts': posts, 'next_cursor': next_cursor})
+
+
+def _family_post_or_404(post_id):
+    post = Post.query.get_or_404(post_id)
+    # Security: Only allow access to posts within the same family
+    if post.family_id != current_user.family_id:
+        abort(403)
+    return post
+
+
+@app.route('/api/posts/<int:post_id>/like', methods=['POST'])
+@require_login
+def like_post(post_id):
+    """Toggle a like, or set it explicitly with {"liked": true|false}"""
+    post = _family_post_or_404(post_id)
+    data = request.get_json(silent=True) or {}
+    
+    if 'liked' in data:
+        liked = bool(data['liked'])
+        set_like(post.id, current_user.id, liked)
+    else:
+        liked = toggle_like(post.id, current_user.id)
+    db.session.commit()
+    
+    count = like_count(post.id)
+    publish_family_event(post.family_id, 'post_liked', post_id=post.id, like_count=count)
+    return jsonify({'success': True, 'liked': liked, 'like_count': count})
+
 
-return render_template('photos.html', albums=albums)
+@app.route('/api/posts/<int:post_id>/comments', methods=['GET', 'POST'])
+@require_login
+def post_comments(post_id):
+    """List a post's comments oldest first, or add one"""
+    post = _family_post_or_404(post_id)
+    
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or request.form
+        content = (data.get('content') or '').strip()
+        if not content:
+            return jsonify({'success': False, 'error': 'Comment cannot be empty'}), 400
+        comment = add_comment(post.id, current_user.id, content)
+        db.session.commit()
+        publish_family_event(post.family_id, 'post_commented', post_id=post.id, comment_id=comment.id)
+        return jsonify({'success': True, 'comment': to_json_dict(comment)}), 201
+    
+    try:
+        comments, next_cursor = comment_page(
+            post.id,
+            cursor=request.args.get('cursor'),
+            limit=request.args.get('limit', COMMENT_PAGE_SIZE, type=int)
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    return jsonify({
+        'success': True,
+        'comments': [to_json_dict(comment) for comment in comments],
+        'next_cursor': next_cursor
+    })
+
+
+@app.route('/sync')
+@require_login
+def sync():
+    """Delta sync: rows created, updated or deleted since the client's version"""
+    if not current_user.family_id:
+        return jsonify({'success': False, 'error': 'No family'}), 400
+    
+    try:
+        result = changes_since(
+            current_user.family_id,
+            current_user.id,
+            since=request.args.get('since', 0, type=int),
+            limit=request.args.get('limit', SYNC_BATCH_SIZE, type=int),
+            cursor=request.args.get('cursor')
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({'success': True, **result})
+
+
+@app.route('/api/wallet/ledger')
+@require_login
+def wallet_ledger():
+    """Current token balance and the most recent ledger entries"""
+    limit = min(request.args.get('limit', 20, type=int), 100)
+    entries = LedgerEntry.query.filter_by(user_id=current_user.id).order_by(
+        LedgerEntry.id.desc()).limit(limit).all()
+    return jsonify({
+        'balance': float(get_balance(current_user.id)),
+        'entries': [
+            {'id': e.id, 'amount': float(e.amount), 'reason': e.reason, 'created_at': e.created_at.isoformat()}
+            for e in entries
+        ],
+    })
+
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics: request latency and queries by route, outbox and event stream figures"""
+    # Closed unless METRICS_TOKEN is configured and presented
+    token = os.environ.get('METRICS_TOKEN')
+    if not token or request.headers.get('Authorization') != f'Bearer {token}':
+        abort(401)
+    
+    outbox = get_outbox_metrics()
+    stream = stream_metrics()
+    series = {
+        'email_outbox_depth': ('Outbox messages by status', outbox['depth'], 'status'),
+        'email_outbox_sent_total': ('Emails delivered', outbox['sent'], None),
+        'email_outbox_retried_total': ('Delivery retries', outbox['retried'], None),
+        'email_outbox_dead_total': ('Emails given up on', outbox['dead'], None),
+        'email_outbox_throughput_per_second': ('Recent delivery rate', outbox['throughput_per_sec'], None),
+        'event_stream_connections': ('Open event stream connections', stream['connections'], None),
+        'event_stream_published_total': ('Events published since start', stream['published'], None),
+        'event_stream_dropped_total': ('Events dropped for slow consumers', stream['dropped'], None),
+    }
+    for quantile in ('p50', 'p95', 'p99'):
+        if outbox[f'latency_{quantile}'] is not None:
+            series[f'email_outbox_latency_{quantile}_seconds'] = (
+                f'Enqueue-to-send latency {quantile}', outbox[f'latency_{quantile}'], None)
+    
+    return Response(render_metrics(series), mimetype='text/plain; version=0.0.4')
 
 
 @app.route('/messages')
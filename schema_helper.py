@@ -0,0 +1,86 @@
+# Schema additions owned by helper modules
+# Helpers declare their indexes here so they are created alongside the tables
+# even when the underlying table already exists.
+
+import base64
+import json
+import logging
+from datetime import date, datetime
+from sqlalchemy import Index
+
+from app import app, db
+
+logger = logging.getLogger(__name__)
+
+_indexes = []
+_hooks = []
+
+
+def register_index(name, *columns, unique=False):
+    """Declare an index on existing model columns and remember it for ensure_schema()"""
+    index = Index(name, *columns, unique=unique)
+    _indexes.append(index)
+    return index
+
+
+def register_schema_hook(func):
+    """Run func() from ensure_schema(), for DDL that create_all() cannot express"""
+    _hooks.append(func)
+    return func
+
+
+def column_values(obj):
+    """Column attribute values of an ORM row as a plain dict"""
+    return {column.key: getattr(obj, column.key) for column in obj.__mapper__.column_attrs}
+
+
+def to_json_dict(obj):
+    """column_values() with dates rendered as ISO strings, for JSON APIs"""
+    return {
+        key: value.isoformat() if hasattr(value, 'isoformat') else value
+        for key, value in column_values(obj).items()
+    }
+
+
+def encode_cursor(*values):
+    """Opaque keyset cursor for a sort key; dates are stored as ISO strings"""
+    raw = json.dumps([value.isoformat() if isinstance(value, (date, datetime)) else value for value in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor, *types):
+    """
+    Sort key from encode_cursor(), each part converted by the matching type
+
+    Usage:
+        created_at, row_id = decode_cursor(cursor, datetime, int)
+
+    Raises:
+        ValueError: The cursor is malformed or has the wrong number of parts
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if len(values) != len(types):
+            raise ValueError
+        return tuple(
+            kind.fromisoformat(value) if kind in (date, datetime) else kind(value)
+            for kind, value in zip(types, values)
+        )
+    except Exception:
+        raise ValueError('invalid cursor')
+
+
+def ensure_schema():
+    """Create missing helper tables and indexes (safe to call on every boot)"""
+    with app.app_context():
+        db.create_all()
+        for index in _indexes:
+            try:
+                index.create(bind=db.engine, checkfirst=True)
+            except Exception as e:
+                logger.error(f"Could not create index {index.name}: {e}")
+        for hook in _hooks:
+            try:
+                hook()
+            except Exception as e:
+                logger.error(f"Schema hook {hook.__name__} failed: {e}")
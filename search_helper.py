@@ -0,0 +1,367 @@
+# Family-scoped full-text search
+# Remembrance members, memories/tributes, posts and messages are indexed into
+# SQLite FTS5 or a Postgres tsvector table (chosen from the database dialect).
+# Create/update routes index documents incrementally in their own
+# transaction; 'flask search-reindex' rebuilds everything in bulk. On SQLite a
+# small mapping table assigns each (doc_type, doc_id) a fixed FTS rowid, so
+# replacing or removing a document is a rowid lookup rather than a scan of the
+# UNINDEXED columns, and every document carries its family as an indexed
+# token, so the family filter is part of the MATCH instead of being applied
+# to every family's hits. Pages are keyset-paginated on (rank, row). Results
+# are HTML-escaped before match markers are added.
+
+import re
+import html
+import logging
+
+import click
+from sqlalchemy import text
+
+from app import app, db
+from schema_helper import register_schema_hook, encode_cursor, decode_cursor
+from models import RemembranceMember, Memory, Post, Message, User
+
+logger = logging.getLogger(__name__)
+
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+REINDEX_BATCH_SIZE = 1000
+
+# Free-text fields of a remembrance member, in display order
+MEMBER_TEXT_FIELDS = (
+    'role', 'life_story', 'favorite_quote', 'legacy', 'relationship_to_submitter',
+    'favorite_memories', 'legacy_in_effect', 'place_of_birth', 'place_of_passing',
+    'occupation', 'achievements', 'hobbies_interests', 'personality_traits',
+    'special_traditions', 'maiden_name', 'parents_names', 'siblings_names', 'children_names',
+)
+
+# scope holds the family token (see _family_token); only it is matched
+# against the family, and user terms only against title and body
+SQLITE_FTS_COLUMNS = """(
+        title, body, scope,
+        family_id UNINDEXED, doc_type UNINDEXED, doc_id UNINDEXED, audience UNINDEXED,
+        tokenize = 'porter unicode61 remove_diacritics 2'
+    )"""
+
+SQLITE_SCHEMA = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5{SQLITE_FTS_COLUMNS}",
+    """
+    CREATE TABLE IF NOT EXISTS search_fts_docs (
+        rowid INTEGER PRIMARY KEY,
+        doc_type VARCHAR(20) NOT NULL,
+        doc_id VARCHAR(64) NOT NULL,
+        family_id INTEGER NOT NULL,
+        UNIQUE (doc_type, doc_id)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_search_fts_docs_family ON search_fts_docs (family_id)",
+)
+
+# Indexes built before the mapping table existed keep their rowids
+SQLITE_BACKFILL_DOCS = (
+    "INSERT OR IGNORE INTO search_fts_docs (rowid, doc_type, doc_id, family_id) "
+    "SELECT rowid, doc_type, doc_id, family_id FROM search_fts "
+    "WHERE NOT EXISTS (SELECT 1 FROM search_fts_docs)"
+)
+
+# Indexes built before the scope column existed are copied into a new table
+SQLITE_ADD_SCOPE = (
+    f"CREATE VIRTUAL TABLE search_fts_scoped USING fts5{SQLITE_FTS_COLUMNS}",
+    "INSERT INTO search_fts_scoped (rowid, title, body, scope, family_id, doc_type, doc_id, audience) "
+    "SELECT rowid, title, body, 'fam' || family_id, family_id, doc_type, doc_id, audience FROM search_fts",
+    "DROP TABLE search_fts",
+    "ALTER TABLE search_fts_scoped RENAME TO search_fts",
+)
+
+# Title hits count four times as much as body hits; the scope column is
+# matched by every result, so it must not affect the ranking
+SQLITE_RANK = "bm25(search_fts, 4.0, 1.0, 0.0)"
+
+# Rowid of one document, as a scalar subquery FTS5 can use for a rowid lookup
+SQLITE_DOC_ROWID = "(SELECT rowid FROM search_fts_docs WHERE doc_type = :doc_type AND doc_id = :doc_id)"
+
+# Control characters never appear in indexed text (they are stripped), so they
+# can mark matches in the raw text and be swapped for <mark> after escaping
+MATCH_START = '\x02'
+MATCH_END = '\x03'
+_MARKERS = {ord(MATCH_START): None, ord(MATCH_END): None}
+
+POSTGRES_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS search_documents (
+        doc_type VARCHAR(20) NOT NULL,
+        doc_id VARCHAR(64) NOT NULL,
+        family_id INTEGER NOT NULL,
+        audience TEXT NOT NULL DEFAULT '',
+        title TEXT,
+        body TEXT,
+        tsv tsvector GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(body, '')), 'B')
+        ) STORED,
+        PRIMARY KEY (doc_type, doc_id)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_search_documents_tsv ON search_documents USING GIN (tsv)",
+    "CREATE INDEX IF NOT EXISTS ix_search_documents_family ON search_documents (family_id)",
+)
+
+
+def _is_sqlite():
+    return db.engine.dialect.name == 'sqlite'
+
+
+@register_schema_hook
+def ensure_search_schema():
+    """Create the search index table for the active database"""
+    with db.engine.begin() as conn:
+        if _is_sqlite():
+            columns = {row[0] for row in conn.execute(text("SELECT name FROM pragma_table_info('search_fts')"))}
+            if columns and 'scope' not in columns:
+                for statement in SQLITE_ADD_SCOPE:
+                    conn.execute(text(statement))
+            for statement in SQLITE_SCHEMA:
+                conn.execute(text(statement))
+            conn.execute(text(SQLITE_BACKFILL_DOCS))
+        else:
+            for statement in POSTGRES_SCHEMA:
+                conn.execute(text(statement))
+
+
+def _family_token(family_id):
+    """Indexed token that scopes a document to its family in FTS5 queries"""
+    return f'fam{int(family_id)}'
+
+
+def _audience(user_ids=None):
+    """'' for family-wide documents, ',a,b,' for documents only some members may see"""
+    return f",{','.join(str(u) for u in user_ids)}," if user_ids else ''
+
+
+def member_document(member):
+    body = '\n'.join(getattr(member, field) or '' for field in MEMBER_TEXT_FIELDS)
+    return ('member', member.id, member.family_id, member.name, body, '')
+
+
+def memory_document(memory, family_id):
+    return ('memory', memory.id, family_id, memory.title or '', memory.content or '', '')
+
+
+def post_document(post):
+    return ('post', post.id, post.family_id, getattr(post, 'title', None) or '', post.content or '', '')
+
+
+def message_document(message, family_id):
+    # Messages are private to their two participants
+    return ('message', message.id, family_id, '', message.content or '',
+            _audience([message.sender_id, message.receiver_id]))
+
+
+def index_documents(documents):
+    """
+    Insert or replace documents in the index (part of the caller's transaction)
+
+    Args:
+        documents: Iterable of (doc_type, doc_id, family_id, title, body, audience)
+    """
+    rows = [
+        {'doc_type': d[0], 'doc_id': str(d[1]), 'family_id': d[2], 'audience': d[5],
+         'title': (d[3] or '').translate(_MARKERS), 'body': (d[4] or '').translate(_MARKERS)}
+        for d in documents
+    ]
+    if not rows:
+        return
+    if _is_sqlite():
+        db.session.execute(text(
+            "INSERT INTO search_fts_docs (doc_type, doc_id, family_id) VALUES (:doc_type, :doc_id, :family_id) "
+            "ON CONFLICT (doc_type, doc_id) DO UPDATE SET family_id = excluded.family_id"
+        ), rows)
+        db.session.execute(text(f"DELETE FROM search_fts WHERE rowid = {SQLITE_DOC_ROWID}"), rows)
+        db.session.execute(text(
+            "INSERT INTO search_fts (rowid, title, body, scope, family_id, doc_type, doc_id, audience) "
+            f"VALUES ({SQLITE_DOC_ROWID}, :title, :body, :scope, :family_id, :doc_type, :doc_id, :audience)"
+        ), [dict(row, scope=_family_token(row['family_id'])) for row in rows])
+    else:
+        db.session.execute(text(
+            "INSERT INTO search_documents (doc_type, doc_id, family_id, audience, title, body) "
+            "VALUES (:doc_type, :doc_id, :family_id, :audience, :title, :body) "
+            "ON CONFLICT (doc_type, doc_id) DO UPDATE SET "
+            "family_id = EXCLUDED.family_id, audience = EXCLUDED.audience, "
+            "title = EXCLUDED.title, body = EXCLUDED.body"
+        ), rows)
+
+
+def remove_document(doc_type, doc_id):
+    params = {'doc_type': doc_type, 'doc_id': str(doc_id)}
+    if _is_sqlite():
+        db.session.execute(text(f"DELETE FROM search_fts WHERE rowid = {SQLITE_DOC_ROWID}"), params)
+        db.session.execute(text("DELETE FROM search_fts_docs WHERE doc_type = :doc_type AND doc_id = :doc_id"), params)
+    else:
+        db.session.execute(text("DELETE FROM search_documents WHERE doc_type = :doc_type AND doc_id = :doc_id"), params)
+
+
+def _highlighted(value):
+    """Escape indexed text as HTML, then turn the match markers into <mark> tags"""
+    return html.escape(value or '').replace(MATCH_START, '<mark>').replace(MATCH_END, '</mark>')
+
+
+def _fts5_query(query):
+    """Turn user input into a safe FTS5 expression: all terms, last one as a prefix"""
+    terms = re.findall(r'\w+', query, flags=re.UNICODE)
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def search(family_id, user_id, query, cursor=None, per_page=SEARCH_PAGE_SIZE):
+    """
+    Ranked, highlighted search within a family
+
+    Titles and snippets are HTML-escaped with matches wrapped in <mark>, so
+    clients can insert them as HTML.
+
+    Args:
+        user_id: Searching user; private documents are only returned to their audience
+        cursor: next_cursor of the previous page
+
+    Returns:
+        dict: {'results': [{'type', 'id', 'title', 'snippet', 'rank'}], 'next_cursor', 'has_more'}
+
+    Raises:
+        ValueError: The cursor is malformed
+    """
+    per_page = max(1, min(per_page, SEARCH_MAX_PAGE_SIZE))
+    params = {
+        'family_id': family_id,
+        'audience': f'%,{user_id},%',
+        'limit': per_page + 1,
+        'start': MATCH_START,
+        'end': MATCH_END,
+    }
+
+    if _is_sqlite():
+        terms = _fts5_query(query)
+        if not terms:
+            return {'results': [], 'next_cursor': None, 'has_more': False}
+        params['query'] = f'scope : "{_family_token(family_id)}" AND {{title body}} : ({terms})'
+        after = ''
+        if cursor:
+            params['after_rank'], params['after_row'] = decode_cursor(cursor, float, int)
+            after = (f"AND ({SQLITE_RANK} > :after_rank "
+                     f"OR ({SQLITE_RANK} = :after_rank AND rowid > :after_row)) ")
+        sql = text(
+            "SELECT rowid AS row_key, doc_type, doc_id, highlight(search_fts, 0, :start, :end) AS title, "
+            f"snippet(search_fts, 1, :start, :end, '…', 16) AS snippet, {SQLITE_RANK} AS rank "
+            "FROM search_fts WHERE search_fts MATCH :query "
+            "AND (audience = '' OR audience LIKE :audience) "
+            f"{after}ORDER BY rank, rowid LIMIT :limit"
+        )
+    else:
+        params['query'] = query
+        params['title_options'] = f'StartSel={MATCH_START}, StopSel={MATCH_END}, HighlightAll=true'
+        params['body_options'] = f'StartSel={MATCH_START}, StopSel={MATCH_END}, MaxFragments=2'
+        after = ''
+        if cursor:
+            params['after_rank'], params['after_type'], params['after_id'] = decode_cursor(cursor, float, str, str)
+            after = ("AND (ts_rank_cd(tsv, q) < :after_rank OR (ts_rank_cd(tsv, q) = :after_rank "
+                     "AND (doc_type, doc_id) > (:after_type, :after_id))) ")
+        sql = text(
+            "SELECT doc_type, doc_id, "
+            "ts_headline('english', coalesce(title, ''), q, :title_options) AS title, "
+            "ts_headline('english', coalesce(body, ''), q, :body_options) AS snippet, "
+            "ts_rank_cd(tsv, q) AS rank "
+            "FROM (SELECT * FROM search_documents, websearch_to_tsquery('english', :query) AS q "
+            "      WHERE tsv @@ q AND family_id = :family_id AND (audience = '' OR audience LIKE :audience) "
+            f"      {after}ORDER BY ts_rank_cd(tsv, q) DESC, doc_type, doc_id LIMIT :limit) AS hits "
+            "ORDER BY rank DESC, doc_type, doc_id"
+        )
+
+    rows = db.session.execute(sql, params).fetchall()
+    page = rows[:per_page]
+    results = [
+        {'type': row.doc_type, 'id': row.doc_id, 'title': _highlighted(row.title),
+         'snippet': _highlighted(row.snippet), 'rank': float(row.rank)}
+        for row in page
+    ]
+    next_cursor = None
+    if len(rows) > per_page:
+        last = page[-1]
+        if _is_sqlite():
+            next_cursor = encode_cursor(float(last.rank), last.row_key)
+        else:
+            next_cursor = encode_cursor(float(last.rank), last.doc_type, last.doc_id)
+    return {'results': results, 'next_cursor': next_cursor, 'has_more': next_cursor is not None}
+
+
+def _batched(query, id_column, get_id):
+    """Yield lists of rows in primary-key order using keyset batches"""
+    last_id = None
+    while True:
+        page = query
+        if last_id is not None:
+            page = page.filter(id_column > last_id)
+        batch = page.order_by(id_column).limit(REINDEX_BATCH_SIZE).all()
+        if not batch:
+            return
+        yield batch
+        last_id = get_id(batch[-1])
+
+
+def reindex_all(family_id=None):
+    """
+    Rebuild the search index from the source tables in batches
+
+    Returns:
+        int: Number of documents indexed
+    """
+    ensure_search_schema()
+    if _is_sqlite():
+        if family_id is None:
+            db.session.execute(text("DELETE FROM search_fts"))
+            db.session.execute(text("DELETE FROM search_fts_docs"))
+        else:
+            params = {'family_id': family_id}
+            db.session.execute(text(
+                "DELETE FROM search_fts WHERE rowid IN (SELECT rowid FROM search_fts_docs WHERE family_id = :family_id)"
+            ), params)
+            db.session.execute(text("DELETE FROM search_fts_docs WHERE family_id = :family_id"), params)
+    elif family_id is None:
+        db.session.execute(text("DELETE FROM search_documents"))
+    else:
+        db.session.execute(text("DELETE FROM search_documents WHERE family_id = :family_id"), {'family_id': family_id})
+
+    members = RemembranceMember.query
+    memories = db.session.query(Memory, RemembranceMember.family_id).join(
+        RemembranceMember, Memory.remembrance_member_id == RemembranceMember.id)
+    posts = Post.query
+    messages = db.session.query(Message, User.family_id).join(User, Message.sender_id == User.id)
+    if family_id is not None:
+        members = members.filter(RemembranceMember.family_id == family_id)
+        memories = memories.filter(RemembranceMember.family_id == family_id)
+        posts = posts.filter(Post.family_id == family_id)
+        messages = messages.filter(User.family_id == family_id)
+
+    total = 0
+    sources = (
+        (members, RemembranceMember.id, lambda m: m.id, member_document),
+        (memories, Memory.id, lambda row: row[0].id, lambda row: memory_document(row[0], row[1])),
+        (posts, Post.id, lambda p: p.id, post_document),
+        (messages, Message.id, lambda row: row[0].id, lambda row: message_document(row[0], row[1])),
+    )
+    for query, id_column, get_id, to_document in sources:
+        for batch in _batched(query, id_column, get_id):
+            index_documents(to_document(item) for item in batch)
+            db.session.commit()
+            total += len(batch)
+            logger.info(f"Indexed {total} documents")
+    return total
+
+
+@app.cli.command('search-reindex')
+@click.option('--family-id', type=int, default=None, help='Only rebuild one family')
+def search_reindex_command(family_id):
+    """Rebuild the full-text search index"""
+    total = reindex_all(family_id)
+    logger.info(f"Search index rebuilt with {total} documents")
@@ -0,0 +1,370 @@
+# Append-only token ledger
+# Every credit or debit is an immutable ledger entry. Balances are a periodic
+# per-wallet checkpoint plus the entries after it, bulk awards credit
+# thousands of wallets in one transaction with idempotency keys, and a
+# verifier re-derives every balance in a single streaming pass.
+# The ledger and UserWallet move together: each TokenTransaction written by
+# the data marketplace (award_tokens and friends) is mirrored into the ledger
+# in the same flush, and bulk awards credit UserWallet.token_balance and write
+# TokenTransaction history in the same transaction as their entries. Balances
+# that predate the ledger are carried over once with `flask ledger-backfill`.
+#
+# The mirror relies on these TokenTransaction columns (see
+# WALLET_TRANSACTION_COLUMNS): the wallet owner's user id, a signed amount
+# (negative for debits unless the type is listed in LEDGER_DEBIT_TYPES, whose
+# amounts are stored positive) and the transaction type, used as the reason.
+# They are checked at import; if one is missing the mirror is disabled with
+# an error instead of breaking every wallet write.
+
+import os
+import logging
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import event, func, text, bindparam, select
+
+from app import app, db
+from models import UserWallet, TokenTransaction
+from schema_helper import register_index
+
+logger = logging.getLogger(__name__)
+
+KEY_LOOKUP_CHUNK = 1000
+VERIFY_BATCH_SIZE = 5000
+OPENING_REASON = 'opening_balance'
+
+# TokenTransaction attribute for each value the ledger mirror needs
+WALLET_TRANSACTION_COLUMNS = {'user_id': 'user_id', 'amount': 'amount', 'reason': 'transaction_type'}
+# Transaction types whose amounts are stored as positive numbers but debit the wallet
+LEDGER_DEBIT_TYPES = frozenset(t for t in os.environ.get('LEDGER_DEBIT_TYPES', '').split(',') if t)
+
+
+class LedgerEntry(db.Model):
+    """One immutable token movement; amount is negative for debits"""
+    __tablename__ = 'token_ledger_entries'
+
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    user_id = db.Column(db.String, nullable=False)
+    amount = db.Column(db.Numeric(18, 4), nullable=False)
+    reason = db.Column(db.String(100), nullable=False)
+    idempotency_key = db.Column(db.String(128), unique=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+
+class BalanceCheckpoint(db.Model):
+    """A wallet's balance as of (and including) last_entry_id"""
+    __tablename__ = 'token_balance_checkpoints'
+
+    user_id = db.Column(db.String, primary_key=True)
+    balance = db.Column(db.Numeric(18, 4), nullable=False, default=0)
+    last_entry_id = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now, onupdate=datetime.now)
+
+
+register_index('ix_token_ledger_user_id', LedgerEntry.user_id, LedgerEntry.id)
+
+
+class LedgerError(Exception):
+    """Raised for operations the ledger does not allow"""
+
+
+@event.listens_for(LedgerEntry, 'before_update')
+@event.listens_for(LedgerEntry, 'before_delete')
+def _reject_mutation(mapper, connection, target):
+    raise LedgerError('Ledger entries are append-only; record a correcting entry instead')
+
+
+def _mirror_wallet_transaction(mapper, connection, transaction):
+    """Record a wallet transaction in the ledger as part of the same flush"""
+    columns = WALLET_TRANSACTION_COLUMNS
+    amount = Decimal(str(getattr(transaction, columns['amount'])))
+    kind = getattr(transaction, columns['reason']) or 'wallet'
+    if kind in LEDGER_DEBIT_TYPES:
+        amount = -abs(amount)
+    connection.execute(LedgerEntry.__table__.insert().values(
+        user_id=getattr(transaction, columns['user_id']),
+        amount=amount,
+        reason=kind[:100],
+        created_at=datetime.now()
+    ))
+
+
+_missing_columns = [name for name in WALLET_TRANSACTION_COLUMNS.values() if name not in TokenTransaction.__table__.c]
+if _missing_columns:
+    logger.error(f"TokenTransaction has no {', '.join(_missing_columns)} column; wallet transactions are not mirrored into the ledger")
+else:
+    event.listen(TokenTransaction, 'after_insert', _mirror_wallet_transaction)
+
+
+def record_entry(user_id, amount, reason, idempotency_key=None):
+    """
+    Append one entry (caller commits)
+
+    Only for movements that do not go through a wallet transaction; anything
+    written via award_tokens is already mirrored.
+
+    Returns:
+        LedgerEntry: The new entry, or the existing one for a repeated key
+    """
+    if idempotency_key:
+        existing = LedgerEntry.query.filter_by(idempotency_key=idempotency_key).first()
+        if existing:
+            return existing
+    entry = LedgerEntry(user_id=user_id, amount=Decimal(str(amount)), reason=reason, idempotency_key=idempotency_key)
+    db.session.add(entry)
+    return entry
+
+
+def _existing_keys(keys):
+    found = set()
+    keys = list(keys)
+    for i in range(0, len(keys), KEY_LOOKUP_CHUNK):
+        chunk = keys[i:i + KEY_LOOKUP_CHUNK]
+        found.update(row[0] for row in db.session.query(LedgerEntry.idempotency_key).filter(
+            LedgerEntry.idempotency_key.in_(chunk)))
+    return found
+
+
+def _wallet_owners(user_ids):
+    found = set()
+    user_ids = list(user_ids)
+    for i in range(0, len(user_ids), KEY_LOOKUP_CHUNK):
+        chunk = user_ids[i:i + KEY_LOOKUP_CHUNK]
+        found.update(row[0] for row in db.session.query(UserWallet.user_id).filter(UserWallet.user_id.in_(chunk)))
+    return found
+
+
+def bulk_award(awards, reason='award'):
+    """
+    Credit many wallets in a single transaction
+
+    Ledger entries, the UserWallet balance increments and the matching
+    TokenTransaction history rows commit together, so the wallet and the
+    ledger never disagree.
+
+    Args:
+        awards: Iterable of dicts with user_id, amount, idempotency_key and
+            optionally reason. Keys already in the ledger (or repeated in the
+            batch) are skipped, so a retried batch never double-credits.
+
+    Returns:
+        tuple: (entries written, entries skipped)
+
+    Raises:
+        LedgerError: Some user in the batch has no wallet
+    """
+    rows = []
+    seen = set()
+    skipped = 0
+    for award in awards:
+        key = award.get('idempotency_key')
+        if key in seen:
+            skipped += 1
+            continue
+        if key:
+            seen.add(key)
+        rows.append({
+            'user_id': award['user_id'],
+            'amount': Decimal(str(award['amount'])),
+            'reason': award.get('reason', reason),
+            'idempotency_key': key,
+            'created_at': datetime.now(),
+        })
+
+    already = _existing_keys(seen) if seen else set()
+    if already:
+        skipped += len(already)
+        rows = [r for r in rows if r['idempotency_key'] not in already]
+
+    totals = {}
+    for row in rows:
+        totals[row['user_id']] = totals.get(row['user_id'], Decimal(0)) + row['amount']
+    missing = set(totals) - _wallet_owners(totals)
+    if missing:
+        raise LedgerError(f"{len(missing)} user(s) have no wallet, e.g. {sorted(missing)[0]}")
+
+    wallets = UserWallet.__table__
+    credit = wallets.update().where(wallets.c.user_id == bindparam('wallet_user_id')).values(
+        token_balance=wallets.c.token_balance + bindparam('credit'))
+    try:
+        if rows:
+            db.session.bulk_insert_mappings(LedgerEntry, rows)
+            db.session.execute(credit, [
+                {'wallet_user_id': user_id, 'credit': amount} for user_id, amount in totals.items()
+            ])
+            # Wallet history as award_tokens writes it; a Core insert, so the
+            # mirror listener does not add a second ledger entry
+            if not _missing_columns:
+                columns = WALLET_TRANSACTION_COLUMNS
+                history = TokenTransaction.__table__
+                db.session.execute(history.insert(), [
+                    {columns['user_id']: r['user_id'], columns['amount']: r['amount'], columns['reason']: r['reason'],
+                     **({'created_at': r['created_at']} if 'created_at' in history.c else {})}
+                    for r in rows
+                ])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return len(rows), skipped
+
+
+def backfill_opening_balances():
+    """
+    Write one opening entry per wallet so the ledger sums to UserWallet.token_balance
+
+    The opening amount is the wallet balance minus whatever the ledger already
+    holds for it, both read in one statement, so wallet writes mirrored since
+    the ledger was deployed are not counted twice. Keys are opening:<user_id>,
+    so rerunning only adds wallets created since.
+
+    Returns:
+        tuple: (entries written, wallets skipped)
+    """
+    ledger = LedgerEntry.__table__
+    recorded = select(ledger.c.user_id, func.sum(ledger.c.amount).label('total')).group_by(ledger.c.user_id).subquery()
+    wallets = db.session.query(UserWallet.user_id, UserWallet.token_balance, recorded.c.total).outerjoin(
+        recorded, recorded.c.user_id == UserWallet.user_id
+    ).all()
+
+    already = _existing_keys(f'opening:{user_id}' for user_id, _, _ in wallets)
+    now = datetime.now()
+    rows = [
+        {'user_id': user_id, 'amount': Decimal(str(balance or 0)) - Decimal(str(total or 0)),
+         'reason': OPENING_REASON, 'idempotency_key': f'opening:{user_id}', 'created_at': now}
+        for user_id, balance, total in wallets if f'opening:{user_id}' not in already
+    ]
+    try:
+        for i in range(0, len(rows), VERIFY_BATCH_SIZE):
+            db.session.bulk_insert_mappings(LedgerEntry, rows[i:i + VERIFY_BATCH_SIZE])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return len(rows), len(wallets) - len(rows)
+
+
+def get_balance(user_id):
+    """Checkpoint balance plus the entries recorded after it"""
+    checkpoint = BalanceCheckpoint.query.get(user_id)
+    base = checkpoint.balance if checkpoint else Decimal(0)
+    after = checkpoint.last_entry_id if checkpoint else 0
+    tail = db.session.query(func.coalesce(func.sum(LedgerEntry.amount), 0)).filter(
+        LedgerEntry.user_id == user_id, LedgerEntry.id > after).scalar()
+    return Decimal(base) + Decimal(tail)
+
+
+def _settled_high_water():
+    """
+    Highest entry id below which every entry is committed
+
+    Ids are allocated at insert time but become visible at commit, so a
+    plain max(id) can pass over an entry whose transaction commits later, and
+    that entry would never be folded. On Postgres a SHARE lock waits for
+    every in-flight insert to finish (and is released right after); SQLite
+    has a single writer, so its visible ids never have gaps that fill later.
+    """
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(text(f'LOCK TABLE {LedgerEntry.__tablename__} IN SHARE MODE'))
+    high_water = db.session.query(func.max(LedgerEntry.id)).scalar()
+    db.session.commit()
+    return high_water
+
+
+def checkpoint_balances():
+    """
+    Fold every wallet's new entries into its checkpoint
+
+    Returns:
+        int: Number of checkpoints written
+    """
+    high_water = _settled_high_water()
+    if high_water is None:
+        return 0
+
+    tails = db.session.query(
+        LedgerEntry.user_id, func.sum(LedgerEntry.amount), func.max(LedgerEntry.id)
+    ).outerjoin(
+        BalanceCheckpoint, BalanceCheckpoint.user_id == LedgerEntry.user_id
+    ).filter(
+        LedgerEntry.id > func.coalesce(BalanceCheckpoint.last_entry_id, 0),
+        LedgerEntry.id <= high_water
+    ).group_by(LedgerEntry.user_id).all()
+
+    checkpoints = {
+        c.user_id: c for c in BalanceCheckpoint.query.filter(
+            BalanceCheckpoint.user_id.in_([user_id for user_id, _, _ in tails]))
+    } if tails else {}
+    for user_id, amount, last_id in tails:
+        checkpoint = checkpoints.get(user_id)
+        if checkpoint is None:
+            db.session.add(BalanceCheckpoint(user_id=user_id, balance=amount, last_entry_id=last_id))
+        else:
+            checkpoint.balance = Decimal(checkpoint.balance) + Decimal(amount)
+            checkpoint.last_entry_id = last_id
+    db.session.commit()
+    return len(tails)
+
+
+def verify_ledger():
+    """
+    Re-derive every balance from the ledger in one ordered, streaming pass
+
+    Checkpoints are compared against the running sum at their last_entry_id.
+
+    Returns:
+        list: {'user_id', 'checkpoint', 'derived'} for each mismatch
+    """
+    checkpoints = {c.user_id: (Decimal(c.balance), c.last_entry_id) for c in BalanceCheckpoint.query}
+    mismatches = []
+
+    def check(user_id, derived_at_checkpoint):
+        expected = checkpoints.pop(user_id, None)
+        if expected and expected[0] != derived_at_checkpoint:
+            mismatches.append({'user_id': user_id, 'checkpoint': expected[0], 'derived': derived_at_checkpoint})
+
+    entries = db.session.query(LedgerEntry.user_id, LedgerEntry.id, LedgerEntry.amount).order_by(
+        LedgerEntry.user_id, LedgerEntry.id
+    ).execution_options(stream_results=True).yield_per(VERIFY_BATCH_SIZE)
+
+    current_user_id = None
+    running = at_checkpoint = Decimal(0)
+    for user_id, entry_id, amount in entries:
+        if user_id != current_user_id:
+            if current_user_id is not None:
+                check(current_user_id, at_checkpoint)
+            current_user_id = user_id
+            running = at_checkpoint = Decimal(0)
+        running += Decimal(amount)
+        if entry_id <= checkpoints.get(user_id, (None, 0))[1]:
+            at_checkpoint = running
+    if current_user_id is not None:
+        check(current_user_id, at_checkpoint)
+
+    # Checkpoints for wallets with no entries at all must be zero
+    for user_id, (balance, _) in checkpoints.items():
+        if balance != 0:
+            mismatches.append({'user_id': user_id, 'checkpoint': balance, 'derived': Decimal(0)})
+    return mismatches
+
+
+@app.cli.command('ledger-backfill')
+def ledger_backfill_command():
+    """Carry existing wallet balances into the ledger as opening entries (run once after deploying it)"""
+    written, skipped = backfill_opening_balances()
+    logger.info(f"Wrote {written} opening entries; {skipped} wallets already had one")
+
+
+@app.cli.command('ledger-checkpoint')
+def ledger_checkpoint_command():
+    """Fold new ledger entries into per-wallet balance checkpoints"""
+    logger.info(f"Updated {checkpoint_balances()} balance checkpoints")
+
+
+@app.cli.command('ledger-verify')
+def ledger_verify_command():
+    """Re-derive all balances from the ledger and report mismatches"""
+    mismatches = verify_ledger()
+    for mismatch in mismatches:
+        logger.error(f"Balance mismatch: {mismatch}")
+    logger.info(f"Ledger verification finished with {len(mismatches)} mismatch(es)")
@@ -0,0 +1,222 @@
+# Unread message counters
+# Per-user and per-conversation unread counts are kept in small counter tables
+# and adjusted in the same transaction as the message insert or read, so the
+# badge is a primary-key lookup. Mapper events on Message keep them current
+# for every ORM write; bulk updates go through mark_conversation_read(). A
+# counter row that does not exist yet is seeded from an indexed count of the
+# messages the first time it changes, so rows never need a backfill; until
+# then reads fall back to the same count. A reconciliation job repairs any
+# drift.
+
+import logging
+
+from sqlalchemy import case, event, func, inspect, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app import app, db
+from models import Message
+from schema_helper import register_index
+
+logger = logging.getLogger(__name__)
+
+register_index('ix_message_receiver_is_read', Message.receiver_id, Message.is_read)
+register_index('ix_message_receiver_sender_is_read', Message.receiver_id, Message.sender_id, Message.is_read)
+
+
+class UnreadCounter(db.Model):
+    """Total unread messages for a user"""
+    __tablename__ = 'unread_counters'
+
+    user_id = db.Column(db.String, primary_key=True)
+    unread = db.Column(db.Integer, nullable=False, default=0)
+
+
+class ConversationUnreadCounter(db.Model):
+    """Unread messages a user has from one sender"""
+    __tablename__ = 'conversation_unread_counters'
+
+    receiver_id = db.Column(db.String, primary_key=True)
+    sender_id = db.Column(db.String, primary_key=True)
+    unread = db.Column(db.Integer, nullable=False, default=0)
+
+
+def _insert(connection, table):
+    return (pg_insert if connection.dialect.name == 'postgresql' else sqlite_insert)(table)
+
+
+# Message column each counter key corresponds to
+COUNTER_MESSAGE_COLUMNS = {
+    UnreadCounter: {'user_id': 'receiver_id'},
+    ConversationUnreadCounter: {'receiver_id': 'receiver_id', 'sender_id': 'sender_id'},
+}
+
+
+def _unread_messages(model, keys):
+    """Scalar subquery counting the unread messages a counter row stands for"""
+    messages = Message.__table__
+    columns = COUNTER_MESSAGE_COLUMNS[model]
+    return select(func.count()).select_from(messages).where(
+        messages.c.is_read.is_(False),
+        *(messages.c[columns[key]] == value for key, value in keys.items())
+    ).scalar_subquery()
+
+
+def _adjust(connection, model, keys, delta):
+    """
+    Atomically add delta to a counter row (never below zero)
+
+    Runs after the message change has been written, so a missing row is
+    seeded from the count of unread messages, which already includes it. A
+    concurrent seed of the same row falls through to the increment.
+    """
+    table = model.__table__
+    clamped = case((table.c.unread + delta < 0, 0), else_=table.c.unread + delta)
+    updated = connection.execute(
+        table.update().where(*(table.c[key] == value for key, value in keys.items())).values(unread=clamped)
+    ).rowcount
+    if updated:
+        return
+    connection.execute(
+        _insert(connection, table).values(unread=_unread_messages(model, keys), **keys).on_conflict_do_update(
+            index_elements=list(keys), set_={'unread': clamped}
+        )
+    )
+
+
+def _adjust_both(connection, receiver_id, sender_id, delta):
+    if not delta or receiver_id is None:
+        return
+    _adjust(connection, UnreadCounter, {'user_id': receiver_id}, delta)
+    _adjust(connection, ConversationUnreadCounter, {'receiver_id': receiver_id, 'sender_id': sender_id}, delta)
+
+
+def _previous(state, attr):
+    """Value of attr before the pending change (the current value if unchanged)"""
+    history = state.attrs[attr].history
+    return history.deleted[0] if history.deleted else getattr(state.object, attr)
+
+
+@event.listens_for(Message, 'after_insert')
+def _count_new_message(mapper, connection, message):
+    if not message.is_read:
+        _adjust_both(connection, message.receiver_id, message.sender_id, 1)
+
+
+@event.listens_for(Message, 'after_update')
+def _count_changed_message(mapper, connection, message):
+    state = inspect(message)
+    if not any(state.attrs[attr].history.has_changes() for attr in ('is_read', 'receiver_id', 'sender_id')):
+        return
+    if not _previous(state, 'is_read'):
+        _adjust_both(connection, _previous(state, 'receiver_id'), _previous(state, 'sender_id'), -1)
+    if not message.is_read:
+        _adjust_both(connection, message.receiver_id, message.sender_id, 1)
+
+
+@event.listens_for(Message, 'after_delete')
+def _count_deleted_message(mapper, connection, message):
+    if not message.is_read:
+        _adjust_both(connection, message.receiver_id, message.sender_id, -1)
+
+
+def record_messages_read(receiver_id, sender_id, count):
+    """
+    Subtract messages that were just marked read by a bulk update; call before committing
+
+    Bulk Query.update() skips the mapper events, so its callers report the
+    change here. ORM updates of Message.is_read are counted automatically.
+    """
+    if count <= 0:
+        return
+    _adjust_both(db.session.connection(), receiver_id, sender_id, -count)
+
+
+def mark_conversation_read(receiver_id, sender_id):
+    """
+    Mark every unread message from sender to receiver as read, keeping counters in step
+
+    Returns:
+        int: Number of messages marked read (caller commits)
+    """
+    count = Message.query.filter_by(
+        receiver_id=receiver_id,
+        sender_id=sender_id,
+        is_read=False
+    ).update({'is_read': True}, synchronize_session=False)
+    record_messages_read(receiver_id, sender_id, count)
+    return count
+
+
+def get_unread_count(user_id):
+    """Unread badge for a user; an indexed count until the user's counter row exists"""
+    counter = UnreadCounter.query.get(user_id)
+    if counter is not None:
+        return counter.unread
+    return Message.query.filter_by(receiver_id=user_id, is_read=False).count()
+
+
+def get_conversation_unread(receiver_id):
+    """Unread counts per sender for a user's inbox; senders without a counter row are counted"""
+    rows = ConversationUnreadCounter.query.filter(ConversationUnreadCounter.receiver_id == receiver_id).all()
+    unread = {row.sender_id: row.unread for row in rows if row.unread > 0}
+    uncounted = db.session.query(Message.sender_id, func.count(Message.id)).filter(
+        Message.receiver_id == receiver_id,
+        Message.is_read.is_(False),
+        Message.sender_id.notin_([row.sender_id for row in rows])
+    ).group_by(Message.sender_id)
+    unread.update(uncounted)
+    return unread
+
+
+def reconcile_unread_counters():
+    """
+    Recompute every counter from the messages table in bulk and fix drift
+
+    Returns:
+        int: Number of counter rows repaired
+    """
+    actual = {
+        (receiver_id, sender_id): count
+        for receiver_id, sender_id, count in db.session.query(
+            Message.receiver_id, Message.sender_id, db.func.count(Message.id)
+        ).filter(Message.is_read.is_(False)).group_by(Message.receiver_id, Message.sender_id)
+    }
+    actual_totals = {}
+    for (receiver_id, _), count in actual.items():
+        actual_totals[receiver_id] = actual_totals.get(receiver_id, 0) + count
+
+    repaired = 0
+
+    stored = {(row.receiver_id, row.sender_id): row for row in ConversationUnreadCounter.query}
+    for key in set(actual) | set(stored):
+        expected = actual.get(key, 0)
+        row = stored.get(key)
+        if row is None:
+            db.session.add(ConversationUnreadCounter(receiver_id=key[0], sender_id=key[1], unread=expected))
+            repaired += 1
+        elif row.unread != expected:
+            row.unread = expected
+            repaired += 1
+
+    stored_totals = {row.user_id: row for row in UnreadCounter.query}
+    for user_id in set(actual_totals) | set(stored_totals):
+        expected = actual_totals.get(user_id, 0)
+        row = stored_totals.get(user_id)
+        if row is None:
+            db.session.add(UnreadCounter(user_id=user_id, unread=expected))
+            repaired += 1
+        elif row.unread != expected:
+            row.unread = expected
+            repaired += 1
+
+    db.session.commit()
+    if repaired:
+        logger.warning(f"Reconciled {repaired} unread counters")
+    return repaired
+
+
+@app.cli.command('reconcile-unread')
+def reconcile_unread_command():
+    """Repair drift in the unread message counters"""
+    logger.info(f"Repaired {reconcile_unread_counters()} unread counters")